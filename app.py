@@ -1,20 +1,16 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_cors import cross_origin
 from dotenv import load_dotenv
 import os
-from services.firebase_service import init_firebase
 
-# Initialize Firebase
-init_firebase()
+# Load environment variables before the services read their settings
+load_dotenv()
 
-from features.email_notification import ContractNotificationManager
-from features.send_email_to_users import process_all_users_contracts
+# Firebase, Gemini and the notification subsystem are created lazily, on
+# first use in each worker process
 from routes.auth_routes import auth_bp
 from routes.dashboard_routes import dashboard_bp
-
-
-# Load environment variables
-load_dotenv()
+from services.metrics import registry, METRICS_TOKEN
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY')
@@ -35,19 +31,43 @@ def home():
         return redirect(url_for('dashboard.dashboard'))
     return redirect(url_for('auth.login'))
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Stage latencies, failures, retries, tokens and bytes of this worker process, for Prometheus
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({"message": "Unauthorized.", "status": "error"}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/notifications123', methods=["GET"])
 @cross_origin()  # Allow cross-origin requests
 def notifications():
+    from features.notification_sweep import trigger
     try:
-        process_all_users_contracts()
-        obj = ContractNotificationManager()
-        obj.send_scheduled_notifications()
-        return jsonify({"message": "Notifications processed successfully", "status": "success"})
+        # ?full=1 re-sweeps every contract instead of only those changed since the last run
+        # ?digest=1 / ?digest=0 overrides NOTIFICATION_DIGEST for this run
+        digest = request.args.get('digest')
+        # The sweep runs in the background, sharded across every worker that is triggered
+        run_id = trigger(full=request.args.get('full') == '1', digest=None if digest is None else digest == '1')
+        return jsonify({
+            "message": "Notification sweep started",
+            "status": "success",
+            "run_id": run_id,
+            "status_url": url_for('notification_run', run_id=run_id),
+        }), 202
     except Exception as e:
         # Log the error as needed
         return jsonify({"message": f"Error processing notifications: {str(e)}", "status": "error"}), 500
 
 
+@app.route('/notifications123/runs/<run_id>', methods=["GET"])
+@cross_origin()
+def notification_run(run_id):
+    from features.notification_sweep import get_run
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"message": "Run not found.", "status": "error"}), 404
+    return jsonify(run)
+
 
 if __name__ == '__main__':
     app.run(debug=True)
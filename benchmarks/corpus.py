@@ -0,0 +1,153 @@
+"""
+Synthetic licensing contracts in TXT, DOCX and PDF form for the benchmarks.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+FORMATS = ("txt", "docx", "pdf")
+
+_COMPANIES = [
+    "Northwind Media LLC", "Contoso Studios Inc.", "Fabrikam Publishing Ltd.", "Tailspin Records Corp.",
+    "Adventure Works Games Inc.", "Litware Software LLC", "Proseware Pictures Inc.", "Wingtip Broadcasting Co.",
+    "Alpine Ski House Media Ltd.", "Blue Yonder Audio LLC", "Coho Vineyard Press Inc.", "Datum Learning Corp.",
+]
+_STATES = ["New York", "California", "Delaware", "Texas", "Washington", "Illinois"]
+_SCOPES = ["streaming", "broadcast", "print reproduction", "online distribution", "in-store display", "mobile apps"]
+_BOILERPLATE = [
+    "Each party shall keep the terms of this Agreement confidential and shall not disclose them to any "
+    "third party without the prior written consent of the other party, except as required by law.",
+    "Licensee shall not sublicense, sell, lease or otherwise transfer the Licensed Content except as "
+    "expressly permitted by this Agreement.",
+    "Licensor represents and warrants that it owns or controls all rights in the Licensed Content "
+    "necessary to grant the licenses set out in this Agreement.",
+    "Each party shall indemnify the other against third party claims arising out of its breach of "
+    "this Agreement, subject to the limitations of liability set out below.",
+    "In no event shall either party be liable for indirect, incidental or consequential damages, and "
+    "each party's aggregate liability shall not exceed the fees paid under this Agreement.",
+    "Either party may terminate this Agreement upon written notice if the other party materially "
+    "breaches this Agreement and fails to cure such breach within thirty (30) days.",
+    "Notices under this Agreement shall be in writing and delivered by hand, courier or email to the "
+    "addresses set out above.",
+]
+
+
+def contract_text(index, seed=0, clauses=12):
+    """Return the text of a templated license agreement; the same index and seed give the same text."""
+    rng = random.Random(seed * 1_000_003 + index)
+    licensor, licensee = rng.sample(_COMPANIES, 2)
+    effective = date(2023, 1, 1) + timedelta(days=rng.randrange(1000))
+    years = rng.choice([1, 2, 3, 5])
+    fee = rng.randrange(5, 500) * 1000
+    state = rng.choice(_STATES)
+    scopes = rng.sample(_SCOPES, 2)
+
+    paragraphs = [
+        "CONTENT LICENSE AGREEMENT",
+        f"This Content License Agreement is entered into as of {effective.strftime('%B %d, %Y')} "
+        f"(the \"Effective Date\") by and between {licensor}, a {state} company (\"Licensor\"), "
+        f"and {licensee}, a corporation (\"Licensee\").",
+        f"1. Grant of License. Licensor grants Licensee a non-exclusive, non-transferable license to use "
+        f"the Licensed Content for {scopes[0]} and {scopes[1]} in the United States.",
+        f"2. Term. This Agreement shall remain in effect for a term of {years} year{'s' if years > 1 else ''} "
+        f"from the Effective Date.",
+        f"3. License Fee. Licensee shall pay Licensor a license fee of ${fee:,} within thirty (30) days "
+        f"of the Effective Date, and royalties of {rng.randrange(2, 15)}% of net revenue.",
+    ]
+    for number in range(4, 4 + clauses):
+        body = " ".join(rng.sample(_BOILERPLATE, 2))
+        paragraphs.append(f"{number}. Clause {number}. {body}")
+    paragraphs.append(
+        f"{4 + clauses}. Governing Law. This Agreement shall be governed by the laws of the State of {state}."
+    )
+    return "\n\n".join(paragraphs)
+
+
+def write_txt(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def write_docx(path, text):
+    import docx
+    document = docx.Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def _pdf_escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _wrap(paragraph, width=90):
+    lines, current = [], ""
+    for word in paragraph.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def write_pdf(path, text, lines_per_page=48):
+    """Write text as a minimal multi-page PDF using the built-in Helvetica font."""
+    lines = []
+    for paragraph in text.split("\n\n"):
+        lines.extend(_wrap(paragraph) + [""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # 1: catalog, 2: page tree, 3: font, then a page and a content stream per page
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for number, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * number, 5 + 2 * number
+        page_ids.append(page_id)
+        stream = "BT /F1 10 Tf 14 TL 50 780 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page_lines) + " ET"
+        stream = stream.encode('latin-1', errors='replace')
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref = len(output)
+    size = max(objects) + 1
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for object_id in range(1, size):
+        output += b"%010d 00000 n \n" % offsets[object_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    with open(path, 'wb') as f:
+        f.write(output)
+
+
+_WRITERS = {"txt": write_txt, "docx": write_docx, "pdf": write_pdf}
+
+
+def generate_corpus(directory, count, formats=FORMATS, seed=0):
+    """
+    Write `count` contracts to directory, cycling through the formats.
+
+    Returns:
+        List of (filename, path) tuples
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for index in range(count):
+        extension = formats[index % len(formats)]
+        filename = f"contract_{index:06d}.{extension}"
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            _WRITERS[extension](path, contract_text(index, seed))
+        files.append((filename, path))
+    return files
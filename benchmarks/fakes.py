@@ -0,0 +1,529 @@
+"""
+In-process stand-ins for Firestore, Gemini and SMTP used by the benchmarks.
+
+They implement only the parts of each API this code base calls, with the
+same call shapes, so services can run unmodified against them.
+"""
+import json
+import time
+import copy
+import threading
+import socketserver
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from collections import defaultdict
+
+DOCUMENT_ID = '__name__'
+
+
+def _field_name(field):
+    """Accept a field path string or FieldPath (e.g. FieldPath.document_id())."""
+    return field.to_api_repr() if hasattr(field, 'to_api_repr') else field
+
+
+def _get_field(data, field):
+    for key in field.split('.'):
+        if not isinstance(data, dict) or key not in data:
+            raise KeyError(field)
+        data = data[key]
+    return data
+
+
+def _set_field(data, field, value):
+    keys = field.split('.')
+    for key in keys[:-1]:
+        data = data.setdefault(key, {})
+    data[keys[-1]] = value
+
+
+def _project(data, fields):
+    projected = {}
+    for field in fields:
+        try:
+            _set_field(projected, field, copy.deepcopy(_get_field(data, field)))
+        except KeyError:
+            continue
+    return projected
+
+
+def _resolve_transforms(existing, data):
+    """Apply SERVER_TIMESTAMP and Increment values the way Firestore does on write."""
+    from google.cloud.firestore import SERVER_TIMESTAMP
+    from google.cloud.firestore_v1.transforms import Increment
+
+    resolved = {}
+    for key, value in data.items():
+        current = existing.get(key) if isinstance(existing, dict) else None
+        if value is SERVER_TIMESTAMP:
+            resolved[key] = datetime.now(timezone.utc)
+        elif isinstance(value, Increment):
+            resolved[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            resolved[key] = _resolve_transforms(current or {}, value)
+        else:
+            resolved[key] = copy.deepcopy(value)
+    return resolved
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _expand_dotted(data):
+    """update() takes "a.b" keys; turn them into nested dicts."""
+    expanded = {}
+    for key, value in data.items():
+        _set_field(expanded, key, value)
+    return expanded
+
+
+class FakeAlreadyExists(Exception):
+    """Raised by create() when the document exists, like google.api_core's AlreadyExists."""
+
+
+def _already_exists(path):
+    try:
+        from google.api_core.exceptions import AlreadyExists
+        return AlreadyExists(f"Document already exists: {path}")
+    except ImportError:
+        return FakeAlreadyExists(path)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return copy.deepcopy(_get_field(self._data or {}, _field_name(field)))
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f'{self.path}/{name}')
+
+    def get(self, field_paths=None, **kwargs):
+        self._client.stats["reads"] += 1
+        data = self._client._read(self.path)
+        if data is not None and field_paths:
+            data = _project(data, field_paths)
+        return FakeSnapshot(self, copy.deepcopy(data))
+
+    def set(self, data, merge=False):
+        self._client._write(self.path, data, merge=merge)
+
+    def update(self, data):
+        if self._client._read(self.path) is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self._client._write(self.path, _expand_dotted(data), merge=True)
+
+    def create(self, data):
+        with self._client._lock:
+            if self._client._read(self.path) is not None:
+                raise _already_exists(self.path)
+            self._client._write(self.path, data)
+
+    def delete(self):
+        self._client._delete(self.path)
+
+
+class FakeQuery:
+    def __init__(self, client, collection_path=None, group_id=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._group_id = group_id
+        self._filters = []
+        self._orders = []
+        self._fields = None
+        self._start_after = None
+        self._limit = None
+
+    def _copy(self, **changes):
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        for key, value in changes.items():
+            setattr(query, key, value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        field = _field_name(field_path)
+        if field == DOCUMENT_ID and hasattr(value, 'path'):
+            # Collection queries compare document ids, groups compare paths
+            value = value.path if self._group_id else value.id
+        query = self._copy()
+        query._filters.append((field, op_string, value))
+        return query
+
+    def select(self, field_paths):
+        return self._copy(_fields=list(field_paths))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        query = self._copy()
+        query._orders.append((_field_name(field_path), direction))
+        return query
+
+    def start_after(self, values):
+        return self._copy(_start_after=values)
+
+    def limit(self, count):
+        return self._copy(_limit=count)
+
+    def count(self):
+        query = self
+        return SimpleNamespace(get=lambda *args, **kwargs: [[SimpleNamespace(value=len(query._matching()))]])
+
+    def _documents(self):
+        if self._collection_path is not None:
+            return self._client._collection_documents(self._collection_path)
+        return self._client._group_documents(self._group_id)
+
+    def _value(self, path, data, field):
+        if field == DOCUMENT_ID:
+            return path if self._group_id else path.rsplit('/', 1)[-1]
+        return _get_field(data, field)
+
+    def _sort_key(self, path, data):
+        return tuple(self._value(path, data, field) for field, _ in self._orders) + (path,)
+
+    def _matching(self):
+        matches = []
+        for path, data in self._documents():
+            try:
+                if not all(_compare(self._value(path, data, field), op, value) for field, op, value in self._filters):
+                    continue
+                # Documents missing an ordered field are excluded, as in Firestore
+                for field, _ in self._orders:
+                    self._value(path, data, field)
+            except KeyError:
+                continue
+            matches.append((path, data))
+
+        descending = bool(self._orders) and self._orders[0][1] == 'DESCENDING'
+        matches.sort(key=lambda item: self._sort_key(*item), reverse=descending)
+        if self._start_after is not None:
+            cursor = self._cursor_key()
+            matches = [
+                item for item in matches
+                if (self._sort_key(*item)[:len(cursor)] < cursor if descending else self._sort_key(*item)[:len(cursor)] > cursor)
+            ]
+        return matches
+
+    def _cursor_key(self):
+        cursor = self._start_after
+        if isinstance(cursor, FakeSnapshot):
+            return self._sort_key(cursor.reference.path, cursor._data)[:len(self._orders) or 1]
+        values = {_field_name(field): value for field, value in cursor.items()}
+        orders = [field for field, _ in self._orders] or [DOCUMENT_ID]
+        key = []
+        for field in orders:
+            value = values[field]
+            if field == DOCUMENT_ID and hasattr(value, 'path'):
+                # A DocumentReference cursor; collection queries order by id, groups by path
+                value = value.path if self._group_id else value.id
+            key.append(value)
+        return tuple(key)
+
+    def stream(self, **kwargs):
+        matches = self._matching()
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        for path, data in matches:
+            self._client.stats["reads"] += 1
+            if self._fields is not None:
+                data = _project(data, self._fields)
+            yield FakeSnapshot(FakeDocumentReference(self._client, path), copy.deepcopy(data))
+
+    def get(self, **kwargs):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, collection_path=path)
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        if '/' not in self.path:
+            return None
+        return FakeDocumentReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        document_id = document_id or self._client._new_id()
+        return FakeDocumentReference(self._client, f'{self.path}/{document_id}')
+
+    def add(self, data):
+        reference = self.document()
+        reference.set(data)
+        return datetime.now(timezone.utc), reference
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        with self._client._lock:
+            for write in self._writes:
+                write()
+        self._client.stats["batches"] += 1
+        self._writes = []
+
+
+class FakeFirestore:
+    """
+    Dictionary-backed Firestore client supporting collection, document,
+    collection_group, get_all and batch, with query where/select/order_by/
+    start_after/limit/count. Reads and writes are counted in stats.
+    """
+
+    def __init__(self):
+        # collection path -> {document id: data}
+        self._collections = defaultdict(dict)
+        self._lock = threading.RLock()
+        self._ids = 0
+        self.stats = {"reads": 0, "writes": 0, "batches": 0}
+
+    def _new_id(self):
+        with self._lock:
+            self._ids += 1
+            return f'doc{self._ids:012d}'
+
+    def _read(self, path):
+        collection, document_id = path.rsplit('/', 1)
+        return self._collections.get(collection, {}).get(document_id)
+
+    def _write(self, path, data, merge=False):
+        collection, document_id = path.rsplit('/', 1)
+        with self._lock:
+            documents = self._collections[collection]
+            existing = documents.get(document_id)
+            resolved = _resolve_transforms(existing or {}, data)
+            if merge and existing is not None:
+                _merge(existing, resolved)
+            else:
+                documents[document_id] = resolved
+            self.stats["writes"] += 1
+
+    def _delete(self, path):
+        collection, document_id = path.rsplit('/', 1)
+        with self._lock:
+            self._collections.get(collection, {}).pop(document_id, None)
+            self.stats["writes"] += 1
+
+    def _collection_documents(self, path):
+        return [(f'{path}/{document_id}', data) for document_id, data in list(self._collections.get(path, {}).items())]
+
+    def _group_documents(self, group_id):
+        documents = []
+        for path, collection in list(self._collections.items()):
+            if path.rsplit('/', 1)[-1] == group_id:
+                documents.extend((f'{path}/{document_id}', data) for document_id, data in list(collection.items()))
+        return documents
+
+    def collection(self, path):
+        return FakeCollectionReference(self, path)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def collection_group(self, collection_id):
+        return FakeQuery(self, group_id=collection_id)
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def document_count(self):
+        return sum(len(collection) for collection in self._collections.values())
+
+
+def _compare(actual, op, expected):
+    if op == '==':
+        return actual == expected
+    if op == '!=':
+        return actual != expected
+    if op == '>':
+        return actual > expected
+    if op == '>=':
+        return actual >= expected
+    if op == '<':
+        return actual < expected
+    if op == '<=':
+        return actual <= expected
+    if op == 'in':
+        return actual in expected
+    if op == 'array_contains':
+        return expected in (actual or [])
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+# Canned analysis returned by the stub model
+SAMPLE_ANALYSIS = {
+    "parties": {"licensor": "Northwind Media LLC", "licensee": "Contoso Studios Inc."},
+    "licensing_terms": {
+        "effective_date": "2025-01-15",
+        "term_duration": "2 years",
+        "scope_of_use": ["Streaming", "Broadcast"],
+        "license_characteristics": {
+            "exclusivity": "Non-exclusive",
+            "transferability": "Non-transferable",
+            "geographical_scope": "United States",
+            "user_access": "Unlimited",
+        },
+    },
+    "financial_terms": {"license_fee": "$25,000", "royalty_terms": "5% of net revenue"},
+    "usage_restrictions": {"prohibited_uses": ["Resale", "Sublicensing"]},
+    "intellectual_property": {"copyright_ownership": "Licensor", "attribution_requirements": "Credit the licensor"},
+    "legal_compliance": {
+        "third_party_rights": "N/A",
+        "indemnification": "Mutual",
+        "liability_limitations": "Capped at fees paid",
+    },
+    "contract_termination": {
+        "termination_grounds": ["Material breach", "Insolvency"],
+        "dispute_resolution": {"governing_law": "State of New York", "resolution_mechanism": "Arbitration"},
+    },
+}
+
+
+class StubGeminiModel:
+    """
+    Replaces genai.GenerativeModel: waits `latency` seconds, then returns
+    canned JSON holding the sections the prompt's schema asks for. With
+    `truncate` (a fraction), answers asking for every section are cut off
+    after that share of their characters, as when the output limit is hit.
+    """
+
+    def __init__(self, latency=0.0, response=None, truncate=None):
+        self.latency = latency
+        self.response = response or SAMPLE_ANALYSIS
+        self.truncate = truncate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        schema = prompt.split("SCHEMA FORMAT", 1)[-1].split("CONTRACT TEXT", 1)[0]
+        requested = {key: value for key, value in self.response.items() if f'"{key}"' in schema}
+        text = json.dumps(requested or self.response)
+        if self.truncate and len(requested) == len(self.response):
+            text = text[:int(len(text) * self.truncate)]
+        return SimpleNamespace(text="```json\n" + text + "\n```")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply("220 localhost SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.wfile.write(b'250-localhost\r\n250 SIZE 52428800\r\n')
+            elif command.startswith(('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self._reply("250 OK")
+            elif command == 'DATA':
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(data_line)
+                sink.record(size)
+                self._reply("250 OK queued")
+            elif command == 'QUIT':
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    Local SMTP server that accepts and counts every message without TLS or
+    authentication. Use as a context manager; `port` is chosen by the OS.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = _ThreadingSMTPServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
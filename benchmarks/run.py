@@ -0,0 +1,408 @@
+"""
+Offline benchmarks of the hot paths.
+
+Runs text extraction, Gemini analysis, the notification sweep, sending
+notifications and the dashboard against in-process stand-ins for Firestore,
+Gemini and SMTP (see benchmarks.fakes), on a synthetic corpus of contracts
+(see benchmarks.corpus). Nothing leaves the machine.
+
+Each run is saved as JSON so a later run can be compared against it:
+
+    python -m benchmarks.run --sizes 10,100,1000
+    python -m benchmarks.run --sizes 10,100,1000 --compare benchmarks/results/<earlier run>.json
+
+Usage:
+    python -m benchmarks.run [--sizes 10,100,1000] [--benchmarks extract,gemini,...]
+                             [--latency 0] [--workers 8] [--pages 10]
+                             [--corpus-dir DIR] [--output FILE]
+                             [--compare FILE] [--threshold 0.2]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import platform
+import subprocess
+import contextlib
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+DEFAULT_CORPUS_DIR = os.path.join(ROOT, 'benchmarks', '.corpus')
+DEFAULT_SIZES = [10, 100, 1000]
+BENCHMARK_USER = 'benchmark-user'
+# Contracts owned by each user in the sweep benchmark, and sent to each recipient
+CONTRACTS_PER_USER = 10
+# Clauses of the contracts in the repair benchmark, long enough for repair prompts to use an excerpt
+REPAIR_BENCHMARK_CLAUSES = 60
+
+# The services read these when they are imported
+_WORK_DIR = tempfile.mkdtemp(prefix='contract-benchmarks-')
+os.environ.setdefault('NOTIFICATION_DB_URL', f"sqlite:///{os.path.join(_WORK_DIR, 'notifications.db')}")
+os.environ.setdefault('NOTIFICATION_EMAIL', 'notifications@example.com')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from benchmarks import fakes
+from benchmarks.corpus import contract_text, generate_corpus
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silence the prints and the info and warning logs of the services while
+    they are measured; some benchmarks make them fail on purpose.
+    """
+    logging.disable(logging.WARNING)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def use_fake_firestore():
+    """Point the Firestore client of this process at a new FakeFirestore and clear the caches in front of it."""
+    from services import firebase_service, document_service
+    client = fakes.FakeFirestore()
+    firebase_service._client = client
+    firebase_service._client_pid = os.getpid()
+    with firebase_service.document_cache._lock:
+        firebase_service.document_cache._cache.clear()
+    with document_service._cache_lock:
+        document_service._cache.clear()
+    return client
+
+
+def use_notification_manager(name, sink=None):
+    """Install a notification manager with its own store, sending to the SMTP sink if one is given."""
+    from features import email_notification
+    from features.notification_store import NotificationStore
+    from features.smtp_transport import SMTPTransport
+
+    manager = email_notification.ContractNotificationManager()
+    manager.store = NotificationStore(f"sqlite:///{os.path.join(_WORK_DIR, name + '.db')}")
+    if sink is not None:
+        manager.transport = SMTPTransport(sink.host, sink.port, use_tls=False)
+    email_notification._manager = manager
+    email_notification._manager_pid = os.getpid()
+    return manager
+
+
+def _timed(function, items):
+    with quiet():
+        started = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - started
+    return {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "per_item_ms": round(seconds * 1000 / items, 4) if items else 0.0,
+        "per_second": round(items / seconds, 1) if seconds else 0.0,
+    }
+
+
+def bench_extract(size, options):
+    """extract_data over a mixed TXT/DOCX/PDF corpus."""
+    from services.extract_service import extract_data
+
+    files = generate_corpus(options.corpus_dir, size)
+    characters = 0
+
+    def run():
+        nonlocal characters
+        for filename, path in files:
+            with open(path, 'rb') as f:
+                characters += len(extract_data(f, filename))
+
+    result = _timed(run, size)
+    result["characters"] = characters
+    return result
+
+
+def bench_gemini(size, options):
+    """extract_license_details with a stub model answering after --latency seconds."""
+    from services.gemini_service import LicenseAgreementExtractor
+    from services.gemini_client import TokenBucket
+
+    extractor = LicenseAgreementExtractor('benchmark')
+    model = fakes.StubGeminiModel(latency=options.latency)
+    extractor.model.model = model
+    # The quota of the real API would dominate the measurement
+    extractor.model.rate_limiter = TokenBucket(1e9, 1e9)
+    texts = [contract_text(index) for index in range(size)]
+    results = []
+
+    def run():
+        with ThreadPoolExecutor(max_workers=options.workers) as executor:
+            results.extend(executor.map(extractor.extract_license_details, texts))
+
+    result = _timed(run, size)
+    result["model_calls"] = model.calls
+    result["failed"] = sum(1 for data in results if data is None)
+    return result
+
+
+def bench_repair(size, options):
+    """
+    extract_license_details when every full answer is cut off at 60%: the
+    tokens spent repairing the missing sections, against retrying the whole
+    analysis.
+    """
+    from services.gemini_service import LicenseAgreementExtractor
+    from services.gemini_client import TokenBucket
+    from services.metrics import GEMINI_TOKENS
+
+    texts = [contract_text(index, clauses=REPAIR_BENCHMARK_CLAUSES) for index in range(size)]
+
+    def analyze(model):
+        extractor = LicenseAgreementExtractor('benchmark')
+        extractor.model.model = model
+        extractor.model.rate_limiter = TokenBucket(1e9, 1e9)
+        before = {direction: GEMINI_TOKENS.value(direction=direction) for direction in ("prompt", "output")}
+        results = []
+
+        def run():
+            with ThreadPoolExecutor(max_workers=options.workers) as executor:
+                results.extend(executor.map(extractor.extract_license_details, texts))
+
+        timing = _timed(run, size)
+        tokens = {direction: GEMINI_TOKENS.value(direction=direction) - before[direction] for direction in before}
+        return timing, tokens, results
+
+    _, full_tokens, _ = analyze(fakes.StubGeminiModel(latency=options.latency))
+    model = fakes.StubGeminiModel(latency=options.latency, truncate=0.6)
+    result, tokens, results = analyze(model)
+    # The truncated first answers cost the same prompt as a full analysis
+    result["repair_prompt_tokens"] = tokens["prompt"] - full_tokens["prompt"]
+    result["repair_output_tokens"] = round(tokens["output"] - 0.6 * full_tokens["output"])
+    result["full_retry_prompt_tokens"] = full_tokens["prompt"]
+    result["full_retry_output_tokens"] = full_tokens["output"]
+    result["model_calls"] = model.calls
+    result["failed"] = sum(1 for data in results if data is None)
+    return result
+
+
+def _seed_contracts(client, size):
+    """Store `size` analyzed contracts, CONTRACTS_PER_USER per user, and their owners."""
+    updated_at = datetime.now(timezone.utc)
+    for index in range(size):
+        user_id = f'user{index // CONTRACTS_PER_USER:06d}'
+        if index % CONTRACTS_PER_USER == 0:
+            client.document(f'users/{user_id}').set({'email': f'{user_id}@example.com', 'name': user_id})
+        client.collection(f'users/{user_id}/documents').document(f'doc{index:06d}').set({
+            **fakes.SAMPLE_ANALYSIS,
+            "file_name": f"contract_{index:06d}.pdf",
+            "updated_at": updated_at,
+        })
+
+
+def bench_sweep(size, options):
+    """process_all_users_contracts: a full sweep, then an incremental one with nothing changed."""
+    from features.send_email_to_users import process_all_users_contracts
+
+    client = use_fake_firestore()
+    _seed_contracts(client, size)
+    manager = use_notification_manager(f'sweep-{size}')
+
+    client.stats["reads"] = 0
+    result = _timed(lambda: process_all_users_contracts(full=True), size)
+    result["reads"] = client.stats["reads"]
+    result["scheduled"] = len(manager.store.contract_ids())
+
+    client.stats["reads"] = 0
+    incremental = _timed(process_all_users_contracts, size)
+    result["incremental_seconds"] = incremental["seconds"]
+    result["incremental_reads"] = client.stats["reads"]
+    return result
+
+
+def _seed_due_notifications(manager, size):
+    """Schedule `size` contracts with a notification due today, CONTRACTS_PER_USER per recipient."""
+    today = datetime.now().date()
+    schedules = {
+        f'contract{index:06d}': {
+            "recipient_email": f'user{index // CONTRACTS_PER_USER:06d}@example.com',
+            "contract_name": f"Licensor {index} - Licensee {index}",
+            "termination_date": (today + timedelta(days=1)).strftime("%Y-%m-%d"),
+            "notifications": [{"days_before": 1, "notification_date": today.strftime("%Y-%m-%d"), "sent": False}],
+        }
+        for index in range(size)
+    }
+    path = os.path.join(_WORK_DIR, f'due-{size}.json')
+    with open(path, 'w') as f:
+        json.dump(schedules, f)
+    manager.store.import_json(path)
+
+
+def _bench_send(size, digest):
+    with fakes.SMTPSink() as sink:
+        manager = use_notification_manager(f"{'digest' if digest else 'notifications'}-{size}", sink)
+        _seed_due_notifications(manager, size)
+        result = _timed(lambda: manager.send_scheduled_notifications(digest=digest), size)
+        result["emails"] = sink.messages
+        result["email_bytes"] = sink.bytes
+        result["unsent"] = len(manager.store.due_notifications(*[datetime.now().strftime("%Y-%m-%d")] * 2))
+    return result
+
+
+def bench_notifications(size, options):
+    """send_scheduled_notifications, one email per notification, to a local SMTP sink."""
+    return _bench_send(size, digest=False)
+
+
+def bench_digest(size, options):
+    """send_scheduled_notifications in digest mode, one email per recipient."""
+    return _bench_send(size, digest=True)
+
+
+def bench_dashboard(size, options):
+    """GET /dashboard and the first --pages pages of /api/documents, for a user with `size` contracts."""
+    from app import app
+    from services.document_service import DOCUMENT_PAGE_SIZE
+
+    client = use_fake_firestore()
+    updated_at = datetime.now(timezone.utc)
+    collection = client.collection(f'users/{BENCHMARK_USER}/documents')
+    for index in range(size):
+        collection.document(f'doc{index:06d}').set({
+            **fakes.SAMPLE_ANALYSIS, "file_name": f"contract_{index:06d}.pdf", "updated_at": updated_at
+        })
+
+    http = app.test_client()
+    with http.session_transaction() as session:
+        session['user_id'] = BENCHMARK_USER
+    pages = min(options.pages, -(-size // DOCUMENT_PAGE_SIZE))
+    loaded = 0
+
+    def run():
+        nonlocal loaded
+        assert http.get('/dashboard').status_code == 200
+        cursor = None
+        for _ in range(pages):
+            response = http.get('/api/documents', query_string={'cursor': cursor} if cursor else {}).get_json()
+            loaded += len(response["documents"])
+            cursor = response["next_cursor"]
+            if not cursor:
+                break
+
+    client.stats["reads"] = 0
+    result = _timed(run, 1 + pages)
+    result["documents_loaded"] = loaded
+    result["reads"] = client.stats["reads"]
+    return result
+
+
+BENCHMARKS = {
+    "extract": bench_extract,
+    "gemini": bench_gemini,
+    "repair": bench_repair,
+    "sweep": bench_sweep,
+    "notifications": bench_notifications,
+    "digest": bench_digest,
+    "dashboard": bench_dashboard,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, sizes, options):
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "options": {"latency": options.latency, "workers": options.workers, "pages": options.pages},
+        "results": {},
+    }
+    for name in names:
+        report["results"][name] = {}
+        for size in sizes:
+            result = BENCHMARKS[name](size, options)
+            report["results"][name][str(size)] = result
+            print(f"{name:>14} {size:>7}: {result['seconds']:>9.3f} s  {result['per_item_ms']:>9.3f} ms/item  "
+                  f"{result['per_second']:>10.1f} /s", flush=True)
+    return report
+
+
+def compare(report, baseline, threshold):
+    """
+    Return the (benchmark, size, before, after) per-item times that got slower
+    than the baseline by more than threshold (a fraction, e.g. 0.2 = 20%).
+    """
+    regressions = []
+    for name, sizes in report["results"].items():
+        for size, result in sizes.items():
+            before = baseline.get("results", {}).get(name, {}).get(size)
+            if not before or not before["per_item_ms"]:
+                continue
+            change = result["per_item_ms"] / before["per_item_ms"] - 1
+            print(f"{name:>14} {size:>7}: {before['per_item_ms']:>9.3f} -> {result['per_item_ms']:>9.3f} ms/item "
+                  f"({change:+.1%})")
+            if change > threshold:
+                regressions.append((name, size, before["per_item_ms"], result["per_item_ms"]))
+    return regressions
+
+
+def _parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths offline against local stand-ins.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated numbers of contracts, e.g. 10,100,1000,10000,100000")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stub Gemini model takes to answer")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent Gemini analyses")
+    parser.add_argument("--pages", type=int, default=10, help="Dashboard pages loaded after the first render")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR,
+                        help="Where the synthetic contracts are written and reused between runs")
+    parser.add_argument("--output", help="Write the report to this file instead of benchmarks/results/")
+    parser.add_argument("--compare", help="Report saved by an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown per item, as a fraction, reported as a regression")
+    args = parser.parse_args()
+
+    names = _parse_list(args.benchmarks)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+    sizes = [int(size) for size in _parse_list(args.sizes)]
+
+    report = run(names, sizes, args)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit'] or 'unknown'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} ({baseline.get('commit')}, {baseline.get('timestamp')}):")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}:")
+            for name, size, before, after in regressions:
+                print(f"  {name} at {size}: {before:.3f} -> {after:.3f} ms/item")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Worker startup benchmark.
+
+Measures, in fresh interpreter processes, how long importing the Flask app
+takes and how long the first request takes to serve, and profiles the import
+with ``python -X importtime``.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--top 15] [--output report.json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a child process; prints import and first-request timings as JSON
+_STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (served - imported) * 1000,
+    "status": response.status_code,
+}))
+"""
+
+
+def _run_probe():
+    output = subprocess.run(
+        [sys.executable, "-c", _STARTUP_PROBE],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(top=15):
+    """Return the modules with the largest cumulative import time, in milliseconds."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        modules.append({
+            "module": name,
+            "self_ms": round(int(self_us) / 1000, 1),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+        })
+    modules.sort(key=lambda module: module["cumulative_ms"], reverse=True)
+    return modules[:top]
+
+
+def run(runs=5, top=15):
+    samples = [_run_probe() for _ in range(runs)]
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "import_ms_median": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "import_ms_min": round(min(s["import_ms"] for s in samples), 1),
+        "first_request_ms_median": round(statistics.median(s["first_request_ms"] for s in samples), 1),
+        "import_profile": import_profile(top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker startup time of the Flask app.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Modules listed in the import profile")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    print(f"import app: median {report['import_ms_median']} ms, min {report['import_ms_min']} ms "
+          f"over {report['runs']} runs")
+    print(f"first request (GET /login): median {report['first_request_ms_median']} ms")
+    print("\nSlowest imports (cumulative ms, self ms):")
+    for module in report["import_profile"]:
+        print(f"  {module['cumulative_ms']:>8} {module['self_ms']:>8}  {module['module']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
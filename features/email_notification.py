@@ -1,257 +1,454 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
-import json
-import os
-import logging
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-class ContractNotificationManager:
-    def __init__(self, smtp_server="smtp.gmail.com", smtp_port=587):
-        """Initialize the email notification manager with SMTP settings."""
-        self.smtp_server = smtp_server
-        self.smtp_port = smtp_port
-        self.sender_email = os.environ.get('NOTIFICATION_EMAIL', '')
-        self.sender_password = os.environ.get('NOTIFICATION_PASSWORD', '')
-        # Days before expiration to send notifications
-        self.notification_days = [1, 3, 5]
-        
-        # Store pending notifications
-        self.notifications_file = "contract_notifications.json"
-        self.notifications = self._load_notifications()
-    
-    def _load_notifications(self):
-        """Load existing notifications from file."""
-        try:
-            if os.path.exists(self.notifications_file):
-                with open(self.notifications_file, 'r') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            logger.error(f"Error loading notifications: {e}")
-            return {}
-    
-    def _save_notifications(self):
-        """Save notifications to file."""
-        try:
-            with open(self.notifications_file, 'w') as f:
-                json.dump(self.notifications, f, indent=4)
-        except Exception as e:
-            logger.error(f"Error saving notifications: {e}")
-    
-    def schedule_notifications(self, contract_data, recipient_email, contract_id=None):
-        """
-        Schedule notifications for a contract termination date.
-        
-        Args:
-            contract_data: Dictionary containing contract details
-            recipient_email: Email address to send notifications to
-            contract_id: Unique identifier for the contract (optional)
-        """
-        try:
-            # Extract termination date from contract data
-            term_duration = contract_data.get("licensing_terms", {}).get("term_duration", "")
-            effective_date_str = contract_data.get("licensing_terms", {}).get("effective_date", "")
-            
-            # Skip if we don't have the necessary information
-            if not effective_date_str:
-                logger.warning("No effective date found in contract data")
-                return False
-            
-            # Generate contract ID if not provided
-            if not contract_id:
-                contract_id = f"contract_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            # Parse effective date
-            effective_date = self._parse_date(effective_date_str)
-            if not effective_date:
-                logger.warning(f"Could not parse effective date: {effective_date_str}")
-                return False
-            
-            # Calculate termination date based on term duration
-            termination_date = self._calculate_termination_date(effective_date, term_duration)
-            if not termination_date:
-                logger.warning(f"Could not calculate termination date from {term_duration}")
-                return False
-            
-            # Create notification schedule
-            today = datetime.now().date()
-            notifications = []
-            
-            for days in self.notification_days:
-                notification_date = termination_date - timedelta(days=days)
-                # Only schedule future notifications
-                # if notification_date >= today:
-                notifications.append({
-                    "days_before": days,
-                    "notification_date": notification_date.strftime("%Y-%m-%d"),
-                    "sent": False
-                })
-            
-            # Store notification schedule
-            self.notifications[contract_id] = {
-                "recipient_email": recipient_email,
-                "contract_name": f"{contract_data.get('parties', {}).get('licensor', 'Unknown')} - {contract_data.get('parties', {}).get('licensee', 'Unknown')}",
-                "termination_date": termination_date.strftime("%Y-%m-%d"),
-                "notifications": notifications
-            }
-            
-            self._save_notifications()
-            logger.info(f"Scheduled notifications for contract {contract_id} terminating on {termination_date}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error scheduling notifications: {e}")
-            return False
-    
-    def _parse_date(self, date_str):
-        """
-        Parse date string into datetime object.
-        Tries multiple formats to be flexible.
-        """
-        date_formats = [
-            "%Y-%m-%d", 
-            "%m/%d/%Y", 
-            "%d/%m/%Y", 
-            "%B %d, %Y", 
-            "%d %B %Y"
-        ]
-        
-        for fmt in date_formats:
-            try:
-                return datetime.strptime(date_str, fmt).date()
-            except ValueError:
-                continue
-        
-        return None
-    
-    def _calculate_termination_date(self, effective_date, term_duration):
-        """
-        Calculate termination date based on effective date and term duration.
-        
-        Args:
-            effective_date: Start date of the contract
-            term_duration: String describing the duration (e.g., "12 months", "1 year")
-        
-        Returns:
-            datetime.date object representing termination date
-        """
-        try:
-            term_lower = term_duration.lower()
-            
-            # Check for years
-            if "year" in term_lower:
-                years = int(term_lower.split()[0])
-                return datetime(effective_date.year + years, effective_date.month, effective_date.day).date()
-            
-            # Check for months
-            elif "month" in term_lower:
-                months = int(term_lower.split()[0])
-                new_month = effective_date.month + months
-                years_to_add = (new_month - 1) // 12
-                final_month = ((new_month - 1) % 12) + 1
-                return datetime(effective_date.year + years_to_add, final_month, effective_date.day).date()
-            
-            # Check for days
-            elif "day" in term_lower:
-                days = int(term_lower.split()[0])
-                return effective_date + timedelta(days=days)
-            
-            # If exact date is specified
-            elif "until" in term_lower:
-                date_part = term_lower.split("until", 1)[1].strip()
-                return self._parse_date(date_part)
-            
-            else:
-                logger.warning(f"Unrecognized term duration format: {term_duration}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error calculating termination date: {e}")
-            return None
-    
-    def send_scheduled_notifications(self):
-        """Check and send all due or past due notifications."""
-        today = datetime.now().date().strftime("%Y-%m-%d")
-        notifications_modified = False
-
-        for contract_id, contract_info in self.notifications.items():
-            for notification in contract_info["notifications"]:
-                # Check if notification date is today OR in the past AND not sent.
-                if notification["notification_date"] == today and not notification["sent"]:
-                    # Send notification
-                    success = self._send_notification_email(
-                        contract_info["recipient_email"],
-                        contract_info["contract_name"],
-                        contract_info["termination_date"],
-                        notification["days_before"]
-                    )
-
-                    if success:
-                        notification["sent"] = True
-                        notifications_modified = True
-                        logger.info(f"Sent notification for contract {contract_id} - {notification['days_before']} days before termination")
-
-        if notifications_modified:
-            self._save_notifications()    
-
-    def _send_notification_email(self, recipient_email, contract_name, termination_date, days_before):
-        """
-        Send notification email.
-        
-        Args:
-            recipient_email: Email address to send to
-            contract_name: Name of the contract (for subject line)
-            termination_date: Contract termination date (string)
-            days_before: Days before termination
-        
-        Returns:
-            Boolean indicating success/failure
-        """
-        try:
-            # Create email message
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
-            msg['Subject'] = f"Contract Termination Notice: {contract_name} - {days_before} day{'s' if days_before > 1 else ''} remaining"
-            
-            # Create email body
-            body = f"""
-            <html>
-            <body>
-                <h2>Contract Termination Reminder</h2>
-                <p>This is a reminder that the following contract is set to terminate in <strong>{days_before} day{'s' if days_before > 1 else ''}</strong>:</p>
-                
-                <div style="margin: 20px; padding: 15px; border: 1px solid #ccc; border-radius: 5px;">
-                    <p><strong>Contract:</strong> {contract_name}</p>
-                    <p><strong>Termination Date:</strong> {termination_date}</p>
-                </div>
-                
-                <p>Please take any necessary actions before the contract expires.</p>
-                
-                <p>This is an automated notification from ContractIQ.</p>
-            </body>
-            </html>
-            """
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            # Connect to SMTP server and send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error sending notification email: {e}")
-            return False
-if __name__ == '__main__':
-    obj = ContractNotificationManager()
-    obj.send_scheduled_notifications()
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from datetime import datetime, timedelta
+import os
+import re
+import atexit
+import hashlib
+import logging
+import threading
+from features.notification_store import NotificationStore
+from features.smtp_transport import SMTPTransport
+from services.metrics import stage
+from services.contract_terms import parse_date, calculate_termination_date
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Days before expiration to send notifications, e.g. "1,3,5"
+NOTIFICATION_DAYS = [int(days) for days in os.environ.get('NOTIFICATION_DAYS', '1,3,5').split(',') if days.strip()]
+# Send one email per recipient listing every due contract instead of one email per notification
+NOTIFICATION_DIGEST = os.environ.get('NOTIFICATION_DIGEST', 'false').lower() in ('1', 'true', 'yes')
+# Digests also pick up unsent notifications that fell due in this many previous days
+NOTIFICATION_DIGEST_WINDOW_DAYS = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW_DAYS', 0))
+# Emails claimed and sent together; a sweep shard renews its lease after each batch
+NOTIFICATION_SEND_BATCH = int(os.environ.get('NOTIFICATION_SEND_BATCH', 100))
+
+class ContractNotificationManager:
+    def __init__(self, smtp_server="smtp.gmail.com", smtp_port=587, notification_days=None,
+                 digest=NOTIFICATION_DIGEST, digest_window_days=NOTIFICATION_DIGEST_WINDOW_DAYS):
+        """Initialize the email notification manager with SMTP settings."""
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = os.environ.get('NOTIFICATION_EMAIL', '')
+        self.sender_password = os.environ.get('NOTIFICATION_PASSWORD', '')
+        # Days before expiration to send notifications
+        self.notification_days = sorted(notification_days or NOTIFICATION_DAYS)
+        self.digest = digest
+        self.digest_window_days = digest_window_days
+        
+        # Store pending notifications
+        self.store = NotificationStore()
+        # Pooled SMTP sessions reused across notification emails
+        self.transport = SMTPTransport(smtp_server, smtp_port, self.sender_email, self.sender_password)
+    
+    def schedule_notifications(self, contract_data, recipient_email, contract_id=None, user_id=None):
+        """
+        Schedule notifications for a contract termination date.
+        
+        Args:
+            contract_data: Dictionary containing contract details
+            recipient_email: Email address to send notifications to
+            contract_id: Unique identifier for the contract (optional)
+            user_id: Owner of the contract (optional)
+
+        Returns:
+            False if the contract lacks the dates to schedule from. Errors
+            storing the schedule are raised, so a sweep can retry the contract.
+        """
+        with stage("notification", "schedule") as span:
+            scheduled = self._schedule_notifications(contract_data, recipient_email, contract_id, user_id)
+            if not scheduled:
+                span["outcome"] = "error"
+            return scheduled
+
+    def _schedule_notifications(self, contract_data, recipient_email, contract_id, user_id):
+        try:
+            # Extract termination date from contract data
+            term_duration = contract_data.get("licensing_terms", {}).get("term_duration", "")
+            effective_date_str = contract_data.get("licensing_terms", {}).get("effective_date", "")
+            
+            # Skip if we don't have the necessary information
+            if not effective_date_str:
+                logger.warning("No effective date found in contract data")
+                return False
+            
+            # Generate contract ID if not provided
+            if not contract_id:
+                contract_id = f"contract_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            
+            # Parse effective date
+            effective_date = self._parse_date(effective_date_str)
+            if not effective_date:
+                logger.warning(f"Could not parse effective date: {effective_date_str}")
+                return False
+            
+            # Calculate termination date based on term duration
+            termination_date = self._calculate_termination_date(effective_date, term_duration)
+            if not termination_date:
+                logger.warning(f"Could not calculate termination date from {term_duration}")
+                return False
+            
+            # Create notification schedule
+            today = datetime.now().date()
+            notifications = []
+            
+            for days in self.notification_days:
+                notification_date = termination_date - timedelta(days=days)
+                # Only schedule future notifications
+                # if notification_date >= today:
+                notifications.append({
+                    "days_before": days,
+                    "notification_date": notification_date.strftime("%Y-%m-%d"),
+                    "sent": False
+                })
+            
+            # Keep the sent flag of notifications that were already scheduled for the same date
+            existing = self.store.get_contract(contract_id)
+            if existing:
+                already_sent = {
+                    (n["days_before"], n["notification_date"])
+                    for n in existing["notifications"] if n["sent"]
+                }
+                for notification in notifications:
+                    if (notification["days_before"], notification["notification_date"]) in already_sent:
+                        notification["sent"] = True
+
+            # Store notification schedule
+            schedule = {
+                "recipient_email": recipient_email,
+                "contract_name": f"{contract_data.get('parties', {}).get('licensor', 'Unknown')} - {contract_data.get('parties', {}).get('licensee', 'Unknown')}",
+                "termination_date": termination_date.strftime("%Y-%m-%d"),
+                "notifications": notifications
+            }
+            if existing == schedule:
+                logger.info(f"Notifications for contract {contract_id} are already up to date")
+                return True
+
+            self.store.upsert_contract(contract_id, schedule, user_id=user_id)
+            logger.info(f"Scheduled notifications for contract {contract_id} terminating on {termination_date}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error scheduling notifications: {e}")
+            raise
+    
+    def drop_legacy_contracts(self):
+        """
+        Remove schedules stored under the old timestamp-based contract ids
+        (e.g. "<document_id>_20250101120000"), which were duplicated on every sweep.
+        """
+        legacy = [contract_id for contract_id in self.store.contract_ids() if re.search(r'_\d{14}$', contract_id)]
+        if legacy:
+            self.store.delete_contracts(legacy)
+            logger.info(f"Removed {len(legacy)} legacy notification schedule(s)")
+        return len(legacy)
+
+    def get_sweep_watermark(self):
+        """Return the time up to which contracts have been swept, or None before the first sweep."""
+        watermark = self.store.get_state("watermark")
+        return datetime.fromisoformat(watermark) if watermark else None
+
+    def set_sweep_watermark(self, watermark):
+        """Record that every contract updated before the watermark has been swept."""
+        self.store.set_state("watermark", watermark.isoformat())
+
+    def _parse_date(self, date_str):
+        """Parse date string into a date object, trying the formats in DATE_FORMATS."""
+        return parse_date(date_str)
+
+    def _calculate_termination_date(self, effective_date, term_duration):
+        """Calculate termination date based on effective date and term duration (e.g. "12 months")."""
+        return calculate_termination_date(effective_date, term_duration)
+
+    def send_scheduled_notifications(self, digest=None, user_range=None, heartbeat=None):
+        """
+        Check and send all notifications due today.
+
+        Every email is sent at most once: its idempotency key is claimed in
+        the store before it is sent, so concurrent runs skip it. Emails are
+        claimed, sent and recorded in batches of NOTIFICATION_SEND_BATCH.
+
+        Args:
+            digest: Send one digest email per recipient instead of one email per
+                notification (defaults to the manager's digest setting)
+            user_range: Only send the notifications of contracts whose owner's
+                user id is within these (lower, upper) bounds
+            heartbeat: Called after every batch, e.g. to renew a lease; an
+                exception it raises stops sending with no email left claimed
+
+        Returns:
+            Dict with the number of emails "sent", "failed" and "skipped"
+            because another run claimed them
+        """
+        if self.digest if digest is None else digest:
+            return self.send_digest_notifications(user_range, heartbeat)
+
+        today = datetime.now().date().strftime("%Y-%m-%d")
+        due = self.store.due_notifications(today, today, user_range)
+        return _in_batches(self._send_notifications, due, heartbeat)
+
+    def _send_notifications(self, due):
+        """Claim, send and record one email per notification."""
+        keys = [_notification_key(n) for n in due]
+        claimed = self.store.claim_emails(keys)
+        due = [(key, notification) for key, notification in zip(keys, due) if key in claimed]
+
+        messages = [
+            self._build_notification_email(
+                notification["recipient_email"],
+                notification["contract_name"],
+                notification["termination_date"],
+                notification["days_before"]
+            )
+            for _, notification in due
+        ]
+        # Sent in parallel over pooled SMTP connections
+        results = self.transport.send_many(messages)
+
+        sent_keys, failed_keys, sent_ids = [], [], []
+        for (key, notification), success in zip(due, results):
+            if success:
+                sent_keys.append(key)
+                sent_ids.append(notification["id"])
+                logger.info(f"Sent notification for contract {notification['contract_id']} - {notification['days_before']} days before termination")
+            else:
+                failed_keys.append(key)
+
+        self.store.complete_emails(sent_keys, failed_keys, sent_ids)
+        return {"sent": len(sent_keys), "failed": len(failed_keys), "skipped": len(keys) - len(claimed)}
+
+    def send_digest_notifications(self, user_range=None, heartbeat=None):
+        """
+        Send one email per recipient listing every contract with a notification
+        due today (or in the digest window), then mark each notification sent.
+
+        Each notification's own idempotency key is claimed as well as the
+        digest's, so a notification already sent (or being sent) by another
+        digest or non-digest run is left out of the digest. Recipients are
+        handled in batches of NOTIFICATION_SEND_BATCH, calling heartbeat after each.
+        """
+        today = datetime.now().date()
+        start = (today - timedelta(days=self.digest_window_days)).strftime("%Y-%m-%d")
+        due = self.store.due_notifications(start, today.strftime("%Y-%m-%d"), user_range)
+
+        by_recipient = {}
+        for notification in due:
+            by_recipient.setdefault(notification["recipient_email"], []).append(notification)
+        return _in_batches(lambda batch: self._send_digests(batch, today), list(by_recipient.values()), heartbeat)
+
+    def _send_digests(self, groups, today):
+        """Claim, send and record one digest per list of a recipient's notifications."""
+        due = [notification for notifications in groups for notification in notifications]
+        claimed = self.store.claim_emails(_notification_key(n) for n in due)
+        by_recipient = {}
+        for notification in due:
+            if _notification_key(notification) in claimed:
+                by_recipient.setdefault(notification["recipient_email"], []).append(notification)
+
+        # A digest is keyed by the notifications it lists, so notifications
+        # scheduled after an earlier digest of the day still go out in a second one
+        keys = {
+            email: "digest:{}:{}:{}".format(email, today.isoformat(), hashlib.sha1(
+                ",".join(sorted(_notification_key(n) for n in notifications)).encode()).hexdigest()[:16])
+            for email, notifications in by_recipient.items()
+        }
+        digests = self.store.claim_emails(keys.values())
+        recipients = [email for email in by_recipient if keys[email] in digests]
+        # The same digest was sent before, so its notifications were too
+        sent_before = [email for email in by_recipient if keys[email] not in digests]
+        self.store.complete_emails(
+            [_notification_key(n) for email in sent_before for n in by_recipient[email]], [],
+            [n["id"] for email in sent_before for n in by_recipient[email]],
+        )
+
+        messages = [self._build_digest_email(email, by_recipient[email], today) for email in recipients]
+        results = self.transport.send_many(messages)
+
+        sent_keys, failed_keys, sent_ids = [], [], []
+        for email, success in zip(recipients, results):
+            email_keys = [keys[email]] + [_notification_key(n) for n in by_recipient[email]]
+            if success:
+                sent_keys.extend(email_keys)
+                sent_ids.extend(notification["id"] for notification in by_recipient[email])
+                logger.info(f"Sent digest of {len(by_recipient[email])} notification(s) to {email}")
+            else:
+                failed_keys.extend(email_keys)
+
+        self.store.complete_emails(sent_keys, failed_keys, sent_ids)
+        failed = sum(1 for success in results if not success)
+        return {"sent": len(results) - failed, "failed": failed, "skipped": len(groups) - len(recipients)}
+
+    def close(self):
+        """
+        Close the pooled SMTP connections. Other sweep shards share them, so
+        this is only called once the process is done sending.
+        """
+        self.transport.close()
+
+    def _build_digest_email(self, recipient_email, notifications, today):
+        """
+        Build a digest email listing each contract of the due notifications once.
+
+        Args:
+            recipient_email: Email address to send to
+            notifications: Due notifications of this recipient
+            today: Date the digest is sent
+
+        Returns:
+            MIMEMultipart message
+        """
+        # A contract with several due notifications (after a missed run) is listed once
+        contracts = {}
+        for notification in notifications:
+            contracts.setdefault(notification["contract_id"], notification)
+        contracts = sorted(contracts.values(), key=lambda n: (n["termination_date"], n["contract_name"]))
+
+        rows = []
+        for notification in contracts:
+            days_left = (datetime.strptime(notification["termination_date"], "%Y-%m-%d").date() - today).days
+            rows.append(
+                f"""<tr>
+                    <td style="padding: 6px 12px; border-bottom: 1px solid #eee;">{notification['contract_name']}</td>
+                    <td style="padding: 6px 12px; border-bottom: 1px solid #eee;">{notification['termination_date']}</td>
+                    <td style="padding: 6px 12px; border-bottom: 1px solid #eee;">{days_left} day{'s' if days_left != 1 else ''}</td>
+                </tr>"""
+            )
+
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = f"Contract Termination Notice: {len(contracts)} contract{'s' if len(contracts) != 1 else ''} terminating soon"
+
+        body = f"""
+        <html>
+        <body>
+            <h2>Contract Termination Reminder</h2>
+            <p>The following contracts are set to terminate soon:</p>
+            
+            <table style="margin: 20px; border-collapse: collapse; border: 1px solid #ccc;">
+                <tr>
+                    <th style="padding: 6px 12px; text-align: left;">Contract</th>
+                    <th style="padding: 6px 12px; text-align: left;">Termination Date</th>
+                    <th style="padding: 6px 12px; text-align: left;">Remaining</th>
+                </tr>
+                {''.join(rows)}
+            </table>
+            
+            <p>Please take any necessary actions before the contracts expire.</p>
+            
+            <p>This is an automated notification from ContractIQ.</p>
+        </body>
+        </html>
+        """
+
+        msg.attach(MIMEText(body, 'html'))
+        return msg
+
+    def _build_notification_email(self, recipient_email, contract_name, termination_date, days_before):
+        """
+        Build a notification email.
+        
+        Args:
+            recipient_email: Email address to send to
+            contract_name: Name of the contract (for subject line)
+            termination_date: Contract termination date (string)
+            days_before: Days before termination
+        
+        Returns:
+            MIMEMultipart message
+        """
+        # Create email message
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = f"Contract Termination Notice: {contract_name} - {days_before} day{'s' if days_before > 1 else ''} remaining"
+        
+        # Create email body
+        body = f"""
+        <html>
+        <body>
+            <h2>Contract Termination Reminder</h2>
+            <p>This is a reminder that the following contract is set to terminate in <strong>{days_before} day{'s' if days_before > 1 else ''}</strong>:</p>
+            
+            <div style="margin: 20px; padding: 15px; border: 1px solid #ccc; border-radius: 5px;">
+                <p><strong>Contract:</strong> {contract_name}</p>
+                <p><strong>Termination Date:</strong> {termination_date}</p>
+            </div>
+            
+            <p>Please take any necessary actions before the contract expires.</p>
+            
+            <p>This is an automated notification from ContractIQ.</p>
+        </body>
+        </html>
+        """
+        
+        msg.attach(MIMEText(body, 'html'))
+        return msg
+
+    def _send_notification_email(self, recipient_email, contract_name, termination_date, days_before):
+        """
+        Send notification email.
+        
+        Args:
+            recipient_email: Email address to send to
+            contract_name: Name of the contract (for subject line)
+            termination_date: Contract termination date (string)
+            days_before: Days before termination
+        
+        Returns:
+            Boolean indicating success/failure
+        """
+        try:
+            msg = self._build_notification_email(recipient_email, contract_name, termination_date, days_before)
+            return self.transport.send(msg)
+        except Exception as e:
+            logger.error(f"Error sending notification email: {e}")
+            return False
+
+def _in_batches(send, items, heartbeat=None):
+    """Call send on batches of NOTIFICATION_SEND_BATCH items and add up the counts it returns."""
+    totals = {"sent": 0, "failed": 0, "skipped": 0}
+    for start in range(0, len(items), NOTIFICATION_SEND_BATCH):
+        for name, count in send(items[start:start + NOTIFICATION_SEND_BATCH]).items():
+            totals[name] += count
+        if heartbeat is not None:
+            heartbeat()
+    return totals
+
+
+def _notification_key(notification):
+    """Idempotency key of the email for one scheduled notification."""
+    return f"notification:{notification['contract_id']}:{notification['days_before']}:{notification['notification_date']}"
+
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+
+def get_notification_manager():
+    """
+    Return the notification manager of this process, created on first use.
+    Its database engine and SMTP pool are not shared with forked workers.
+    """
+    global _manager, _manager_pid
+    with _manager_lock:
+        if _manager is None or _manager_pid != os.getpid():
+            _manager = ContractNotificationManager()
+            _manager_pid = os.getpid()
+        return _manager
+
+
+@atexit.register
+def _close_manager():
+    # A forked worker inherits the parent's manager, whose connections are not its own to close
+    if _manager is not None and _manager_pid == os.getpid():
+        _manager.close()
+
+
+if __name__ == '__main__':
+    obj = get_notification_manager()
+    obj.send_scheduled_notifications()
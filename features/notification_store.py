@@ -0,0 +1,522 @@
+import argparse
+import json
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import create_engine, event, select, update, delete, func, or_, and_, String, Integer, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker, selectinload
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_DB_URL = os.environ.get('NOTIFICATION_DB_URL', 'sqlite:///contract_notifications.db')
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class ContractRecord(Base):
+    """A contract whose termination is being tracked."""
+    __tablename__ = 'contracts'
+
+    contract_id: Mapped[str] = mapped_column(String, primary_key=True)
+    user_id: Mapped[Optional[str]] = mapped_column(String, index=True, nullable=True)
+    recipient_email: Mapped[str] = mapped_column(String)
+    contract_name: Mapped[str] = mapped_column(String)
+    termination_date: Mapped[str] = mapped_column(String(10))
+    notifications: Mapped[List["NotificationRecord"]] = relationship(
+        back_populates="contract", cascade="all, delete-orphan", order_by="NotificationRecord.id"
+    )
+
+
+class NotificationRecord(Base):
+    """A single reminder email, N days before a contract terminates."""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        # Due notifications are fetched with one range query over unsent rows
+        Index('ix_notifications_sent_date', 'sent', 'notification_date'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    contract_id: Mapped[str] = mapped_column(ForeignKey('contracts.contract_id', ondelete='CASCADE'), index=True)
+    days_before: Mapped[int] = mapped_column(Integer)
+    notification_date: Mapped[str] = mapped_column(String(10), index=True)
+    sent: Mapped[bool] = mapped_column(Boolean, default=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    contract: Mapped[ContractRecord] = relationship(back_populates="notifications")
+
+
+class SweepState(Base):
+    """Key/value state of the notification sweep, such as its watermark."""
+    __tablename__ = 'sweep_state'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String)
+
+
+class SweepRun(Base):
+    """One sweep-and-send run, split into shards that workers claim."""
+    __tablename__ = 'sweep_runs'
+
+    run_id: Mapped[str] = mapped_column(String, primary_key=True)
+    # running, completed (every shard done) or failed (a shard gave up)
+    status: Mapped[str] = mapped_column(String, default='running', index=True)
+    full: Mapped[bool] = mapped_column(Boolean, default=False)
+    digest: Mapped[Optional[bool]] = mapped_column(Boolean, nullable=True)
+    # Watermark the run sweeps from, None for a full sweep
+    since: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    shards: Mapped[List["SweepShard"]] = relationship(
+        back_populates="run", cascade="all, delete-orphan", order_by="SweepShard.shard"
+    )
+
+
+class SweepShard(Base):
+    """The users with lower <= user_id < upper of a run, and the lease of the worker processing them."""
+    __tablename__ = 'sweep_shards'
+
+    run_id: Mapped[str] = mapped_column(ForeignKey('sweep_runs.run_id', ondelete='CASCADE'), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    lower: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    upper: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # pending, running (leased), done or failed
+    status: Mapped[str] = mapped_column(String, default='pending')
+    owner: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    # A shard handed back after a failure is not claimed again before this time
+    not_before: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    contracts: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    skipped: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    run: Mapped[SweepRun] = relationship(back_populates="shards")
+
+
+class EmailDelivery(Base):
+    """
+    Idempotency key of an email, claimed before it is sent. A key that is
+    claimed is never sent again, even if its sender died before recording
+    the outcome.
+    """
+    __tablename__ = 'email_deliveries'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    # sending until the SMTP server accepted the message, then sent
+    status: Mapped[str] = mapped_column(String, default='sending')
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class NotificationStore:
+    """
+    Transactional store of scheduled contract notifications.
+
+    Schedules are kept in SQLite (or any database SQLAlchemy supports) instead
+    of a JSON file rewritten on every change, so concurrent workers cannot
+    corrupt it and due notifications are found with an indexed range query.
+    """
+
+    def __init__(self, url=NOTIFICATION_DB_URL):
+        connect_args = {'timeout': 30, 'check_same_thread': False} if url.startswith('sqlite') else {}
+        self.engine = create_engine(url, connect_args=connect_args)
+        if url.startswith('sqlite'):
+            event.listen(self.engine, 'connect', _enable_sqlite_wal)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(self.engine, expire_on_commit=False)
+
+    def get_contract(self, contract_id):
+        """Return the schedule of a contract in the same shape as schedule_notifications builds, or None."""
+        with self.Session() as session:
+            contract = session.get(ContractRecord, contract_id, options=[selectinload(ContractRecord.notifications)])
+            return _contract_to_dict(contract) if contract else None
+
+    def upsert_contract(self, contract_id, schedule, user_id=None):
+        """Insert or replace the schedule of a contract in one transaction."""
+        with self.Session.begin() as session:
+            _upsert(session, contract_id, schedule, user_id)
+
+    def delete_contracts(self, contract_ids):
+        if not contract_ids:
+            return
+        with self.Session.begin() as session:
+            session.execute(delete(NotificationRecord).where(NotificationRecord.contract_id.in_(contract_ids)))
+            session.execute(delete(ContractRecord).where(ContractRecord.contract_id.in_(contract_ids)))
+
+    def contract_ids(self):
+        with self.Session() as session:
+            return list(session.scalars(select(ContractRecord.contract_id)))
+
+    def due_notifications(self, start_date, end_date, user_range=None):
+        """
+        Return the unsent notifications dated between start_date and end_date
+        (inclusive, YYYY-MM-DD strings), with their contract details.
+
+        Args:
+            user_range: Optional (lower, upper) bounds of the owners' user ids,
+                lower inclusive and upper exclusive, None for unbounded.
+                Contracts without an owner belong to the range without a
+                lower bound.
+        """
+        query = (
+            select(NotificationRecord, ContractRecord)
+            .join(ContractRecord, NotificationRecord.contract_id == ContractRecord.contract_id)
+            .where(NotificationRecord.sent.is_(False))
+            .where(NotificationRecord.notification_date >= start_date)
+            .where(NotificationRecord.notification_date <= end_date)
+            .order_by(NotificationRecord.notification_date, NotificationRecord.id)
+        )
+        lower, upper = user_range or (None, None)
+        bounds = []
+        if lower is not None:
+            bounds.append(ContractRecord.user_id >= lower)
+        if upper is not None:
+            bounds.append(ContractRecord.user_id < upper)
+        if bounds:
+            in_range = and_(*bounds)
+            query = query.where(or_(ContractRecord.user_id.is_(None), in_range) if lower is None else in_range)
+        with self.Session() as session:
+            return [
+                {
+                    "id": notification.id,
+                    "contract_id": contract.contract_id,
+                    "user_id": contract.user_id,
+                    "recipient_email": contract.recipient_email,
+                    "contract_name": contract.contract_name,
+                    "termination_date": contract.termination_date,
+                    "days_before": notification.days_before,
+                    "notification_date": notification.notification_date,
+                }
+                for notification, contract in session.execute(query)
+            ]
+
+    def mark_sent(self, notification_ids):
+        """Mark notifications as sent in one transaction."""
+        if not notification_ids:
+            return
+        with self.Session.begin() as session:
+            session.execute(
+                update(NotificationRecord)
+                .where(NotificationRecord.id.in_(notification_ids))
+                .values(sent=True, sent_at=datetime.now())
+            )
+
+    def claim_emails(self, keys):
+        """
+        Claim the idempotency keys of emails about to be sent.
+
+        Returns:
+            The set of keys claimed by this call; the others were claimed
+            before and their emails must not be sent again
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return set()
+        now = datetime.now()
+        try:
+            with self.Session.begin() as session:
+                taken = set(session.scalars(select(EmailDelivery.key).where(EmailDelivery.key.in_(keys))))
+                claimed = {key for key in keys if key not in taken}
+                session.add_all(EmailDelivery(key=key, created_at=now) for key in claimed)
+            return claimed
+        except IntegrityError:
+            # Another worker claimed some of them meanwhile; settle them one by one
+            claimed = set()
+            for key in keys:
+                try:
+                    with self.Session.begin() as session:
+                        session.add(EmailDelivery(key=key, created_at=now))
+                    claimed.add(key)
+                except IntegrityError:
+                    pass
+            return claimed
+
+    def complete_emails(self, sent_keys, failed_keys, notification_ids):
+        """
+        Record the outcome of claimed emails in one transaction: sent keys
+        stay claimed and their notifications are marked sent, failed keys are
+        released so a later run retries them.
+        """
+        with self.Session.begin() as session:
+            if sent_keys:
+                session.execute(
+                    update(EmailDelivery).where(EmailDelivery.key.in_(list(sent_keys))).values(status='sent')
+                )
+            if failed_keys:
+                session.execute(delete(EmailDelivery).where(EmailDelivery.key.in_(list(failed_keys))))
+            if notification_ids:
+                session.execute(
+                    update(NotificationRecord)
+                    .where(NotificationRecord.id.in_(notification_ids))
+                    .values(sent=True, sent_at=datetime.now())
+                )
+
+    def create_run(self, run_id, shards, full=False, digest=None, since=None):
+        """
+        Record a new sweep run.
+
+        Args:
+            shards: List of (lower, upper) user id bounds, one per shard
+            since: Watermark the run sweeps from (ISO string), None for a full sweep
+        """
+        with self.Session.begin() as session:
+            session.add(SweepRun(
+                run_id=run_id, status='running', full=full, digest=digest, since=since, started_at=datetime.now(),
+                shards=[SweepShard(shard=index, lower=lower, upper=upper, status='pending', attempts=0,
+                                   contracts=0, sent=0, failed=0, skipped=0)
+                        for index, (lower, upper) in enumerate(shards)],
+            ))
+
+    def delete_run(self, run_id):
+        with self.Session.begin() as session:
+            session.execute(delete(SweepShard).where(SweepShard.run_id == run_id))
+            session.execute(delete(SweepRun).where(SweepRun.run_id == run_id))
+
+    def active_run(self, started_after):
+        """
+        Return the id of the earliest run still running that started after
+        the given time, or None. Runs created concurrently settle on the same one.
+        """
+        with self.Session() as session:
+            return session.scalars(
+                select(SweepRun.run_id)
+                .where(SweepRun.status == 'running', SweepRun.started_at > started_after)
+                .order_by(SweepRun.started_at, SweepRun.run_id)
+                .limit(1)
+            ).first()
+
+    def abandon_runs(self, started_before):
+        """Mark runs still running that started before the given time as failed; returns how many."""
+        with self.Session.begin() as session:
+            return session.execute(
+                update(SweepRun)
+                .where(SweepRun.status == 'running', SweepRun.started_at <= started_before)
+                .values(status='failed', finished_at=datetime.now())
+            ).rowcount
+
+    def get_run(self, run_id):
+        """Return a run with its shards and totals, or None if it is unknown."""
+        with self.Session() as session:
+            run = session.get(SweepRun, run_id, options=[selectinload(SweepRun.shards)])
+            return _run_to_dict(run) if run else None
+
+    def claim_shard(self, run_id, owner, lease_seconds):
+        """
+        Lease the next pending shard of a run that is not backing off, or a
+        running one whose lease expired, to owner. The lease is taken with a conditional update, so
+        two workers never hold the same shard.
+
+        Returns:
+            The claimed shard as a dict, or None if no shard is available
+        """
+        now = datetime.now()
+        claimable = and_(
+            SweepShard.run_id == run_id,
+            # Shards of an abandoned run are left alone
+            SweepShard.run_id.in_(select(SweepRun.run_id).where(SweepRun.status == 'running')),
+            or_(and_(SweepShard.status == 'pending',
+                     or_(SweepShard.not_before.is_(None), SweepShard.not_before <= now)),
+                and_(SweepShard.status == 'running', SweepShard.lease_expires_at < now)),
+        )
+        with self.Session() as session:
+            candidates = list(session.scalars(select(SweepShard.shard).where(claimable).order_by(SweepShard.shard)))
+        for shard in candidates:
+            with self.Session.begin() as session:
+                claimed = session.execute(
+                    update(SweepShard)
+                    .where(claimable, SweepShard.shard == shard)
+                    .values(status='running', owner=owner, attempts=SweepShard.attempts + 1,
+                            lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+                ).rowcount
+                if claimed:
+                    return _shard_to_dict(session.get(SweepShard, (run_id, shard)))
+        return None
+
+    def renew_lease(self, run_id, shard, owner, lease_seconds):
+        """Extend the lease of a shard; returns False if owner no longer holds it."""
+        now = datetime.now()
+        with self.Session.begin() as session:
+            return bool(session.execute(
+                update(SweepShard)
+                .where(SweepShard.run_id == run_id, SweepShard.shard == shard,
+                       SweepShard.owner == owner, SweepShard.status == 'running')
+                .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+            ).rowcount)
+
+    def next_retry(self, run_id):
+        """Return when the first shard of a running run that is backing off can be claimed, or None."""
+        with self.Session() as session:
+            return session.scalar(
+                select(func.min(SweepShard.not_before))
+                .join(SweepRun, SweepShard.run_id == SweepRun.run_id)
+                .where(SweepShard.run_id == run_id, SweepRun.status == 'running',
+                       SweepShard.status == 'pending', SweepShard.not_before.is_not(None))
+            )
+
+    def finish_shard(self, run_id, shard, owner, status, error=None, not_before=None, **counts):
+        """
+        Record the outcome of a leased shard ("done", "pending" to hand it
+        back, or "failed") with its counts, and finish the run once no shard
+        is left. A shard handed back is not claimed again before not_before.
+
+        Returns:
+            The run's status if this call finished it, otherwise None
+        """
+        now = datetime.now()
+        with self.Session.begin() as session:
+            updated = session.execute(
+                update(SweepShard)
+                .where(SweepShard.run_id == run_id, SweepShard.shard == shard,
+                       SweepShard.owner == owner, SweepShard.status == 'running')
+                .values(status=status, error=error, not_before=not_before, lease_expires_at=None,
+                        updated_at=now, **counts)
+            ).rowcount
+            if not updated:
+                return None
+            remaining = dict(session.execute(
+                select(SweepShard.status, func.count())
+                .where(SweepShard.run_id == run_id)
+                .group_by(SweepShard.status)
+            ).all())
+            if remaining.get('pending') or remaining.get('running'):
+                return None
+            status = 'failed' if remaining.get('failed') else 'completed'
+            finished = session.execute(
+                update(SweepRun)
+                .where(SweepRun.run_id == run_id, SweepRun.status == 'running')
+                .values(status=status, finished_at=now)
+            ).rowcount
+            return status if finished else None
+
+    def get_state(self, key):
+        with self.Session() as session:
+            state = session.get(SweepState, key)
+            return state.value if state else None
+
+    def set_state(self, key, value):
+        with self.Session.begin() as session:
+            session.merge(SweepState(key=key, value=value))
+
+    def import_json(self, notifications_file, sweep_state_file=None):
+        """
+        Import schedules from the legacy contract_notifications.json file.
+        Contracts already in the store are replaced.
+
+        Returns:
+            Number of contracts imported
+        """
+        with open(notifications_file, 'r') as f:
+            notifications = json.load(f)
+        with self.Session.begin() as session:
+            for contract_id, schedule in notifications.items():
+                _upsert(session, contract_id, schedule, None)
+
+        if sweep_state_file and os.path.exists(sweep_state_file):
+            with open(sweep_state_file, 'r') as f:
+                watermark = json.load(f).get("watermark")
+            if watermark:
+                self.set_state("watermark", watermark)
+        return len(notifications)
+
+
+def _upsert(session, contract_id, schedule, user_id):
+    contract = session.get(ContractRecord, contract_id)
+    if contract is None:
+        contract = ContractRecord(contract_id=contract_id)
+        session.add(contract)
+    contract.user_id = user_id or contract.user_id
+    contract.recipient_email = schedule["recipient_email"]
+    contract.contract_name = schedule["contract_name"]
+    contract.termination_date = schedule["termination_date"]
+    contract.notifications = [
+        NotificationRecord(
+            days_before=n["days_before"],
+            notification_date=n["notification_date"],
+            sent=n["sent"],
+        )
+        for n in schedule["notifications"]
+    ]
+
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    # WAL lets the web workers read while a sweep is writing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _shard_to_dict(shard):
+    return {
+        "run_id": shard.run_id,
+        "shard": shard.shard,
+        "lower": shard.lower,
+        "upper": shard.upper,
+        "status": shard.status,
+        "owner": shard.owner,
+        "lease_expires_at": shard.lease_expires_at.isoformat() if shard.lease_expires_at else None,
+        "attempts": shard.attempts,
+        "not_before": shard.not_before.isoformat() if shard.not_before else None,
+        "contracts": shard.contracts,
+        "sent": shard.sent,
+        "failed": shard.failed,
+        "skipped": shard.skipped,
+        "error": shard.error,
+    }
+
+
+def _run_to_dict(run):
+    shards = [_shard_to_dict(shard) for shard in run.shards]
+    done = sum(1 for shard in shards if shard["status"] in ('done', 'failed'))
+    return {
+        "run_id": run.run_id,
+        "status": run.status,
+        "full": run.full,
+        "digest": run.digest,
+        "since": run.since,
+        "started_at": run.started_at.isoformat(),
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "progress": round(100 * done / len(shards)) if shards else 100,
+        "totals": {key: sum(shard[key] for shard in shards) for key in ("contracts", "sent", "failed", "skipped")},
+        "shards": shards,
+    }
+
+
+def _contract_to_dict(contract):
+    return {
+        "recipient_email": contract.recipient_email,
+        "contract_name": contract.contract_name,
+        "termination_date": contract.termination_date,
+        "notifications": [
+            {
+                "days_before": n.days_before,
+                "notification_date": n.notification_date,
+                "sent": n.sent,
+            }
+            for n in contract.notifications
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the contract notification store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Import the legacy JSON notification file")
+    migrate.add_argument("notifications_file", nargs="?", default="contract_notifications.json")
+    migrate.add_argument("--sweep-state", default="notification_sweep_state.json",
+                         help="Legacy sweep watermark file to import as well")
+    migrate.add_argument("--db-url", default=NOTIFICATION_DB_URL)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        store = NotificationStore(args.db_url)
+        count = store.import_json(args.notifications_file, args.sweep_state)
+        print(f"Imported {count} contract(s) from {args.notifications_file} into {args.db_url}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Sharded notification sweep.
+
+A run splits the users into SWEEP_SHARDS ranges of user ids. Workers, in any
+process or on any node sharing the notification database, claim shards
+through leases that expire, so a crashed worker's shard is picked up by
+another one. Each shard sweeps the contracts of its users and then sends
+their due notifications; emails are claimed by idempotency key before they
+are sent, so none goes out twice.
+
+Usage:
+    python -m features.notification_sweep start [--full] [--digest | --no-digest]
+    python -m features.notification_sweep work [run_id]
+    python -m features.notification_sweep status <run_id>
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from features.email_notification import get_notification_manager
+from features.send_email_to_users import SWEEP_WATERMARK_OVERLAP, sweep_users
+from services.firebase_service import db
+from services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Number of user id ranges a run is split into
+SWEEP_SHARDS = int(os.environ.get('SWEEP_SHARDS', 16))
+# Shards processed concurrently by each process that joins a run
+SWEEP_WORKERS = int(os.environ.get('SWEEP_WORKERS', 2))
+# A shard whose worker stops renewing its lease for this long is handed to another worker
+SWEEP_LEASE_SECONDS = int(os.environ.get('SWEEP_LEASE_SECONDS', 120))
+# A shard that failed this many times is given up and fails the run
+SWEEP_MAX_ATTEMPTS = int(os.environ.get('SWEEP_MAX_ATTEMPTS', 3))
+# A failed shard is retried after this many seconds, doubled after every further failure
+SWEEP_RETRY_SECONDS = int(os.environ.get('SWEEP_RETRY_SECONDS', 60))
+# Triggers within this long of a run still running join it instead of starting another
+SWEEP_RUN_WINDOW = timedelta(seconds=int(os.environ.get('SWEEP_RUN_WINDOW', 3600)))
+
+
+class LeaseLost(Exception):
+    """The worker's lease on a shard expired and another worker may hold it."""
+
+
+def plan_shards(count=SWEEP_SHARDS):
+    """
+    Split the users into at most `count` contiguous ranges of user ids
+    holding about as many users each. The first range has no lower bound
+    and the last no upper bound, so users created meanwhile are covered.
+
+    Returns:
+        List of (lower, upper) bounds, lower inclusive and upper exclusive
+    """
+    # Only the document names are read
+    user_ids = sorted(snapshot.id for snapshot in db.collection('users').select([]).stream())
+    count = max(1, min(count, len(user_ids)))
+    boundaries = sorted({user_ids[len(user_ids) * index // count] for index in range(1, count)})
+    return list(zip([None] + boundaries, boundaries + [None]))
+
+
+def start_run(full=False, digest=None, shards=SWEEP_SHARDS):
+    """
+    Start a sweep run, or join the run already started within SWEEP_RUN_WINDOW.
+
+    Returns:
+        The run id
+    """
+    manager = get_notification_manager()
+    store = manager.store
+    window_start = datetime.now() - SWEEP_RUN_WINDOW
+    run_id = store.active_run(window_start)
+    if run_id:
+        return run_id
+
+    abandoned = store.abandon_runs(window_start)
+    if abandoned:
+        logger.warning(f"Gave up {abandoned} sweep run(s) that did not finish within {SWEEP_RUN_WINDOW}")
+    watermark = None if full else manager.get_sweep_watermark()
+    if not watermark:
+        manager.drop_legacy_contracts()
+
+    run_id = uuid.uuid4().hex
+    store.create_run(run_id, plan_shards(shards), full=not watermark, digest=digest,
+                     since=watermark.isoformat() if watermark else None)
+    # Triggers racing each other all settle on the earliest run
+    active = store.active_run(window_start)
+    if active != run_id:
+        store.delete_run(run_id)
+        return active
+    logger.info(f"Started sweep run {run_id}")
+    return run_id
+
+
+def work(run_id, owner=None):
+    """
+    Claim and process shards of a run until none is left to claim.
+
+    Returns:
+        Number of shards processed
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    store = get_notification_manager().store
+    processed = 0
+    while True:
+        shard = store.claim_shard(run_id, owner, SWEEP_LEASE_SECONDS)
+        if shard is None:
+            # Shards handed back after a failure are retried once their backoff is over
+            retry_at = store.next_retry(run_id)
+            if retry_at is None:
+                return processed
+            time.sleep(max(0.0, (retry_at - datetime.now()).total_seconds()))
+            continue
+        _process_shard(shard, owner)
+        processed += 1
+
+
+def _process_shard(shard, owner):
+    manager = get_notification_manager()
+    store = manager.store
+    run = store.get_run(shard["run_id"])
+    key = (shard["run_id"], shard["shard"], owner)
+
+    def heartbeat():
+        if not store.renew_lease(*key, SWEEP_LEASE_SECONDS):
+            raise LeaseLost(f"Lost the lease on shard {shard['shard']} of run {shard['run_id']}")
+
+    with stage("notification", "shard", run_id=shard["run_id"], shard=shard["shard"]) as span:
+        try:
+            watermark = datetime.fromisoformat(run["since"]) if run["since"] else None
+            contracts, failed = sweep_users(watermark, shard["lower"], shard["upper"], heartbeat=heartbeat)
+            heartbeat()
+            sent = manager.send_scheduled_notifications(
+                digest=run["digest"], user_range=(shard["lower"], shard["upper"]), heartbeat=heartbeat
+            )
+            if failed:
+                # Retried like any failed shard; if it keeps failing the run fails and
+                # the watermark stays where it was, so the next run sweeps them again
+                raise RuntimeError(f"{len(failed)} contract(s) could not be scheduled: "
+                                   f"{', '.join(contract_id for contract_id, _ in failed[:5])}")
+            finished = store.finish_shard(*key, 'done', contracts=contracts, **sent)
+            span.update(contracts=contracts, **sent)
+        except LeaseLost as e:
+            span["outcome"] = "error"
+            logger.warning(str(e))
+            return
+        except Exception as e:
+            span["outcome"] = "error"
+            logger.error(f"Shard {shard['shard']} of sweep run {shard['run_id']} failed: {e}")
+            if shard["attempts"] >= SWEEP_MAX_ATTEMPTS:
+                finished = store.finish_shard(*key, 'failed', error=str(e))
+            else:
+                # Back off so a short outage does not use up every attempt at once
+                retry_at = datetime.now() + timedelta(seconds=SWEEP_RETRY_SECONDS * 2 ** (shard["attempts"] - 1))
+                finished = store.finish_shard(*key, 'pending', error=str(e), not_before=retry_at)
+
+    if finished == 'completed':
+        # Every shard swept from the same watermark, so the next run starts where this one did
+        started = datetime.fromisoformat(run["started_at"]).astimezone(timezone.utc)
+        manager.set_sweep_watermark(started - SWEEP_WATERMARK_OVERLAP)
+    if finished:
+        logger.info(f"Sweep run {shard['run_id']} {finished}")
+
+
+def start_workers(run_id, count=SWEEP_WORKERS):
+    """Process shards of a run on background threads of this process."""
+    for index in range(count):
+        threading.Thread(target=work, args=(run_id,), name=f'sweep-{run_id[:8]}-{index}', daemon=True).start()
+
+
+def trigger(full=False, digest=None):
+    """Start or join a run and work on it in the background; returns the run id immediately."""
+    run_id = start_run(full=full, digest=digest)
+    start_workers(run_id)
+    return run_id
+
+
+def get_run(run_id):
+    """Return the progress of a run, or None if it is unknown."""
+    return get_notification_manager().store.get_run(run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the sharded notification sweep.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    start = subcommands.add_parser("start", help="Start a run, or join the active one, and work on it")
+    start.add_argument("--full", action="store_true", help="Re-sweep every contract")
+    start.add_argument("--digest", action=argparse.BooleanOptionalAction, default=None,
+                       help="Send digests instead of one email per notification")
+    join = subcommands.add_parser("work", help="Work on a run until none of its shards is left")
+    join.add_argument("run_id", nargs="?", help="Defaults to the active run")
+    status = subcommands.add_parser("status", help="Print the progress of a run")
+    status.add_argument("run_id")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        run_id = start_run(full=args.full, digest=args.digest)
+        print(f"Processed {work(run_id)} shard(s) of run {run_id}")
+    elif args.command == "work":
+        run_id = args.run_id or get_notification_manager().store.active_run(datetime.now() - SWEEP_RUN_WINDOW)
+        if not run_id:
+            parser.error("no sweep run is active")
+        print(f"Processed {work(run_id)} shard(s) of run {run_id}")
+    else:
+        run = get_run(args.run_id)
+        if run is None:
+            parser.error(f"unknown run {args.run_id}")
+        print(json.dumps(run, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
-import google.generativeai as genai
 import json
 import os
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, Field, ValidationError
 from typing import List, Dict, Optional
-from features.email_notification import ContractNotificationManager
-from services.firebase_service import db
+from features.email_notification import get_notification_manager
+from services.firebase_service import db, document_cache, get_user, user_path
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from services.metrics import stage
 # import firebase_admin
 # from firebase_admin import credentials, firestore
 
@@ -13,6 +16,8 @@ from services.firebase_service import db
 # firebase_admin.initialize_app(cred)
 # db = firestore.client()
 
+logger = logging.getLogger(__name__)
+
 class LicenseAgreement(BaseModel):
     parties: Dict[str, str]
     licensing_terms: Dict[str, object]
@@ -28,16 +33,35 @@ class LicenseAgreement(BaseModel):
             raise ValueError("Both 'licensor' and 'licensee' must be specified.")
         return v
 
+class ContractSchedule(BaseModel):
+    """The fields of a contract document the notification sweep reads."""
+    parties: Dict[str, str]
+    licensing_terms: Dict[str, object]
+
+
+# Fields fetched per contract by the notification sweep
+SWEEP_FIELDS = ['parties', 'licensing_terms', 'updated_at']
+# Contracts scheduled per batch of user lookups
+USER_BATCH_SIZE = 100
+# The next incremental sweep re-reads contracts updated this long before the
+# previous sweep started, to tolerate clock skew and in-flight writes
+SWEEP_WATERMARK_OVERLAP = timedelta(seconds=int(os.environ.get('SWEEP_WATERMARK_OVERLAP', 300)))
+
+
+def contract_id_for(user_id, document_id):
+    """Stable notification id of a contract, so re-sweeping it never duplicates its schedule."""
+    return f"{user_id}_{document_id}"
+
 class LicenseAgreementExtractor:
     def __init__(self):
-        self.notification_manager = ContractNotificationManager()
+        self.notification_manager = get_notification_manager()
 
-    def schedule_notifications(self, data: Dict, email: str, contract_id: str = None):
-        success = self.notification_manager.schedule_notifications(data, email, contract_id)
+    def schedule_notifications(self, data: Dict, email: str, contract_id: str = None, user_id: str = None):
+        success = self.notification_manager.schedule_notifications(data, email, contract_id, user_id)
         if success:
-            print(f"Notification scheduled successfully for {email}")
+            logger.info(f"Notification scheduled successfully for {email}")
         else:
-            print("Failed to schedule notification")
+            logger.warning(f"Failed to schedule notification for {email}")
         return success
 
 def extract_data_from_firebase(user_id, document_id):
@@ -45,63 +69,176 @@ def extract_data_from_firebase(user_id, document_id):
     Extracts contract data and user email from Firestore and schedules notifications.
     """
     try:
-        doc_ref = db.collection('users').document(user_id).collection('documents').document(document_id)
-        doc = doc_ref.get()
-        user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
-
-        if doc.exists and user.exists:
-            doc_data = doc.to_dict()
-            user_data = user.to_dict()
+        doc_data = document_cache.get(f'{user_path(user_id)}/documents/{document_id}')
+        user_data = get_user(user_id)
+
+        if doc_data is not None and user_data is not None:
             user_email = user_data.get('email')
 
             if user_email:
                 try:
                     validated_data = LicenseAgreement.model_validate(doc_data).model_dump()
-                    file_name = document_id
-                    contract_id = f"{file_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    contract_id = contract_id_for(user_id, document_id)
 
                     extractor = LicenseAgreementExtractor()
-                    extractor.schedule_notifications(validated_data, user_email, contract_id)
+                    extractor.schedule_notifications(validated_data, user_email, contract_id, user_id)
                     return validated_data
 
                 except ValidationError as ve:
-                    print("Validation Error:", ve.model_dump_json(indent=2))
+                    logger.warning(f"Document {document_id} failed validation: {ve.errors()}")
                     return None
             else:
-                print(f"User email not found for user {user_id}")
+                logger.warning(f"User email not found for user {user_id}")
                 return None
 
         else:
-            if not doc.exists:
-                print(f"Document {document_id} not found.")
-            if not user.exists:
-                print(f"User {user_id} not found.")
+            if doc_data is None:
+                logger.warning(f"Document {document_id} not found.")
+            if user_data is None:
+                logger.warning(f"User {user_id} not found.")
             return None
 
     except Exception as e:
-        print(f"Error processing document {document_id}: {e}")
+        logger.exception(f"Error processing document {document_id}: {e}")
         return None
 
 def check_notifications():
-    notification_manager = ContractNotificationManager()
+    notification_manager = get_notification_manager()
     notification_manager.send_scheduled_notifications()
 
-def process_all_users_contracts():
-    """Process all contracts for all users."""
-    try:
-        print(db)
-        users_ref = db.collection('users').stream()
+def _load_user_emails(user_ids, user_emails):
+    """
+    Fill the per-sweep user map with the emails of users not looked up yet.
+    Users are read through the shared document cache, which fetches the ones
+    it does not hold with batched get_all calls.
+    """
+    missing = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in user_emails]
+    users = document_cache.get_many([user_path(user_id) for user_id in missing])
+    for user_id in missing:
+        user_emails[user_id] = (users[user_path(user_id)] or {}).get('email')
 
-        for user in users_ref:
-            user_id = user.id
-            docs_ref = db.collection('users').document(user_id).collection('documents').stream()
 
-            for doc in docs_ref:
-                extract_data_from_firebase(user_id, doc.id)
+def _schedule_batch(batch, user_emails, extractor):
+    """
+    Schedule a batch of contracts.
 
-    except Exception as e:
-        print(f"Error processing users and their contracts: {e}")
+    Returns:
+        The (contract id, updated_at) of the contracts that could not be
+        scheduled because of an error, to be swept again; contracts that
+        are invalid or whose owner has no email are skipped for good
+    """
+    _load_user_emails([user_id for user_id, _ in batch], user_emails)
+    failed = []
+    for user_id, doc in batch:
+        user_email = user_emails.get(user_id)
+        if not user_email:
+            logger.warning(f"User email not found for user {user_id}")
+            continue
+        try:
+            contract_data = ContractSchedule.model_validate(doc.to_dict() or {}).model_dump()
+            contract_id = contract_id_for(user_id, doc.id)
+            extractor.schedule_notifications(contract_data, user_email, contract_id, user_id)
+        except ValidationError as ve:
+            logger.warning(f"Document {doc.id} failed validation: {ve.errors()}")
+        except Exception as e:
+            logger.exception(f"Error processing document {doc.id}: {e}")
+            failed.append((contract_id_for(user_id, doc.id), (doc.to_dict() or {}).get('updated_at')))
+    return failed
+
+
+def process_all_users_contracts(full=False):
+    """
+    Process the contracts added or changed since the last sweep, or all
+    contracts for all users when full is True or no sweep has run yet.
+
+    Contracts are read with a single collection group query that only fetches
+    the fields needed for scheduling, and their owners are looked up in
+    batches, so the sweep costs about one read per contract.
+    """
+    with stage("notification", "sweep", full=full) as span:
+        try:
+            span["contracts"] = _sweep_contracts(full)
+        except Exception as e:
+            span["outcome"] = "error"
+            logger.exception(f"Error processing users and their contracts: {e}")
+
+
+def _sweep_contracts(full):
+    """Schedule the contracts of one sweep; returns how many were swept."""
+    manager = get_notification_manager()
+    sweep_started = datetime.now(timezone.utc)
+    watermark = None if full else manager.get_sweep_watermark()
+    if not watermark:
+        manager.drop_legacy_contracts()
+
+    swept, failed = sweep_users(watermark)
+
+    manager.set_sweep_watermark(next_watermark(sweep_started, failed))
+    logger.info(f"Swept {swept} contract(s) {'since ' + watermark.isoformat() if watermark else 'in full'}")
+    if failed:
+        logger.warning(f"{len(failed)} contract(s) could not be scheduled and will be swept again")
+    return swept
+
+
+def next_watermark(sweep_started, failed):
+    """
+    Return where the next incremental sweep starts: before this sweep
+    started, and before the earliest contract it failed to schedule.
+    """
+    updated = [updated_at for _, updated_at in failed if updated_at]
+    if len(updated) < len(failed):
+        # A failed contract without updated_at is only found again by a full sweep
+        logger.warning("A contract without updated_at could not be scheduled; run a full sweep to retry it")
+    return min([sweep_started] + updated) - SWEEP_WATERMARK_OVERLAP
+
+
+def sweep_users(watermark=None, lower=None, upper=None, heartbeat=None):
+    """
+    Schedule the contracts updated after the watermark (all of them when it
+    is None) of the users with lower <= user_id < upper (either bound None
+    for unbounded).
+
+    Args:
+        heartbeat: Called after every batch of USER_BATCH_SIZE contracts,
+            e.g. to renew a lease; an exception it raises stops the sweep
+
+    Returns:
+        (number of contracts swept, the (contract id, updated_at) of those
+        that could not be scheduled because of an error)
+    """
+    extractor = LicenseAgreementExtractor()
+    query = db.collection_group('documents')
+    if watermark:
+        # Only documents written by an upload since the last sweep carry a newer updated_at
+        query = query.where(filter=FieldFilter('updated_at', '>', watermark))
+    # Document paths order by user id first, so a range of users is a range of paths
+    if lower is not None:
+        query = query.where(filter=FieldFilter(FieldPath.document_id(), '>=', db.document(user_path(lower))))
+    if upper is not None:
+        query = query.where(filter=FieldFilter(FieldPath.document_id(), '<', db.document(user_path(upper))))
+    docs = query.select(SWEEP_FIELDS).stream()
+
+    user_emails = {}
+    batch = []
+    swept = 0
+    failed = []
+
+    for doc in docs:
+        user_ref = doc.reference.parent.parent
+        # Only users/{user_id}/documents/{document_id} holds contracts
+        if user_ref is None or user_ref.parent.id != 'users':
+            continue
+        batch.append((user_ref.id, doc))
+        swept += 1
+        if len(batch) >= USER_BATCH_SIZE:
+            failed += _schedule_batch(batch, user_emails, extractor)
+            batch = []
+            if heartbeat is not None:
+                heartbeat()
+
+    if batch:
+        failed += _schedule_batch(batch, user_emails, extractor)
+    return swept, failed
 
 if __name__ == '__main__':
     process_all_users_contracts()
@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import smtplib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.metrics import stage, RETRIES, BYTES
+
+logger = logging.getLogger(__name__)
+
+# Authenticated SMTP sessions kept open and reused; also the number of parallel senders
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+# Extra attempts for a message after a dropped connection or a temporary (4xx) failure
+SMTP_MAX_RETRIES = int(os.environ.get('SMTP_MAX_RETRIES', 2))
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+# Disable for a local SMTP stand-in without STARTTLS
+SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
+
+# Errors after which the connection is discarded and the message retried on a new one
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError, OSError)
+
+
+def _backoff(attempt):
+    """Wait before retry number attempt + 1: 1, 2, 4... seconds, at most 10."""
+    time.sleep(min(2 ** attempt, 10))
+
+
+class SMTPTransport:
+    """
+    Pool of authenticated SMTP sessions shared by parallel send workers.
+
+    Connections are opened lazily, up to pool_size, and reused for later
+    messages so the handshake, STARTTLS and login happen once per connection
+    instead of once per email. A dropped connection is replaced on the next
+    attempt.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=SMTP_USE_TLS,
+                 pool_size=SMTP_POOL_SIZE, max_retries=SMTP_MAX_RETRIES, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.pool_size = max(1, pool_size)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        # Bounds the number of open connections, idle or in use
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._lock = threading.Lock()
+        self.stats = {"connections": 0, "reconnects": 0, "sent": 0, "failed": 0}
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            _quietly_close(server)
+            raise
+        with self._lock:
+            self.stats["connections"] += 1
+        return server
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def _release(self, server, broken=False):
+        if broken:
+            _quietly_close(server)
+        else:
+            self._idle.put(server)
+        self._slots.release()
+
+    def send(self, message):
+        """
+        Send one email.message.Message, retrying on a new connection if the
+        current one drops and after temporary server errors.
+
+        Returns:
+            Boolean indicating success/failure
+        """
+        with stage("notification", "send") as span:
+            sent = self._send(message)
+            if not sent:
+                span["outcome"] = "error"
+            return sent
+
+    def _send(self, message):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                RETRIES.inc(service="smtp")
+            try:
+                server = self._acquire()
+            except Exception as e:
+                logger.warning(f"Could not connect to SMTP server {self.host}:{self.port}: {e}")
+                if attempt < self.max_retries:
+                    _backoff(attempt)
+                    continue
+                break
+
+            try:
+                server.send_message(message)
+            except smtplib.SMTPResponseException as e:
+                # 4xx replies are temporary; permanent 5xx failures are not retried
+                temporary = 400 <= e.smtp_code < 500
+                self._release(server, broken=temporary)
+                if not temporary:
+                    logger.error(f"SMTP server rejected message to {message['To']}: {e}")
+                    break
+                logger.warning(f"Temporary SMTP failure sending to {message['To']}: {e}")
+                # Give the server time to recover (greylisting, rate limits) before trying again
+                if attempt < self.max_retries:
+                    _backoff(attempt)
+            except smtplib.SMTPRecipientsRefused as e:
+                self._release(server)
+                logger.error(f"SMTP server refused recipients {message['To']}: {e}")
+                break
+            except _CONNECTION_ERRORS as e:
+                self._release(server, broken=True)
+                with self._lock:
+                    self.stats["reconnects"] += 1
+                logger.warning(f"SMTP connection lost sending to {message['To']}, reconnecting: {e}")
+            except Exception as e:
+                # Malformed message; the connection is still usable
+                self._release(server)
+                logger.error(f"Could not send message to {message['To']}: {e}")
+                break
+            else:
+                self._release(server)
+                with self._lock:
+                    self.stats["sent"] += 1
+                BYTES.inc(len(message.as_bytes()), kind="email")
+                return True
+
+        with self._lock:
+            self.stats["failed"] += 1
+        return False
+
+    def send_many(self, messages):
+        """
+        Send messages in parallel over the pooled connections.
+
+        Returns:
+            List of booleans, one per message in the same order
+        """
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(messages))) as executor:
+            return list(executor.map(self.send, messages))
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                server.quit()
+            except Exception:
+                _quietly_close(server)
+
+
+def _quietly_close(server):
+    try:
+        server.close()
+    except Exception:
+        pass
@@ -1,6 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from firebase_admin import auth
-from services.firebase_service import db
+from services.firebase_service import document_cache, get_app, get_user, user_path
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -12,10 +11,11 @@ def register():
         name = request.form['name']
 
         try:
-            user = auth.create_user(email=email, password=password)
+            from firebase_admin import auth
+            user = auth.create_user(email=email, password=password, app=get_app())
             session['user_email'] = email
             # Save user to Firestore
-            db.collection('users').document(user.uid).set({
+            document_cache.set(user_path(user.uid), {
                 'email': email,
                 'uid': user.uid,
                 'name': name
@@ -31,8 +31,9 @@ def login():
     if request.method == 'POST':
         email = request.form['email']
         try:
-            user = auth.get_user_by_email(email)
-            name = db.collection('users').document(user.uid).get().get('name')
+            from firebase_admin import auth
+            user = auth.get_user_by_email(email, app=get_app())
+            name = (get_user(user.uid) or {}).get('name')
             session['user_id'] = user.uid
             session['user_email'] = email
             session['name'] = name
@@ -1,11 +1,29 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, session, jsonify, current_app
+from werkzeug.utils import secure_filename
 import os
-from services.extract_service import extract_data
-from services.gemini_service import gemini_call
-from services.firebase_service import db
+import uuid
+from datetime import date, datetime
+from services.upload_service import upload_jobs
+from services.cache_service import content_cache, save_with_sha256
+from services.firebase_service import document_cache, is_admin
+from services.document_service import list_documents, count_documents, get_document, delete_document, DOCUMENT_PAGE_SIZE
+from services.analytics_service import get_analytics
+from services.export_service import export_documents, EXPORT_FORMATS
+from services.search_service import search_index, FIELDS as SEARCH_FIELDS, SEARCH_PAGE_SIZE
+from services.similarity_service import similarity_index
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+
+def _wants_json():
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def _bearer_token():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
 @dashboard_bp.route('/dashboard', methods=['GET', 'POST'])
 def dashboard():
     user_id = session.get('user_id')
@@ -16,38 +34,194 @@ def dashboard():
     if request.method == 'POST':
         files = request.files.getlist('file')
         if not files or files[0].filename == '':
+            if _wants_json():
+                return jsonify({"message": "No files selected.", "status": "error"}), 400
             flash('No files selected.', 'error')
             return redirect(request.url)
 
-        extracted_contents = []
+        saved_files = []
         for file in files:
             try:
-                # Extract text/content using our extract_service
-                content = extract_data(file, file.filename)
-                # Append user_id to filename to prevent conflicts
-                filename = f"{user_id}_{file.filename}"
-                file_path = os.path.join('uploads', filename)
-                file.save(file_path)
-                extracted_contents.append(content)
+                # Unique per upload: the job reads the file later, and uploads with the same
+                # (or the same secure_filename of a non-ASCII) name must not overwrite it first
+                filename = f"{user_id}_{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+                # Saved and hashed in one pass over the spooled upload
+                digest = save_with_sha256(file.stream, file_path)
+                saved_files.append((file.filename, file_path, digest))
             except Exception as e:
                 flash(f"Error processing {file.filename}: {str(e)}", 'error')
 
-        if not extracted_contents:
+        if not saved_files:
+            if _wants_json():
+                return jsonify({"message": "No valid files to process.", "status": "error"}), 400
             flash('No valid files to process.', 'error')
             return redirect(request.url)
 
-        # Process extracted content using Gemini AI call
-        data = gemini_call(extracted_contents)
-        # Save processed data to Firestore under user's documents subcollection
-        collection_path = f'users/{user_id}/documents'
-        if data:
-            db.collection(collection_path).add(data)
-        flash("File(s) processed and data saved successfully.", "success")
+        # Extraction and Gemini analysis run on the upload worker pool
+        job_id = upload_jobs.submit(user_id, saved_files)
+        if _wants_json():
+            return jsonify({
+                "job_id": job_id,
+                "status_url": url_for('dashboard.job_status', job_id=job_id),
+                "status": "queued"
+            }), 202
+        flash("File(s) queued for processing. Refresh to see the results.", "success")
         return redirect(url_for('dashboard.dashboard'))
 
-    # GET request: Fetch already uploaded documents for the logged-in user
-    collection_path = f'users/{session.get("user_id")}/documents'
-    documents = db.collection(collection_path).stream()
-    files_data = [doc.to_dict() for doc in documents]
+    # GET request: the document cards are loaded page by page from /api/documents
+    return render_template(
+        'dashboard.html',
+        document_count=count_documents(user_id),
+        page_size=DOCUMENT_PAGE_SIZE
+    )
+
+
+@dashboard_bp.route('/api/documents', methods=['GET'])
+def documents():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', DOCUMENT_PAGE_SIZE, type=int)
+    return jsonify(list_documents(user_id, cursor=cursor, limit=limit))
+
+
+@dashboard_bp.route('/api/search', methods=['GET'])
+def search():
+    """
+    Ranked search over the user's contracts. q searches every field and the
+    contract text; licensor, licensee, scope_of_use, prohibited_uses,
+    termination_grounds, governing_law and file_name search one field; from
+    and to bound the effective date.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    fields = {field: request.args[field] for field in SEARCH_FIELDS if request.args.get(field)}
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    results = search_index.search(
+        user_id,
+        query=request.args.get('q'),
+        fields=fields,
+        start_date=request.args.get('from') or None,
+        end_date=request.args.get('to') or None,
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify({"results": results, "offset": offset})
+
+
+@dashboard_bp.route('/api/documents/export', methods=['GET'])
+def export():
+    """
+    Stream the user's contracts, or every user's with ?scope=all for admins,
+    as NDJSON (default) or flattened CSV. Admins send a Firebase ID token
+    with the admin claim as "Authorization: Bearer <token>".
+
+    Query parameters: format, from and to (effective date range, YYYY-MM-DD),
+    licensor and licensee (case-insensitive substrings).
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"message": f"Unsupported format: {export_format}.", "status": "error"}), 400
+    if request.args.get('scope') == 'all':
+        if not is_admin(_bearer_token(), user_id):
+            return jsonify({"message": "Only admins can export every user's contracts.", "status": "error"}), 403
+        owner = None
+    else:
+        owner = user_id
+
+    try:
+        start_date, end_date = [
+            date.fromisoformat(request.args[name]).isoformat() if request.args.get(name) else None
+            for name in ('from', 'to')
+        ]
+    except ValueError:
+        return jsonify({"message": "Dates must be formatted as YYYY-MM-DD.", "status": "error"}), 400
+
+    stream = export_documents(
+        export_format,
+        user_id=owner,
+        start_date=start_date,
+        end_date=end_date,
+        licensor=request.args.get('licensor') or None,
+        licensee=request.args.get('licensee') or None,
+    )
+    filename = f"contracts-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(stream, mimetype=EXPORT_FORMATS[export_format],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@dashboard_bp.route('/api/documents/<document_id>', methods=['GET'])
+def document_details(document_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    document = get_document(user_id, document_id)
+    if document is None:
+        return jsonify({"message": "Document not found.", "status": "error"}), 404
+    return jsonify(document)
+
+
+@dashboard_bp.route('/api/documents/<document_id>', methods=['DELETE'])
+def remove_document(document_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    if not delete_document(user_id, document_id):
+        return jsonify({"message": "Document not found.", "status": "error"}), 404
+    search_index.remove_document(user_id, document_id)
+    similarity_index.remove_document(user_id, document_id)
+    from features.email_notification import get_notification_manager
+    from features.send_email_to_users import contract_id_for
+    # No more expiry reminders for a deleted contract
+    get_notification_manager().store.delete_contracts([contract_id_for(user_id, document_id)])
+    return jsonify({"message": "Document deleted.", "status": "success"})
+
+
+@dashboard_bp.route('/api/analytics', methods=['GET'])
+def analytics():
+    """
+    Portfolio aggregates of the user, or of every user with ?scope=all for
+    admins (see export).
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    if request.args.get('scope') == 'all':
+        if not is_admin(_bearer_token(), user_id):
+            return jsonify({"message": "Only admins can view every user's analytics.", "status": "error"}), 403
+        return jsonify(get_analytics())
+    return jsonify(get_analytics(user_id))
+
+
+@dashboard_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+
+    job = upload_jobs.get(job_id)
+    if job is None or job["user_id"] != user_id:
+        return jsonify({"message": "Job not found.", "status": "error"}), 404
+    return jsonify(job)
+
 
-    return render_template('dashboard.html', files_data=files_data)
+@dashboard_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if not session.get('user_id'):
+        return jsonify({"message": "Not logged in.", "status": "error"}), 401
+    stats = content_cache.stats()
+    stats["firestore"] = document_cache.stats()
+    return jsonify(stats)
@@ -0,0 +1,205 @@
+import os
+import random
+import argparse
+import logging
+from collections import defaultdict
+from services.firebase_service import db, user_path
+from services.contract_terms import contract_termination_date, parse_amount
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_ANALYTICS_PATH = 'analytics/global'
+# Every upload updates the global totals, so they are spread over this many
+# shard documents, each written at most about once per second by Firestore
+GLOBAL_ANALYTICS_SHARDS = int(os.environ.get('GLOBAL_ANALYTICS_SHARDS', 16))
+UNKNOWN = "Unknown"
+
+# Counters kept in every aggregate document, as {key: count or amount} maps
+BREAKDOWNS = ["expiring_by_month", "license_fees_by_licensor", "exclusivity", "governing_law"]
+
+
+def user_analytics_path(user_id):
+    return f'{user_path(user_id)}/analytics/portfolio'
+
+
+def global_shard_path(shard):
+    return f'{GLOBAL_ANALYTICS_PATH}/shards/{shard}'
+
+
+def _label(value):
+    if not isinstance(value, str) or not value.strip() or value.strip() == "N/A":
+        return UNKNOWN
+    return value.strip()
+
+
+def _exclusivity(value):
+    value = _label(value).lower()
+    if value == UNKNOWN.lower():
+        return "unknown"
+    if "non" in value:
+        return "non_exclusive"
+    if "exclusive" in value:
+        return "exclusive"
+    return "unknown"
+
+
+def contribution(data):
+    """
+    Return what one analyzed contract adds to the aggregates:
+    {"contracts": 1, breakdown: {key: amount}}.
+    """
+    data = data or {}
+    termination = contract_termination_date(data)
+    licensor = _label((data.get("parties") or {}).get("licensor"))
+    fee = parse_amount((data.get("financial_terms") or {}).get("license_fee"))
+    characteristics = (data.get("licensing_terms") or {}).get("license_characteristics") or {}
+    governing_law = ((data.get("contract_termination") or {}).get("dispute_resolution") or {}).get("governing_law")
+
+    return {
+        "contracts": 1,
+        "expiring_by_month": {termination.strftime("%Y-%m") if termination else UNKNOWN: 1},
+        "license_fees_by_licensor": {licensor: fee} if fee else {},
+        "exclusivity": {_exclusivity(characteristics.get("exclusivity")): 1},
+        "governing_law": {_label(governing_law): 1},
+    }
+
+
+def add_to_batch(batch, user_id, data, sign=1):
+    """
+    Queue the increments of a contract being saved (sign=1) or deleted
+    (sign=-1) on the user's and the global aggregates, so they are committed
+    atomically with the document itself. batch may also be a transaction.
+    """
+    add_many_to_batch(batch, user_id, [data], sign)
+
+
+def add_many_to_batch(batch, user_id, contracts, sign=1):
+    """
+    Like add_to_batch for several contracts of one user, summed into a single
+    write per aggregate document.
+    """
+    from google.cloud.firestore import SERVER_TIMESTAMP, Increment
+
+    delta = {}
+    for data in contracts:
+        _accumulate(delta, contribution(data))
+    if not delta:
+        return
+    update = {
+        "contracts": Increment(sign * delta["contracts"]),
+        # An empty map would replace the stored one instead of merging into it
+        **{
+            breakdown: {key: Increment(sign * amount) for key, amount in delta[breakdown].items()}
+            for breakdown in BREAKDOWNS if delta[breakdown]
+        },
+        "updated_at": SERVER_TIMESTAMP,
+    }
+    shard = random.randrange(GLOBAL_ANALYTICS_SHARDS)
+    for path in (user_analytics_path(user_id), global_shard_path(shard)):
+        batch.set(db.document(path), update, merge=True)
+
+
+def _present(aggregate):
+    """Drop entries decremented to zero and order months chronologically."""
+    result = {"contracts": int(aggregate.get("contracts") or 0), "updated_at": aggregate.get("updated_at")}
+    for breakdown in BREAKDOWNS:
+        values = {key: value for key, value in (aggregate.get(breakdown) or {}).items() if value}
+        if breakdown == "expiring_by_month":
+            values = dict(sorted(values.items()))
+        else:
+            values = dict(sorted(values.items(), key=lambda item: item[1], reverse=True))
+        result[breakdown] = values
+    return result
+
+
+def get_analytics(user_id=None):
+    """
+    Return the aggregates of a user with one document read, or the global
+    ones when user_id is None, summed over the GLOBAL_ANALYTICS_SHARDS shards.
+    """
+    if user_id is not None:
+        snapshot = db.document(user_analytics_path(user_id)).get()
+        return _present(snapshot.to_dict() if snapshot.exists else {})
+
+    references = [db.document(global_shard_path(shard)) for shard in range(GLOBAL_ANALYTICS_SHARDS)]
+    total = {}
+    updated = []
+    for snapshot in db.get_all(references):
+        if snapshot.exists:
+            shard = snapshot.to_dict()
+            _accumulate(total, {"contracts": shard.get("contracts") or 0,
+                                **{breakdown: shard.get(breakdown) or {} for breakdown in BREAKDOWNS}})
+            if shard.get("updated_at"):
+                updated.append(shard["updated_at"])
+    return _present({**total, "updated_at": max(updated, default=None)})
+
+
+def _accumulate(target, delta):
+    target["contracts"] = target.get("contracts", 0) + delta["contracts"]
+    for breakdown in BREAKDOWNS:
+        values = target.setdefault(breakdown, defaultdict(float if breakdown == "license_fees_by_licensor" else int))
+        for key, amount in delta[breakdown].items():
+            values[key] += amount
+
+
+def rebuild():
+    """
+    Recompute every aggregate from the stored contracts and overwrite them.
+    Contracts saved or deleted while the rebuild runs may be missed, so run
+    it while uploads are paused.
+
+    Returns:
+        Number of contracts aggregated
+    """
+    from google.cloud.firestore import SERVER_TIMESTAMP
+    from services.export_service import iter_documents
+
+    per_user = defaultdict(dict)
+    overall = {}
+    contracts = 0
+    # Held in memory by key (month, licensor, ...), not by contract
+    for user_id, _, data in iter_documents():
+        delta = contribution(data)
+        _accumulate(per_user[user_id], delta)
+        _accumulate(overall, delta)
+        contracts += 1
+
+    def document(aggregate):
+        document = {breakdown: dict(aggregate.get(breakdown, {})) for breakdown in BREAKDOWNS}
+        return {"contracts": aggregate.get("contracts", 0), **document, "updated_at": SERVER_TIMESTAMP}
+
+    # The global totals go to the first shard and the other shards are cleared
+    writes = [(global_shard_path(0), document(overall))]
+    writes += [(global_shard_path(shard), None) for shard in range(1, GLOBAL_ANALYTICS_SHARDS)]
+    writes += [(user_analytics_path(user_id), document(aggregate)) for user_id, aggregate in per_user.items()]
+    # Users whose last contract was deleted keep no aggregate
+    for snapshot in db.collection_group('analytics').stream():
+        owner = snapshot.reference.parent.parent
+        if owner is not None and owner.id not in per_user:
+            writes.append((snapshot.reference.path, None))
+
+    # Firestore commits at most 500 writes per batch
+    for start in range(0, len(writes), 500):
+        batch = db.batch()
+        for path, aggregate in writes[start:start + 500]:
+            if aggregate is None:
+                batch.delete(db.document(path))
+            else:
+                batch.set(db.document(path), aggregate)
+        batch.commit()
+    logger.info(f"Rebuilt analytics of {len(per_user)} user(s) from {contracts} contract(s)")
+    return contracts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the portfolio analytics aggregates.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("rebuild", help="Recompute every aggregate from the stored contracts")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Rebuilt analytics from {rebuild()} contract(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get('CONTENT_CACHE_PATH', 'contract_cache.db')
+# Upper bound on the total size of cached values, least recently used entries are evicted first
+CACHE_MAX_BYTES = int(os.environ.get('CONTENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 digest of a file on disk."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_with_sha256(stream, path):
+    """
+    Copy an uploaded stream to disk and hash it in the same pass, chunk by chunk.
+
+    Returns:
+        The hex SHA-256 digest of the saved bytes
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """
+    Persistent content-addressed cache of extracted text and Gemini results.
+
+    Entries are stored in SQLite and keyed by the SHA-256 of the uploaded bytes.
+    Analysis results are additionally keyed by the prompt/model version so that
+    changing the prompt never serves stale results.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _conn(self):
+        """
+        SQLite connection of this process, opened on first use. A connection
+        must not be carried across fork, so a forked worker opens its own.
+        Callers hold self._lock.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_last_access ON cache_entries (last_access)"
+            )
+            conn.commit()
+            self._connection = conn
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get_text(self, digest):
+        """Return the cached extracted text of a file, or None."""
+        return self._get(f"text:{digest}")
+
+    def put_text(self, digest, text):
+        self._put(f"text:{digest}", text)
+
+    def get_analysis(self, digest, version):
+        """Return the cached validated LicenseAgreement dict, or None."""
+        value = self._get(f"analysis:{version}:{digest}")
+        return json.loads(value) if value is not None else None
+
+    def put_analysis(self, digest, version, data):
+        self._put(f"analysis:{version}:{digest}", json.dumps(data, ensure_ascii=False))
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE cache_entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def _put(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {key}: {size} bytes exceeds the cache size limit")
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        while total > self.max_bytes:
+            key, size = self._conn.execute(
+                "SELECT key, size FROM cache_entries ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+
+content_cache = ContentCache()
@@ -0,0 +1,89 @@
+import os
+import re
+
+# Token budget of a single chunk sent to the model
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 6000))
+
+# Rough number of characters per token for English contract text
+CHARS_PER_TOKEN = 4
+
+# Lines that start a new clause: "1.", "1.2", "12)", "Section 4", "ARTICLE IV", "SCHEDULE A", ...
+_CLAUSE_HEADING = re.compile(
+    r'^\s*(?:\d+(?:\.\d+)*[.)]?\s+\S|\(?[a-z]\)\s+\S|(?:section|article|clause|schedule|exhibit|annex)\b)',
+    re.IGNORECASE
+)
+_SENTENCE_END = re.compile(r'(?<=[.;:!?])\s+')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting prompts."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_clauses(text):
+    """
+    Split contract text into clauses.
+    A clause ends at a blank line, a page break or before a numbered/titled heading.
+    """
+    clauses = []
+    current = []
+    for line in text.replace('\f', '\n\n').splitlines():
+        if not line.strip():
+            if current:
+                clauses.append('\n'.join(current))
+                current = []
+            continue
+        if current and _CLAUSE_HEADING.match(line):
+            clauses.append('\n'.join(current))
+            current = []
+        current.append(line.rstrip())
+    if current:
+        clauses.append('\n'.join(current))
+    return clauses
+
+
+def _split_oversized(clause, max_chars):
+    """Split a clause that does not fit in one chunk at sentence boundaries, then hard-wrap."""
+    pieces = []
+    current = ''
+    for sentence in _SENTENCE_END.split(clause):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_tokens=CHUNK_MAX_TOKENS):
+    """
+    Pack whole clauses into chunks of at most max_tokens (estimated).
+
+    Returns:
+        List of chunk strings in document order
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_len = 0
+    for clause in split_clauses(text):
+        pieces = [clause] if len(clause) <= max_chars else _split_oversized(clause, max_chars)
+        for piece in pieces:
+            # +2 for the blank line joining clauses
+            if current and current_len + 2 + len(piece) > max_chars:
+                chunks.append('\n\n'.join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece) + (2 if current_len else 0)
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
@@ -0,0 +1,144 @@
+import os
+import re
+import logging
+from collections import Counter
+from services.chunk_service import estimate_tokens
+from services.extract_service import PAGE_BREAK
+
+logger = logging.getLogger(__name__)
+
+# Drop signature blocks and exhibits before analysis. Exhibits can carry fee
+# schedules, so this is off unless enabled.
+COMPACT_DROP_SECTIONS = os.environ.get('COMPACT_DROP_SECTIONS', 'false').lower() in ('1', 'true', 'yes')
+# Bump whenever the compaction output changes so cached analyses are not reused
+COMPACTION_VERSION = "2" + ("d" if COMPACT_DROP_SECTIONS else "")
+
+# Number of lines at the top and bottom of a page checked for headers and footers
+HEADER_FOOTER_LINES = 3
+# A line is a header/footer when it repeats on at least this share of pages
+HEADER_FOOTER_MIN_RATIO = 0.5
+
+# "Page 3", "Page 3 of 12", "3 of 12" or "3/12"; never "$500", "100%", "12." or "(1)"
+_PAGE_NUMBER = re.compile(r'^[-\s]*(?:page\s*\d+(?:\s*of\s*\d+)?|\d+\s*(?:of|/)\s*\d+)[-\s]*$', re.IGNORECASE)
+# A bare "3" or "- 3 -", only taken for a page number as the first or last line of a page
+_BARE_PAGE_NUMBER = re.compile(r'^[-\s]*\d{1,4}[-\s]*$')
+_PAGE_REFERENCE = re.compile(r'\bpage\s*\d', re.IGNORECASE)
+_SIGNATURE_START = re.compile(r'^\s*in\s+witness\s+whereof', re.IGNORECASE)
+_SIGNATURE_LINE = re.compile(r'^\s*(?:by|name|title|date|signature|signed)\s*:?\s*_{3,}|^\s*_{5,}\s*$', re.IGNORECASE)
+_EXHIBIT_START = re.compile(r'^\s*(?:exhibit|schedule|appendix|annex|attachment)\s+[A-Z0-9]+\b', re.IGNORECASE)
+_INLINE_SPACE = re.compile(r'[ \t ]+')
+
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces, strip lines and keep at most one blank line in a row."""
+    lines = []
+    for line in text.splitlines():
+        line = _INLINE_SPACE.sub(' ', line).strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return '\n'.join(lines).strip()
+
+
+def _line_key(line):
+    """Header/footer lines such as "Acme License - Page 3" differ only by the page number."""
+    line = line.lower()
+    if _PAGE_REFERENCE.search(line):
+        return re.sub(r'\d+', '#', line)
+    return line
+
+
+def remove_headers_and_footers(pages):
+    """
+    Remove lines repeated at the top or bottom of most pages, and page
+    numbers among those top and bottom lines. A bare number is only removed
+    as the very first or last line of a page of a multi-page text.
+
+    Args:
+        pages: List of page texts with normalized whitespace
+    """
+    page_lines = [page.splitlines() for page in pages]
+    # Indexes of the first and last non-empty lines of every page
+    edges = []
+    outermost = []
+    for lines in page_lines:
+        content = [i for i, line in enumerate(lines) if line]
+        edges.append(set(content[:HEADER_FOOTER_LINES] + content[-HEADER_FOOTER_LINES:]))
+        outermost.append(set(content[:1] + content[-1:]) if len(page_lines) >= 2 else set())
+
+    repeated = set()
+    if len(page_lines) >= 2:
+        counts = Counter()
+        for lines, edge in zip(page_lines, edges):
+            counts.update({_line_key(lines[i]) for i in edge})
+        min_pages = max(2, HEADER_FOOTER_MIN_RATIO * len(page_lines))
+        repeated = {key for key, count in counts.items() if count >= min_pages}
+
+    cleaned = []
+    for lines, edge, outer in zip(page_lines, edges, outermost):
+        kept = [
+            line for i, line in enumerate(lines)
+            if not (i in edge and (_PAGE_NUMBER.match(line) or _line_key(line) in repeated))
+            and not (i in outer and _BARE_PAGE_NUMBER.match(line))
+        ]
+        cleaned.append(normalize_whitespace('\n'.join(kept)))
+    return cleaned
+
+
+def dedupe_paragraphs(paragraphs):
+    """Drop paragraphs identical (ignoring case and spacing) to an earlier one."""
+    seen = set()
+    unique = []
+    for paragraph in paragraphs:
+        key = ' '.join(paragraph.lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(paragraph)
+    return unique
+
+
+def drop_low_information_sections(paragraphs):
+    """Drop signature blocks and everything from the first exhibit onwards."""
+    kept = []
+    in_signature_block = False
+    for paragraph in paragraphs:
+        if _EXHIBIT_START.match(paragraph):
+            break
+        if _SIGNATURE_START.match(paragraph):
+            in_signature_block = True
+        if in_signature_block or _SIGNATURE_LINE.search(paragraph):
+            continue
+        kept.append(paragraph)
+    return kept
+
+
+def compact_pages(pages, drop_sections=COMPACT_DROP_SECTIONS):
+    """
+    Compact extracted contract pages before they are sent to Gemini.
+
+    Returns:
+        Tuple of (compacted text, report) where report holds the character and
+        estimated token counts before and after compaction
+    """
+    original = PAGE_BREAK.join(pages)
+    pages = remove_headers_and_footers([normalize_whitespace(page) for page in pages])
+
+    paragraphs = [p.strip() for page in pages for p in page.split('\n\n') if p.strip()]
+    paragraphs = dedupe_paragraphs(paragraphs)
+    if drop_sections:
+        paragraphs = drop_low_information_sections(paragraphs)
+    compacted = '\n\n'.join(paragraphs)
+
+    report = {
+        "chars_before": len(original),
+        "chars_after": len(compacted),
+        "tokens_before": estimate_tokens(original),
+        "tokens_after": estimate_tokens(compacted),
+    }
+    report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+    return compacted, report
+
+
+def compact_text(text, drop_sections=COMPACT_DROP_SECTIONS):
+    """Compact extracted text whose pages are separated by PAGE_BREAK."""
+    return compact_pages(text.split(PAGE_BREAK), drop_sections=drop_sections)
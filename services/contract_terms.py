@@ -0,0 +1,104 @@
+import re
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%B %d, %Y",
+    "%d %B %Y"
+]
+
+_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|m|million|mm|bn|billion)?\b", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6, "bn": 1e9, "billion": 1e9}
+
+
+def parse_date(date_str):
+    """
+    Parse date string into a date object.
+    Tries multiple formats to be flexible.
+    """
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def calculate_termination_date(effective_date, term_duration):
+    """
+    Calculate termination date based on effective date and term duration.
+
+    Args:
+        effective_date: Start date of the contract
+        term_duration: String describing the duration (e.g., "12 months", "1 year")
+
+    Returns:
+        datetime.date object representing termination date
+    """
+    try:
+        term_lower = term_duration.lower()
+
+        # Check for years
+        if "year" in term_lower:
+            years = int(term_lower.split()[0])
+            return datetime(effective_date.year + years, effective_date.month, effective_date.day).date()
+
+        # Check for months
+        elif "month" in term_lower:
+            months = int(term_lower.split()[0])
+            new_month = effective_date.month + months
+            years_to_add = (new_month - 1) // 12
+            final_month = ((new_month - 1) % 12) + 1
+            return datetime(effective_date.year + years_to_add, final_month, effective_date.day).date()
+
+        # Check for days
+        elif "day" in term_lower:
+            days = int(term_lower.split()[0])
+            return effective_date + timedelta(days=days)
+
+        # If exact date is specified
+        elif "until" in term_lower:
+            date_part = term_lower.split("until", 1)[1].strip()
+            return parse_date(date_part)
+
+        else:
+            logger.warning(f"Unrecognized term duration format: {term_duration}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error calculating termination date: {e}")
+        return None
+
+
+def contract_termination_date(data):
+    """Return the termination date of an analyzed contract, or None if it cannot be worked out."""
+    terms = data.get("licensing_terms") or {}
+    effective_date = parse_date(terms.get("effective_date") or "")
+    term_duration = terms.get("term_duration") or ""
+    if not effective_date or not term_duration or term_duration == "N/A":
+        return None
+    return calculate_termination_date(effective_date, term_duration)
+
+
+def parse_amount(text):
+    """
+    Return the first amount in a fee description as a float, e.g. 25000.0
+    for "$25,000" or 1500000.0 for "USD 1.5 million", or None. The currency
+    is ignored.
+    """
+    if not isinstance(text, str):
+        return None
+    for match in _AMOUNT.finditer(text):
+        # Percentages are royalty rates, not amounts
+        if text[match.end(1):].lstrip().startswith("%"):
+            continue
+        amount = float(match.group(1).replace(",", ""))
+        if match.group(2):
+            amount *= _MULTIPLIERS[match.group(2).lower()]
+        return amount
+    return None
@@ -0,0 +1,128 @@
+import os
+import threading
+from cachetools import TTLCache
+from services.firebase_service import db, document_cache, user_path
+from services import analytics_service as analytics
+
+# Fields shown on the dashboard cards and used by its filters and sorting
+SUMMARY_FIELDS = [
+    "file_name",
+    "parties.licensor",
+    "parties.licensee",
+    "licensing_terms.effective_date",
+    "licensing_terms.term_duration",
+    "licensing_terms.scope_of_use",
+    "contract_termination.termination_grounds",
+    "contract_termination.dispute_resolution.governing_law",
+]
+
+DOCUMENT_PAGE_SIZE = int(os.environ.get('DOCUMENT_PAGE_SIZE', 24))
+DOCUMENT_PAGE_SIZE_MAX = 100
+# Listings are also invalidated on upload, so the TTL only bounds staleness
+# from writes made outside this process
+DOCUMENT_CACHE_TTL = int(os.environ.get('DOCUMENT_CACHE_TTL', 300))
+DOCUMENT_CACHE_USERS = int(os.environ.get('DOCUMENT_CACHE_USERS', 1024))
+
+# user_id -> {(cursor, limit) or "count": cached value}
+_cache = TTLCache(maxsize=DOCUMENT_CACHE_USERS, ttl=DOCUMENT_CACHE_TTL)
+_cache_lock = threading.Lock()
+# Bumped on invalidation so a load that raced with an upload is not cached
+_generations = {}
+
+
+def _collection(user_id):
+    return db.collection(f'users/{user_id}/documents')
+
+
+def _cached(user_id, key, load):
+    with _cache_lock:
+        entries = _cache.get(user_id)
+        if entries is not None and key in entries:
+            return entries[key]
+        generation = _generations.get(user_id, 0)
+    value = load()
+    with _cache_lock:
+        if _generations.get(user_id, 0) == generation:
+            _cache.setdefault(user_id, {})[key] = value
+    return value
+
+
+def invalidate_user(user_id):
+    """Drop the cached listings of a user, e.g. after they upload documents."""
+    with _cache_lock:
+        _cache.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def list_documents(user_id, cursor=None, limit=DOCUMENT_PAGE_SIZE):
+    """
+    Return one page of a user's documents with only the summary fields.
+
+    Documents are ordered by id; pass the returned next_cursor to fetch the
+    following page.
+
+    Returns:
+        Dict with "documents" (list of summaries including their "id") and
+        "next_cursor" (None on the last page)
+    """
+    limit = max(1, min(limit, DOCUMENT_PAGE_SIZE_MAX))
+
+    def load():
+        from google.cloud.firestore_v1.field_path import FieldPath
+        query = _collection(user_id).select(SUMMARY_FIELDS).order_by(FieldPath.document_id())
+        if cursor:
+            query = query.start_after({FieldPath.document_id(): cursor})
+        # One extra document tells whether there is a next page
+        snapshots = list(query.limit(limit + 1).stream())
+        documents = [{"id": doc.id, **doc.to_dict()} for doc in snapshots[:limit]]
+        next_cursor = documents[-1]["id"] if len(snapshots) > limit else None
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    return _cached(user_id, (cursor, limit), load)
+
+
+def count_documents(user_id):
+    """Return the number of documents of a user with an aggregation query."""
+    def load():
+        result = _collection(user_id).count().get()
+        return int(result[0][0].value)
+
+    return _cached(user_id, "count", load)
+
+
+def get_document(user_id, document_id):
+    """Return the full analysis of one of the user's documents, or None."""
+    data = document_cache.get(f'{user_path(user_id)}/documents/{document_id}')
+    if data is None:
+        return None
+    return {"id": document_id, **data}
+
+
+def delete_document(user_id, document_id):
+    """
+    Delete one of the user's documents, taking it out of the portfolio
+    analytics in the same transaction that reads it, so concurrent deletes
+    of the same document subtract it only once.
+
+    Returns:
+        False if the document does not exist
+    """
+    from google.cloud.firestore import transactional
+
+    path = f'{user_path(user_id)}/documents/{document_id}'
+    reference = db.document(path)
+
+    @transactional
+    def delete(transaction):
+        snapshot = reference.get(transaction=transaction)
+        if not snapshot.exists:
+            return False
+        transaction.delete(reference)
+        analytics.add_to_batch(transaction, user_id, snapshot.to_dict(), sign=-1)
+        return True
+
+    if not delete(db.transaction()):
+        return False
+    document_cache.invalidate(path)
+    invalidate_user(user_id)
+    return True
@@ -0,0 +1,151 @@
+import io
+import os
+import csv
+import json
+from datetime import datetime
+from services.firebase_service import db, user_path
+
+# Documents read per Firestore page while streaming an export
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', 500))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Joins the items of list fields in a CSV cell, as the single-contract export does
+CSV_LIST_SEPARATOR = " | "
+# Cells starting with these are evaluated as formulas by spreadsheet applications
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_columns():
+    """
+    Flattened CSV columns: the owner and document id, the file name, every
+    field of the analysis schema as a dotted path, and the update time.
+    """
+    from services.gemini_service import SCHEMA
+
+    def flatten(schema, prefix=""):
+        for key, value in schema.items():
+            if isinstance(value, dict):
+                yield from flatten(value, f"{prefix}{key}.")
+            else:
+                yield f"{prefix}{key}"
+
+    return ["user_id", "id", "file_name", *flatten(SCHEMA), "updated_at"]
+
+
+def _get_path(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _matches_party(data, field, value):
+    if not value:
+        return True
+    party = _get_path(data, f"parties.{field}")
+    return isinstance(party, str) and value.lower() in party.lower()
+
+
+def iter_documents(user_id=None, start_date=None, end_date=None, licensor=None, licensee=None,
+                   page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield (user_id, document_id, data) for the contracts of one user, or of
+    every user when user_id is None, reading them page by page so only one
+    page is held in memory.
+
+    Args:
+        start_date, end_date: Inclusive ISO dates (YYYY-MM-DD) the effective
+            date must fall between; filtered by the Firestore query
+        licensor, licensee: Case-insensitive substrings of the parties;
+            filtered as the pages are read
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from google.cloud.firestore_v1.field_path import FieldPath
+
+    if user_id is None:
+        query = db.collection_group('documents')
+    else:
+        query = db.collection(f'{user_path(user_id)}/documents')
+    if start_date or end_date:
+        if start_date:
+            query = query.where(filter=FieldFilter('licensing_terms.effective_date', '>=', start_date))
+        if end_date:
+            query = query.where(filter=FieldFilter('licensing_terms.effective_date', '<=', end_date))
+        # A range filter must be the first ordering; the document id breaks ties for the cursor
+        query = query.order_by('licensing_terms.effective_date')
+    query = query.order_by(FieldPath.document_id())
+
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        snapshots = list(page.limit(page_size).stream())
+        for snapshot in snapshots:
+            owner = snapshot.reference.parent.parent
+            # Only users/{user_id}/documents/{document_id} holds contracts
+            if owner is None or owner.parent.id != 'users':
+                continue
+            data = snapshot.to_dict() or {}
+            if _matches_party(data, "licensor", licensor) and _matches_party(data, "licensee", licensee):
+                yield owner.id, snapshot.id, data
+        if len(snapshots) < page_size:
+            return
+        last = snapshots[-1]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        value = CSV_LIST_SEPARATOR.join(str(item) for item in value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, dict):
+        value = json.dumps(value, default=_json_default)
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        # Contract text is untrusted; a leading quote keeps spreadsheets from running it as a formula
+        return "'" + value
+    return value
+
+
+def export_ndjson(documents):
+    """Yield one JSON object per line for each (user_id, document_id, data)."""
+    for user_id, document_id, data in documents:
+        yield json.dumps({"user_id": user_id, "id": document_id, **data}, default=_json_default) + "\n"
+
+
+def export_csv(documents):
+    """Yield a header and one flattened row per (user_id, document_id, data)."""
+    columns = csv_columns()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for user_id, document_id, data in documents:
+        row = {"user_id": user_id, "id": document_id}
+        writer.writerow([
+            _csv_value(row[column] if column in row else _get_path(data, column))
+            for column in columns
+        ])
+        # Hand each row out as soon as it is written instead of building the file
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_documents(export_format, **filters):
+    """Return a generator of the export in the given format ("ndjson" or "csv")."""
+    documents = iter_documents(**filters)
+    if export_format == "csv":
+        return export_csv(documents)
+    return export_ndjson(documents)
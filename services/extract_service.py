@@ -1,22 +1,209 @@
+import io
+import os
+import mmap
+import time
+import codecs
+import threading
+import contextlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
 import PyPDF2
-import docx
+
+logger = logging.getLogger(__name__)
+
+# Separator placed between the pages of extracted PDF text
+PAGE_BREAK = '\f'
+# Pages beyond this cap are ignored
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 500))
+# Seconds allowed for extracting a single page in parallel mode
+PDF_PAGE_TIMEOUT = float(os.environ.get('PDF_PAGE_TIMEOUT', 10))
+# Documents with at least this many pages are extracted in parallel
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 32))
+# Number of pages handed to a worker process at a time
+PDF_PAGES_PER_TASK = int(os.environ.get('PDF_PAGES_PER_TASK', 8))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 2))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Return the shared page extraction process pool, creating it on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork belongs to the parent process
+        if _pool is None or _pool_pid != os.getpid():
+            # Spawned workers do not inherit the threads and sockets of the web worker
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _recycle_pool(pool):
+    """
+    Kill the workers of a pool with a hung task and replace it with a new one
+    on next use. Other documents extracting on it fall back to serial parsing.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _started_result(future, timeout, poll=0.1):
+    """
+    Wait for the result of a pool task, allowing it `timeout` seconds from
+    when it is handed to the workers rather than from now: tasks of
+    concurrent uploads queue for the same workers.
+    """
+    deadline = None
+    while True:
+        if deadline is None and future.running():
+            deadline = time.monotonic() + timeout
+        remaining = poll if deadline is None else deadline - time.monotonic()
+        if remaining <= 0:
+            raise FutureTimeoutError()
+        wait([future], timeout=min(remaining, poll))
+        if future.done():
+            return future.result()
+
+
+# Chunk size used to decode text files incrementally
+TEXT_READ_CHUNK_SIZE = 1024 * 1024
+
+
+@contextlib.contextmanager
+def _open_pdf(source):
+    """
+    Open a PdfReader over a path or bytes. Files on disk are memory-mapped, so
+    the document is paged in by the OS instead of being copied into memory
+    (PyPDF2 reads a path into a BytesIO).
+    """
+    if isinstance(source, bytes):
+        yield PyPDF2.PdfReader(io.BytesIO(source))
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield PyPDF2.PdfReader(f)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield PyPDF2.PdfReader(mapped)
+
+
+def _extract_page_range(source, start, stop):
+    """Extract the text of pages [start, stop) in a worker process."""
+    with _open_pdf(source) as reader:
+        return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+def _pdf_source(file):
+    """
+    Return something a worker process can open the PDF from:
+    the path of the file when it lives on disk, otherwise its bytes.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    name = getattr(file, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    file.seek(0)
+    return file.read()
+
+
+def iter_pdf_pages(file, max_pages=PDF_MAX_PAGES, page_timeout=PDF_PAGE_TIMEOUT, parallel=None):
+    """
+    Yield the text of each page of a PDF, in order.
+
+    Args:
+        file: Path or binary file object of the PDF
+        max_pages: Pages beyond this cap are skipped
+        page_timeout: Seconds allowed per page in parallel mode, counted from
+                      when a page range starts; a range that runs over fails
+                      the extraction with TimeoutError
+        parallel: Extract page ranges on the process pool. Defaults to True for
+                  documents with at least PDF_PARALLEL_MIN_PAGES pages.
+    """
+    source = _pdf_source(file)
+    with _open_pdf(source) as reader:
+        yield from _iter_reader_pages(reader, source, max_pages, page_timeout, parallel)
+
+
+def _iter_reader_pages(reader, source, max_pages, page_timeout, parallel):
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        logger.warning(f"PDF has {page_count} pages, only the first {max_pages} will be extracted")
+        page_count = max_pages
+
+    if parallel is None:
+        parallel = page_count >= PDF_PARALLEL_MIN_PAGES
+
+    if not parallel:
+        for i in range(page_count):
+            yield reader.pages[i].extract_text() or ''
+        return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    executor = _get_pool()
+    futures = [executor.submit(_extract_page_range, source, start, stop) for start, stop in ranges]
+    try:
+        # Results are consumed in submission order so pages come out in document order
+        for (start, stop), future in zip(ranges, futures):
+            try:
+                # A task counts as running once it is in the pool's call queue, where it can
+                # still wait for one other range (of at most PDF_PAGES_PER_TASK pages) to finish
+                pages = _started_result(future, page_timeout * (stop - start + PDF_PAGES_PER_TASK))
+            except FutureTimeoutError:
+                # The worker is stuck on the page; parsing it here would hang as well
+                _recycle_pool(executor)
+                raise TimeoutError(f"Timed out extracting pages {start + 1}-{stop}")
+            except Exception as e:
+                # e.g. the pool was recycled because of another document
+                logger.warning(f"Error extracting pages {start + 1}-{stop} in parallel, parsing them here: {e}")
+                pages = [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+            yield from pages
+    finally:
+        # Stop queued work if the consumer gave up early
+        for future in futures:
+            future.cancel()
 
 
 def extract_text_from_pdf(file):
-    reader = PyPDF2.PdfReader(file)
-    text = ''
-    for page in reader.pages:
-        text += page.extract_text() or ''
-    return text.strip()
+    return PAGE_BREAK.join(iter_pdf_pages(file)).strip()
 
 
 def extract_text_from_docx(file):
+    # python-docx is slow to import and only needed for DOCX uploads
+    import docx
     doc = docx.Document(file)
     return '\n'.join([para.text for para in doc.paragraphs])
 
 
 def extract_text_from_txt(file):
-    return file.read().decode('utf-8', errors='ignore').strip()
+    # Decoded in chunks so the raw bytes and the text are never both held in full
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    parts = [decoder.decode(chunk) for chunk in iter(lambda: file.read(TEXT_READ_CHUNK_SIZE), b'')]
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts).strip()
+
+
+def iter_pages(file, filename):
+    """
+    Yield the text of a document page by page.
+    PDFs are streamed per page, DOCX and TXT files are a single page.
+    """
+    extension = filename.rsplit('.', 1)[-1].lower()
+
+    if extension == 'pdf':
+        yield from iter_pdf_pages(file)
+    else:
+        yield extract_data(file, filename)
 
 
 def extract_data(file, filename):
@@ -30,4 +217,3 @@ def extract_data(file, filename):
         return extract_text_from_txt(file)
     else:
         raise ValueError(f"Unsupported file type: {extension}")
-
@@ -1,14 +1,202 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
+import copy
+import threading
+from concurrent.futures import Future
+from cachetools import TTLCache
+
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS', 'firebase_credentials.json')
+
+# Documents (e.g. user profiles) kept in the read-through cache, and for how long
+FIRESTORE_CACHE_SIZE = int(os.environ.get('FIRESTORE_CACHE_SIZE', 10000))
+FIRESTORE_CACHE_TTL = int(os.environ.get('FIRESTORE_CACHE_TTL', 300))
+# Documents fetched per batched get_all call
+FIRESTORE_BATCH_SIZE = 100
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_app():
+    """Return the default Firebase app, initializing it from the credentials file on first use."""
+    import firebase_admin
+    from firebase_admin import credentials
+    with _client_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            return firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+
+
+def get_db():
+    """
+    Return the Firestore client of this process, creating it on first use.
+
+    The Firebase app and its client are built lazily so importing the app is
+    cheap, and rebuilt after a fork because gRPC channels cannot be shared
+    with a parent process.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    app = get_app()
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            from google.cloud import firestore
+            # Built directly instead of firebase_admin.firestore.client(), which
+            # would hand a forked worker the client cached by its parent
+            _client = firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+            _client_pid = pid
+        return _client
 
-db = None
 
 def init_firebase():
-    cred = credentials.Certificate("firebase_credentials.json")
-    firebase_admin.initialize_app(cred)
-    global db
-    db = firestore.client()
+    """Create the Firestore client eagerly, e.g. in a script."""
+    return get_db()
+
+
+class _LazyClient:
+    """Stands in for the Firestore client until it is first used."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+# Modules import db at import time; attribute access resolves the real client
+db = _LazyClient()
+
+
+class DocumentCache:
+    """
+    Read-through cache of Firestore documents addressed by path
+    (e.g. "users/<uid>").
+
+    Entries expire after a TTL and the least recently used ones are evicted
+    when the cache is full. Writes made through the cache invalidate the
+    document, and concurrent misses for the same document share one fetch.
+    Missing documents are cached as None.
+    """
+
+    def __init__(self, maxsize=FIRESTORE_CACHE_SIZE, ttl=FIRESTORE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # path -> Future of the fetch in flight
+        self._inflight = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def get(self, path):
+        """Return the data of the document at path, or None if it does not exist."""
+        return self.get_many([path])[path]
+
+    def get_many(self, paths):
+        """
+        Return {path: data or None} for the given document paths. Documents not
+        cached are fetched with batched get_all calls.
+        """
+        results = {}
+        waiting = {}
+        to_fetch = {}
+        with self._lock:
+            for path in dict.fromkeys(paths):
+                if path in self._cache:
+                    self._hits += 1
+                    results[path] = self._cache[path]
+                elif path in self._inflight:
+                    self._coalesced += 1
+                    waiting[path] = self._inflight[path]
+                else:
+                    self._misses += 1
+                    to_fetch[path] = self._inflight[path] = Future()
+
+        if to_fetch:
+            self._fetch(to_fetch)
+        for path, future in {**to_fetch, **waiting}.items():
+            results[path] = future.result()
+        return {path: copy.deepcopy(results[path]) for path in paths}
+
+    def _fetch(self, futures):
+        paths = list(futures)
+        try:
+            for start in range(0, len(paths), FIRESTORE_BATCH_SIZE):
+                batch = paths[start:start + FIRESTORE_BATCH_SIZE]
+                fetched = {path: None for path in batch}
+                for snapshot in db.get_all([db.document(path) for path in batch]):
+                    fetched[snapshot.reference.path] = snapshot.to_dict() if snapshot.exists else None
+                with self._lock:
+                    for path, data in fetched.items():
+                        # A write may have invalidated the document while it was being fetched
+                        if self._inflight.get(path) is futures[path]:
+                            self._cache[path] = data
+                            del self._inflight[path]
+                for path, data in fetched.items():
+                    futures[path].set_result(data)
+        except Exception as e:
+            with self._lock:
+                for path, future in futures.items():
+                    if self._inflight.get(path) is future:
+                        del self._inflight[path]
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+    def invalidate(self, path):
+        with self._lock:
+            self._cache.pop(path, None)
+            self._inflight.pop(path, None)
+
+    def set(self, path, data, merge=False):
+        db.document(path).set(data, merge=merge)
+        self.invalidate(path)
+
+    def update(self, path, data):
+        db.document(path).update(data)
+        self.invalidate(path)
+
+    def delete(self, path):
+        db.document(path).delete()
+        self.invalidate(path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._cache),
+                "max_entries": int(self._cache.maxsize),
+                "ttl": self._cache.ttl,
+            }
+
+
+document_cache = DocumentCache()
+
+
+def user_path(user_id):
+    return f'users/{user_id}'
 
 
+def get_user(user_id):
+    """Return the profile of a user through the document cache, or None."""
+    return document_cache.get(user_path(user_id))
 
 
+def is_admin(id_token, user_id):
+    """
+    Whether a Firebase ID token is valid, not revoked, issued to user_id and
+    carries the admin custom claim, set with
+    auth.set_custom_user_claims(uid, {"admin": True}).
+    """
+    if not id_token:
+        return False
+    from firebase_admin import auth
+    try:
+        claims = auth.verify_id_token(id_token, app=get_app(), check_revoked=True)
+    except Exception:
+        return False
+    return claims.get('uid') == user_id and claims.get('admin') is True
@@ -0,0 +1,165 @@
+import os
+import random
+import threading
+import time
+import logging
+from services.metrics import stage, RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute allowed by our Gemini API quota
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 60))
+# Number of requests that may be sent back to back before the rate limit applies
+GEMINI_RATE_BURST = int(os.environ.get('GEMINI_RATE_BURST', 5))
+# Maximum number of requests in flight at the same time
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 8))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', 4))
+GEMINI_BACKOFF_BASE = float(os.environ.get('GEMINI_BACKOFF_BASE', 1.0))
+GEMINI_BACKOFF_MAX = float(os.environ.get('GEMINI_BACKOFF_MAX', 30.0))
+# Consecutive failures that open the circuit, and how long it stays open
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get('GEMINI_BREAKER_THRESHOLD', 5))
+GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', 30.0))
+
+
+def retryable_errors():
+    """429 and 5xx responses are worth retrying, anything else is a problem with the request."""
+    # Imported on first use: the Google client libraries are slow to import
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is rejecting calls to Gemini."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while.
+
+    After `threshold` consecutive failures the circuit opens and calls are rejected
+    for `reset_timeout` seconds. Then a single trial call is let through: success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_progress:
+                raise CircuitOpenError("Gemini circuit breaker is open")
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_in_progress:
+                    logger.warning(f"Opening Gemini circuit breaker after {self._failures} failure(s)")
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class GeminiClient:
+    """
+    Long-lived Gemini client shared by all extractions in a process.
+
+    Wraps GenerativeModel.generate_content with bounded concurrency, a token
+    bucket matched to the API quota, retries with exponential backoff and
+    jitter on 429/5xx responses, and a circuit breaker.
+    """
+
+    def __init__(self, api_key, model_name,
+                 requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 burst=GEMINI_RATE_BURST,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 max_retries=GEMINI_MAX_RETRIES):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.retryable_errors = retryable_errors()
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, burst)
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def generate_content(self, prompt):
+        """Send a prompt to the model, retrying transient failures."""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.rate_limiter.acquire()
+            try:
+                with self._semaphore, stage("gemini", "request"):
+                    response = self.model.generate_content(prompt)
+            except self.retryable_errors as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter: sleep a random time up to the exponential backoff
+                delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                RETRIES.inc(service="gemini")
+                logger.warning(f"Gemini request failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # The service answered, the request itself was rejected
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return response
@@ -1,31 +1,31 @@
-import google.generativeai as genai
 import json
 import os
-import json
-from datetime import datetime, date
-from pydantic import BaseModel, Field, ValidationError, field_validator
+import re
+import copy
+import logging
+from pydantic import BaseModel, ValidationError, field_validator
 from typing import List, Dict, Optional
-# from services.extract_service import extract_data
-
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.extract_service import extract_text_from_pdf
+from services.chunk_service import chunk_text, split_clauses, estimate_tokens
+from services.gemini_client import GeminiClient
+from services.rule_extractor import extract_rule_fields, confident_fields, covers_required, to_nested
+from services.metrics import stage, GEMINI_TOKENS
 
-def extract_text(loc):
-    # importing required modules
-    from pypdf import PdfReader
+logger = logging.getLogger(__name__)
 
-    # creating a pdf reader object
-    reader = PdfReader(loc)
 
-    # printing number of pages in pdf file
-    print(len(reader.pages))
-
-    # getting a specific page from the pdf file
-    page = reader.pages[0]
+def extract_text(loc):
+    """Extract the text of a PDF file with the shared extraction engine."""
+    return extract_text_from_pdf(loc)
 
-    # extracting text from page
-    text = page.extract_text()
-    print(text)
-    return text
 
+# Model used for extraction and the version of the extraction prompt.
+# Bump PROMPT_VERSION whenever the prompt changes so cached results are not reused.
+MODEL_NAME = "gemini-1.5-flash"
+PROMPT_VERSION = "3"
+ANALYSIS_VERSION = f"{MODEL_NAME}:{PROMPT_VERSION}"
 
 
 # --- Define the schema using Pydantic V2 style ---
@@ -45,13 +45,341 @@ class LicenseAgreement(BaseModel):
             raise ValueError("Both 'licensor' and 'licensee' must be specified.")
         return v
 
+# --- Prompt building blocks ---
+SCHEMA_FORMAT = """{
+        "parties": {
+            "licensor": "Full legal name of content owner",
+            "licensee": "Full legal name of rights recipient"
+        },
+        "licensing_terms": {
+            "effective_date": "Exact date license begins in YYYY-MM-DD format",
+            "term_duration": "License period (e.g., '12 months', '2 years', or 'until YYYY-MM-DD')",
+            "scope_of_use": ["List of allowed usage contexts"],
+            "license_characteristics": {
+                "exclusivity": "Exclusive/Non-Exclusive",
+                "transferability": "Transferable/Non-Transferable",
+                "geographical_scope": "Regions covered",
+                "user_access": "Single/Multi-User"
+            }
+        },
+        "financial_terms": {
+            "license_fee": "Total amount payable",
+            "royalty_terms": "Details of ongoing payments"
+        },
+        "usage_restrictions": {
+            "prohibited_uses": ["List of explicitly forbidden uses"]
+        },
+        "intellectual_property": {
+            "copyright_ownership": "Description of IP rights",
+            "attribution_requirements": "Credit/acknowledgment details"
+        },
+        "legal_compliance": {
+            "third_party_rights": "Required releases or permissions",
+            "indemnification": "Liability assignment details",
+            "liability_limitations": "Scope of licensor's responsibilities"
+        },
+        "contract_termination": {
+            "termination_grounds": ["List of license revocation conditions"],
+            "dispute_resolution": {
+                "governing_law": "Jurisdiction for legal matters",
+                "resolution_mechanism": "Method of resolving disputes"
+            }
+        }
+    }"""
+
+# Parsed form of the schema, used to fill fields no chunk could find
+SCHEMA = json.loads(SCHEMA_FORMAT)
+
+MISSING_VALUE = "N/A"
+
+FULL_TEXT_INSTRUCTIONS = """    - If any details are ambiguous or missing, use logical inference to fill the gaps. """
+
+CATEGORY_LABELS = {
+    "parties": "PARTIES INVOLVED",
+    "licensing_terms": "LICENSING TERMS",
+    "financial_terms": "PAYMENT & FEES",
+    "usage_restrictions": "USAGE RESTRICTIONS",
+    "intellectual_property": "INTELLECTUAL PROPERTY",
+    "legal_compliance": "LEGAL COMPLIANCE",
+    "contract_termination": "TERMINATION & DISPUTE RESOLUTION",
+}
+
+CHUNK_INSTRUCTIONS = """    - The text below is only one part of a longer contract. Extract only details stated in this part.
+    - Use "N/A" (or an empty list) for anything this part does not mention; do not guess. """
+
+# Contracts estimated above this many tokens are analyzed in chunks
+CHUNKED_THRESHOLD_TOKENS = int(os.environ.get('CHUNKED_THRESHOLD_TOKENS', 12000))
+# Number of chunks analyzed at the same time for one contract
+CHUNK_CONCURRENCY = int(os.environ.get('CHUNK_CONCURRENCY', 4))
+
+
+# Rounds of re-asking the model for the sections of a response that were missing or invalid
+GEMINI_REPAIR_ATTEMPTS = int(os.environ.get('GEMINI_REPAIR_ATTEMPTS', 2))
+# Contract text sent with a repair prompt, in estimated tokens
+REPAIR_CONTEXT_TOKENS = int(os.environ.get('REPAIR_CONTEXT_TOKENS', 1500))
+
+# Words of the clauses each section is usually extracted from, lower case
+SECTION_KEYWORDS = {
+    "parties": ["between", "licensor", "licensee", "party", "parties"],
+    "licensing_terms": ["effective", "term", "grant", "scope", "exclusiv", "territor", "transfer", "user"],
+    "financial_terms": ["fee", "royalt", "payment", "price", "compensation", "invoice"],
+    "usage_restrictions": ["prohibit", "restrict", "shall not", "may not", "not permitted"],
+    "intellectual_property": ["copyright", "intellectual property", "ownership", "attribution", "trademark"],
+    "legal_compliance": ["indemn", "liabilit", "warrant", "third part", "complian"],
+    "contract_termination": ["terminat", "breach", "dispute", "arbitration", "governing law", "jurisdiction"],
+}
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, str) and value.strip() in ("", MISSING_VALUE))
+
+
+def merge_partial_results(results):
+    """
+    Deterministically merge partial extractions of consecutive chunks.
+
+    Results are merged in chunk order: the first non-missing value of a field wins,
+    lists are concatenated without duplicates and nested objects are merged recursively.
+    """
+    merged = {}
+    for result in results:
+        if isinstance(result, dict):
+            _merge_into(merged, result)
+    return merged
+
+
+def _merge_into(target, source):
+    for key, value in source.items():
+        current = target.get(key)
+        if isinstance(value, dict):
+            if not isinstance(current, dict):
+                if not _is_missing(current):
+                    continue
+                current = target[key] = {}
+            _merge_into(current, value)
+        elif isinstance(value, list):
+            if not isinstance(current, list):
+                if not _is_missing(current):
+                    continue
+                current = target[key] = []
+            seen = {str(item).strip().lower() for item in current}
+            for item in value:
+                marker = str(item).strip().lower()
+                if not _is_missing(item) and marker not in seen:
+                    current.append(item)
+                    seen.add(marker)
+        elif _is_missing(current) and not _is_missing(value):
+            target[key] = value
+        elif key not in target:
+            target[key] = value
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _stems(text):
+    """Word stems of a text, so "redistribution" matches "redistribute"."""
+    return {word[:6] for word in _WORD.findall(str(text).lower()) if len(word) > 2}
+
+
+def source_clause(value, clauses):
+    """
+    Return the index of the clause an extracted value most likely came from:
+    the one holding the largest share (at least half) of its words. Ties go
+    to the earlier clause; None if no clause holds enough of them.
+    """
+    stems = _stems(value)
+    if not stems:
+        return None
+    best, best_share = None, 0.5
+    for index, clause in enumerate(clauses):
+        share = len(stems & _stems(clause)) / len(stems)
+        if share > best_share or (best is None and share == best_share):
+            best, best_share = index, share
+    return best
+
+
+def amend_fields(base, updates, previous_clauses=(), removed=()):
+    """
+    Return a copy of base amended with the fields of updates that are not
+    missing, clause by clause. List items and values of base that came from a
+    removed clause of the previous version are dropped; the others are kept,
+    and list items of updates are added after them.
+
+    Args:
+        base: Analysis of the previous version
+        updates: Fields extracted from the clauses the new version added or changed
+        previous_clauses: Clauses of the previous version
+        removed: Those of previous_clauses the new version no longer has
+    """
+    # Unchanged clauses come first so they win ties
+    removed = set(removed)
+    clauses = [clause for clause in previous_clauses if clause not in removed] + list(removed)
+    first_removed = len(clauses) - len(removed)
+
+    def from_removed(value):
+        index = source_clause(value, clauses) if removed else None
+        return index is not None and index >= first_removed
+
+    def amend(base, updates):
+        result = {}
+        for key in list(base) + [key for key in updates if key not in base]:
+            value, update = base.get(key), updates.get(key)
+            if isinstance(value, dict) or isinstance(update, dict):
+                result[key] = amend(value if isinstance(value, dict) else {},
+                                    update if isinstance(update, dict) else {})
+            elif isinstance(value, list) or isinstance(update, list):
+                items = [item for item in (value if isinstance(value, list) else [])
+                         if not _is_missing(item) and not from_removed(item)]
+                seen = {str(item).strip().lower() for item in items}
+                for item in update if isinstance(update, list) else []:
+                    if not _is_missing(item) and str(item).strip().lower() not in seen:
+                        items.append(item)
+                        seen.add(str(item).strip().lower())
+                result[key] = items
+            elif not _is_missing(update):
+                result[key] = update
+            elif key in base and not from_removed(value):
+                result[key] = copy.deepcopy(value)
+            else:
+                result[key] = MISSING_VALUE
+        return result
+
+    return amend(base, updates)
+
+
+# Terms a contract defines, as in (the "Effective Date") or ("Licensor")
+_DEFINED_TERM = re.compile(r'\((?:the\s+)?["\u201c]([^"\u201d]{2,40})["\u201d]\)', re.IGNORECASE)
+
+
+def sections_mentioned(text, ignore=()):
+    """
+    Return the top-level sections whose SECTION_KEYWORDS appear in a text,
+    leaving out the phrases in ignore.
+    """
+    lower = text.lower()
+    for phrase in ignore:
+        lower = lower.replace(phrase.lower(), " ")
+    return [section for section, keywords in SECTION_KEYWORDS.items() if any(keyword in lower for keyword in keywords)]
+
+
+def fill_missing_fields(data, schema=SCHEMA):
+    """Add every schema field absent from data, as "N/A" or an empty list."""
+    for key, template in schema.items():
+        value = data.get(key)
+        if isinstance(template, dict):
+            if not isinstance(value, dict):
+                value = data[key] = {}
+            fill_missing_fields(value, template)
+        elif isinstance(template, list):
+            if not isinstance(value, list):
+                data[key] = []
+        elif value is None or value == "":
+            data[key] = MISSING_VALUE
+    return data
+
+
+def schema_without(paths, schema=SCHEMA):
+    """
+    Return a copy of the schema without the given field paths, e.g. ("parties", "licensor").
+    Objects left without fields are dropped.
+    """
+    result = {}
+    for key, template in schema.items():
+        if (key,) in paths:
+            continue
+        nested = [path[1:] for path in paths if len(path) > 1 and path[0] == key]
+        if isinstance(template, dict) and nested:
+            remaining = schema_without(nested, template)
+            if remaining:
+                result[key] = remaining
+        else:
+            result[key] = template
+    return result
+
+
+def recover_sections(text, schema=SCHEMA):
+    """
+    Return the top-level sections of a malformed or truncated JSON response
+    that parse on their own, e.g. every section before the point where the
+    output was cut off.
+    """
+    decoder = json.JSONDecoder()
+    sections = {}
+    for key in schema:
+        for match in re.finditer(rf'"{re.escape(key)}"\s*:\s*', text):
+            try:
+                value, _ = decoder.raw_decode(text, match.end())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                sections[key] = value
+                break
+    return sections
+
+
+def invalid_sections(data):
+    """Return the top-level sections of data that fail validation against LicenseAgreement."""
+    try:
+        LicenseAgreement.model_validate(data)
+        return []
+    except ValidationError as ve:
+        return list(dict.fromkeys(str(error["loc"][0]) for error in ve.errors() if error["loc"]))
+
+
+def relevant_excerpt(contract_text, sections, max_tokens=REPAIR_CONTEXT_TOKENS):
+    """
+    Return the clauses of a contract that mention the given sections most,
+    in document order and within max_tokens, always starting with the
+    opening clause that names the parties. Contracts that fit are returned
+    whole, as are those where no clause matches.
+    """
+    if estimate_tokens(contract_text) <= max_tokens:
+        return contract_text
+    keywords = [keyword for section in sections for keyword in SECTION_KEYWORDS.get(section, [])]
+    clauses = split_clauses(contract_text)
+    scores = [sum(clause.lower().count(keyword) for keyword in keywords) for clause in clauses]
+    if not clauses or not any(scores[1:]):
+        return contract_text
+
+    chosen = {0}
+    budget = max_tokens - estimate_tokens(clauses[0])
+    for index in sorted(range(1, len(clauses)), key=lambda index: -scores[index]):
+        tokens = estimate_tokens(clauses[index])
+        if not scores[index]:
+            break
+        if tokens <= budget:
+            chosen.add(index)
+            budget -= tokens
+    return "\n\n".join(clauses[index] for index in sorted(chosen))
+
+
+def validate_license_agreement(extracted_json: Dict) -> Optional[Dict]:
+    """Validate the extracted JSON using the Pydantic schema."""
+    with stage("upload", "validate") as span:
+        try:
+            validated_data = LicenseAgreement.model_validate(extracted_json)
+            return validated_data.model_dump()
+        except ValidationError as ve:
+            span["outcome"] = "error"
+            logger.warning(f"Validation Error: {ve.json(indent=2)}")
+            return None
+
+
+def _count_tokens(prompt: str, output: str, response) -> None:
+    """Add the tokens of a Gemini call to the metrics, estimating them if the response has no usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    GEMINI_TOKENS.inc(prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt), direction="prompt")
+    GEMINI_TOKENS.inc(output_tokens if output_tokens is not None else estimate_tokens(output), direction="output")
+
+
 # --- Define the LicenseAgreementExtractor class ---
 class LicenseAgreementExtractor:
     def __init__(self, api_key: str):
-        # Configure the API key for your generative model service
-        genai.configure(api_key=api_key)
-        # Use an appropriate model (using gemini-1.5-flash here)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+        # Rate limited, retrying client around the generative model (using gemini-1.5-flash here)
+        self.model = GeminiClient(api_key, MODEL_NAME)
     
     def clean_response(self, text: str) -> str:
         """
@@ -64,91 +392,147 @@ class LicenseAgreementExtractor:
             cleaned = cleaned[7:-3].strip()
         return cleaned
 
-    def extract_license_details(self, contract_text: str) -> Optional[Dict]:
+    def build_prompt(self, contract_text: str, partial: bool = False, schema: Optional[Dict] = None) -> str:
         """
-        Extract structured details from a content licensing agreement
-        using advanced NLP techniques.
+        Build the extraction prompt for a whole contract, or for one chunk of it
+        when partial is True. A schema subset limits the prompt to those fields.
         """
-        prompt = f"""You are an expert legal NLP assistant specializing in parsing content licensing agreements.
+        instructions = CHUNK_INSTRUCTIONS if partial else FULL_TEXT_INSTRUCTIONS
+        schema_format = SCHEMA_FORMAT if schema is None else json.dumps(schema, indent=4).replace("\n", "\n    ")
+        categories = "\n".join(
+            f"    {number}. {CATEGORY_LABELS[key]}"
+            for number, key in enumerate(schema if schema is not None else SCHEMA, start=1)
+        )
+        return f"""You are an expert legal NLP assistant specializing in parsing content licensing agreements.
         
     - Please analyze the following contract text and extract precise, concise, and structured details according to the schema below. 
     - Your output must be in valid JSON format, with no null values (use "N/A" where information is missing)
     - With dates formatted in ISO format (YYYY-MM-DD). 
-    - If any details are ambiguous or missing, use logical inference to fill the gaps. 
+{instructions}
     - Reread your output to ensure consistency, completeness, and correctness.
 
     EXTRACTION CATEGORIES:
-    1. PARTIES INVOLVED
-    2. LICENSING TERMS
-    3. PAYMENT & FEES
-    4. USAGE RESTRICTIONS
-    5. INTELLECTUAL PROPERTY
-    6. LEGAL COMPLIANCE
-    7. TERMINATION & DISPUTE RESOLUTION
+{categories}
 
     SCHEMA FORMAT (strictly adhere to this):
-    {{
-        "parties": {{
-            "licensor": "Full legal name of content owner",
-            "licensee": "Full legal name of rights recipient"
-        }},
-        "licensing_terms": {{
-            "effective_date": "Exact date license begins in YYYY-MM-DD format",
-            "term_duration": "License period (e.g., '12 months', '2 years', or 'until YYYY-MM-DD')",
-            "scope_of_use": ["List of allowed usage contexts"],
-            "license_characteristics": {{
-                "exclusivity": "Exclusive/Non-Exclusive",
-                "transferability": "Transferable/Non-Transferable",
-                "geographical_scope": "Regions covered",
-                "user_access": "Single/Multi-User"
-            }}
-        }},
-        "financial_terms": {{
-            "license_fee": "Total amount payable",
-            "royalty_terms": "Details of ongoing payments"
-        }},
-        "usage_restrictions": {{
-            "prohibited_uses": ["List of explicitly forbidden uses"]
-        }},
-        "intellectual_property": {{
-            "copyright_ownership": "Description of IP rights",
-            "attribution_requirements": "Credit/acknowledgment details"
-        }},
-        "legal_compliance": {{
-            "third_party_rights": "Required releases or permissions",
-            "indemnification": "Liability assignment details",
-            "liability_limitations": "Scope of licensor's responsibilities"
-        }},
-        "contract_termination": {{
-            "termination_grounds": ["List of license revocation conditions"],
-            "dispute_resolution": {{
-                "governing_law": "Jurisdiction for legal matters",
-                "resolution_mechanism": "Method of resolving disputes"
-            }}
-        }}
-    }}
+    {schema_format}
 
     CONTRACT TEXT TO ANALYZE:
     {contract_text}
     """
-        try:
-            response = self.model.generate_content(prompt)
-            raw_output = response.text.strip()
-            cleaned_output = self.clean_response(raw_output)
-            print(cleaned_output)
-            # Attempt to parse the cleaned output as JSON
-            extracted_json = json.loads(cleaned_output)
-            # Validate the extracted JSON using the Pydantic schema
-            validated_data = LicenseAgreement.model_validate(extracted_json)
-            return validated_data.model_dump()
-        except json.JSONDecodeError as e:
-            print(f"JSON Parsing Error: {e}")
-            print("Raw Model Response:", raw_output)
+
+    def _generate_json(self, prompt: str) -> Optional[Dict]:
+        """Send a prompt to the model and parse the JSON object it returns."""
+        response = self.model.generate_content(prompt)
+        raw_output = response.text.strip()
+        _count_tokens(prompt, raw_output, response)
+        with stage("upload", "validate") as span:
+            try:
+                cleaned_output = self.clean_response(raw_output)
+                logger.debug(cleaned_output)
+                # Attempt to parse the cleaned output as JSON
+                return json.loads(cleaned_output)
+            except json.JSONDecodeError as e:
+                span["outcome"] = "error"
+                logger.warning(f"JSON Parsing Error: {e}")
+                logger.debug(f"Raw Model Response: {raw_output}")
+                # Keep the sections that parse; repair() asks again for the others
+                return recover_sections(raw_output) or None
+
+    def extract_fields(self, contract_text: str, schema: Optional[Dict] = None,
+                       chunked: Optional[bool] = None) -> Optional[Dict]:
+        """
+        Ask the model for the fields of a schema (the full schema by default)
+        and return the unvalidated JSON.
+
+        Args:
+            contract_text: Full text of a single contract
+            schema: Subset of SCHEMA to extract
+            chunked: Analyze the contract in clause-aware chunks and merge the results.
+                     Defaults to True for contracts above CHUNKED_THRESHOLD_TOKENS.
+        """
+        if chunked is None:
+            chunked = estimate_tokens(contract_text) > CHUNKED_THRESHOLD_TOKENS
+        if chunked:
+            return self.extract_fields_chunked(contract_text, schema)
+        return self._generate_json(self.build_prompt(contract_text, schema=schema))
+
+    def extract_fields_chunked(self, contract_text: str, schema: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Map-reduce extraction for long contracts: every chunk is analyzed
+        concurrently for the fields it mentions, then the partial results
+        are merged in document order.
+        """
+        chunks = chunk_text(contract_text)
+        logger.info(f"Analyzing contract in {len(chunks)} chunk(s)")
+        with ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY) as executor:
+            partial_results = list(executor.map(
+                lambda chunk: self._generate_json(self.build_prompt(chunk, partial=True, schema=schema)),
+                chunks
+            ))
+
+        if not any(isinstance(result, dict) for result in partial_results):
             return None
-        except ValidationError as ve:
-            print("Validation Error:", ve.json(indent=2))
+        return fill_missing_fields(merge_partial_results(partial_results), schema or SCHEMA)
+
+    def extract_license_details(self, contract_text: str, chunked: Optional[bool] = None) -> Optional[Dict]:
+        """
+        Extract structured details from a content licensing agreement
+        using advanced NLP techniques.
+
+        Args:
+            contract_text: Full text of a single contract
+            chunked: Analyze the contract in clause-aware chunks and merge the results.
+                     Defaults to True for contracts above CHUNKED_THRESHOLD_TOKENS.
+        """
+        extracted_json = self.extract_fields(contract_text, chunked=chunked)
+        if extracted_json is None:
             return None
+        return self.repair(contract_text, extracted_json)
 
+    def repair(self, contract_text: str, extracted: Dict, schema: Optional[Dict] = None,
+               known: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Validate an extraction, asking the model again only for the top-level
+        sections that are missing or invalid instead of repeating the whole
+        analysis. The repair prompt holds the schema of those sections and
+        the clauses most relevant to them.
+
+        Args:
+            contract_text: Full text of the contract
+            extracted: JSON the model returned, possibly only some sections of it
+            schema: Schema the model was asked for (the full schema by default)
+            known: Fields found without the model; they win the merge
+
+        Returns:
+            The validated details, or None if they are still invalid after
+            GEMINI_REPAIR_ATTEMPTS rounds
+        """
+        schema = schema or SCHEMA
+        extracted = dict(extracted)
+        for attempt in range(GEMINI_REPAIR_ATTEMPTS + 1):
+            merged = fill_missing_fields(merge_partial_results([known or {}, extracted]))
+            retry = [key for key in schema if not isinstance(extracted.get(key), dict)]
+            retry += [key for key in invalid_sections(merged) if key in schema and key not in retry]
+            if not retry:
+                return validate_license_agreement(merged)
+            if attempt == GEMINI_REPAIR_ATTEMPTS:
+                break
+
+            with stage("upload", "repair", sections=",".join(retry), attempt=attempt + 1) as span:
+                excerpt = relevant_excerpt(contract_text, retry)
+                prompt = self.build_prompt(excerpt, partial=excerpt is not contract_text,
+                                           schema={key: schema[key] for key in retry})
+                repaired = self._generate_json(prompt) or {}
+                if not all(isinstance(repaired.get(key), dict) for key in retry):
+                    span["outcome"] = "error"
+            for key in retry:
+                if isinstance(repaired.get(key), dict):
+                    extracted[key] = repaired[key]
+                else:
+                    extracted.pop(key, None)
+        logger.warning(f"Could not repair section(s): {', '.join(retry)}")
+        return None
 
     def save_to_json(self, data: Dict, filename: str = 'license_agreement_details.json'):
         """
@@ -157,25 +541,115 @@ class LicenseAgreementExtractor:
         try:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=4, ensure_ascii=False)
-            print(f"Data successfully saved to {filename}")
+            logger.info(f"Data successfully saved to {filename}")
         except IOError as e:
-            print(f"Error saving file: {e}")
+            logger.error(f"Error saving file: {e}")
 
 
 
-def gemini_call(contract_text):
-    # access environment variable
-    API_KEY = os.environ['GEMINI_API']
+_extractor = None
+_extractor_pid = None
+_extractor_lock = threading.Lock()
+
 
-    extractor = LicenseAgreementExtractor(API_KEY)
+def get_extractor():
+    """Return the extractor shared by every request in this process."""
+    global _extractor, _extractor_pid
+    with _extractor_lock:
+        # A forked worker builds its own client instead of reusing its parent's
+        if _extractor is None or _extractor_pid != os.getpid():
+            # access environment variable
+            API_KEY = os.environ['GEMINI_API']
+            _extractor = LicenseAgreementExtractor(API_KEY)
+            _extractor_pid = os.getpid()
+        return _extractor
 
-    # Extract license details
-    extracted_details = extractor.extract_license_details(contract_text)
+
+def gemini_call(contract_text):
+    """
+    Extract license details, asking Gemini only for what the rule-based
+    extractor could not find with high confidence.
+    """
+    rule_fields = confident_fields(extract_rule_fields(contract_text))
+    known = to_nested(rule_fields)
+    schema = schema_without(list(rule_fields))
+
+    if not schema or covers_required(rule_fields):
+        # Every required field was found, skip the LLM and leave the rest as N/A
+        logger.info("All required fields found by rule-based extraction, skipping Gemini")
+        method = "rules"
+        extracted_details = validate_license_agreement(fill_missing_fields(known))
+    elif rule_fields:
+        method = "rules+gemini"
+        extractor = get_extractor()
+        extracted = extractor.extract_fields(contract_text, schema=schema)
+        if extracted is None:
+            return None
+        # Confident rule values come first so they win the merge
+        extracted_details = extractor.repair(contract_text, extracted, schema=schema, known=known)
+    else:
+        method = "gemini"
+        extractor = get_extractor()
+        # Extract license details
+        extracted_details = extractor.extract_license_details(contract_text)
 
     if extracted_details:
+        extracted_details["extraction"] = {
+            "method": method,
+            "rule_confidence": {".".join(path): field["confidence"] for path, field in rule_fields.items()},
+        }
         return  extracted_details
 
 
+def gemini_call_amendment(previous, clauses, previous_clauses, changed, removed):
+    """
+    Analyze a new version of an analyzed contract from the clauses that
+    changed. Only the sections the added, changed or removed clauses mention
+    are amended: their fields are extracted again from the opening clause and
+    the added or changed clauses, and merged clause by clause into the
+    analysis of the previous version (see amend_fields). Confident
+    rule-based fields of the new version are not asked for and win over both.
+
+    Args:
+        previous: Analysis of the previous version
+        clauses: Clauses of the new version
+        previous_clauses: Clauses of the previous version
+        changed: Clauses of the new version not in the previous one
+        removed: Clauses of the previous version not in the new one
+
+    Returns:
+        (details, sections amended); details is None if the extraction failed
+    """
+    rule_fields = confident_fields(extract_rule_fields("\n\n".join(clauses)))
+    # A clause referring to the "Licensor" or the "Effective Date" does not change who or when they are
+    defined = {term for clause in clauses + previous_clauses for term in _DEFINED_TERM.findall(clause)}
+    sections = sections_mentioned("\n\n".join(changed + removed), ignore=sorted(defined, key=len, reverse=True))
+    schema = {key: value for key, value in schema_without(list(rule_fields)).items() if key in sections}
+    updates = {}
+    if schema and changed:
+        # The opening clause names the parties the changed clauses refer to
+        excerpt = "\n\n".join(clauses[:1] + [clause for clause in changed if clause not in clauses[:1]])
+        extractor = get_extractor()
+        updates = extractor._generate_json(extractor.build_prompt(excerpt, partial=True, schema=schema))
+        if updates is None:
+            return None, sections
+
+    details = {key: previous[key] for key in SCHEMA if key in previous}
+    amended = amend_fields(
+        {key: details.get(key, {}) for key in sections},
+        {key: value for key, value in updates.items() if key in schema},
+        previous_clauses, removed
+    )
+    details = amend_fields({**details, **amended}, to_nested(rule_fields))
+    details = validate_license_agreement(fill_missing_fields(details))
+    if details:
+        details["extraction"] = {
+            "method": "amendment",
+            "sections": sections,
+            "rule_confidence": {".".join(path): field["confidence"] for path, field in rule_fields.items()},
+        }
+    return details, sections
+
 if __name__ == '__main__':
     file = open('/nikhil/contractiq-backend/uploads/XACCT Technologies, Inc.SUPPORT AND MAINTENANCE AGREEMENT.txt', "r")
     data = file.read()
@@ -0,0 +1,349 @@
+"""
+Bulk import of a folder of contracts for one user.
+
+Extraction, analysis and Firestore writes run as overlapping stages joined by
+bounded queues, so the parser works on the next files while earlier ones wait
+for Gemini and analyzed contracts are committed in WriteBatches. Every
+finished file is appended to a checkpoint file; running the same command
+again resumes where an interrupted import stopped.
+
+Usage:
+    python -m services.import_service <folder> --user <user_id> [--checkpoint FILE]
+                                      [--extract-workers 4] [--analyze-workers 8]
+                                      [--batch-size 400] [--report-every 5]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import logging
+from services.firebase_service import db, user_path
+from services.cache_service import file_sha256
+from services.compaction_service import compact_text
+from services.document_service import invalidate_user
+from services.search_service import search_index
+from services.similarity_service import similarity_index
+from services.upload_service import extract_file_text, analyze_text
+from services import analytics_service as analytics
+from services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Files parsed at the same time; PDF pages are further spread over the extraction process pool
+IMPORT_EXTRACT_WORKERS = int(os.environ.get('IMPORT_EXTRACT_WORKERS', 4))
+# Files analyzed at the same time; Gemini requests are further bounded and rate limited by the shared client
+IMPORT_ANALYZE_WORKERS = int(os.environ.get('IMPORT_ANALYZE_WORKERS', 8))
+# Files waiting between two stages; a full queue holds back the stage before it
+IMPORT_QUEUE_SIZE = int(os.environ.get('IMPORT_QUEUE_SIZE', 32))
+# Contracts per WriteBatch; each batch also writes the two analytics aggregates, within Firestore's 500 writes
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 400))
+# A partial batch is committed after waiting this long, so slow analyses still checkpoint regularly
+IMPORT_FLUSH_SECONDS = float(os.environ.get('IMPORT_FLUSH_SECONDS', 10))
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# Checkpoint statuses of files that are not imported again
+COMPLETED = ('done', 'exists')
+
+_DONE = object()
+
+
+def document_id_for(digest):
+    """Document id of an imported file, derived from its content so a file is never imported twice."""
+    return f"import-{digest[:24]}"
+
+
+def find_files(folder):
+    """Return the paths, relative to folder, of the supported files under it, in a stable order."""
+    files = []
+    for root, directories, names in os.walk(folder):
+        directories[:] = sorted(d for d in directories if not d.startswith('.'))
+        for name in sorted(names):
+            if not name.startswith('.') and name.lower().endswith(SUPPORTED_EXTENSIONS):
+                files.append(os.path.relpath(os.path.join(root, name), folder))
+    return files
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines record of the files an import finished with, one
+    {"path", "status", ...} object per file. Failed files are retried when
+    the import resumes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line of a crashed import may be cut short
+                        continue
+                    if entry.get("status") in COMPLETED:
+                        self.completed.add(entry["path"])
+
+    def record(self, entries):
+        """Append entries and flush them to disk before returning."""
+        if not entries:
+            return
+        with self._lock:
+            with open(self.path, 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed.update(entry["path"] for entry in entries if entry["status"] in COMPLETED)
+
+
+class BulkImporter:
+    """Pipelined import of the contracts in a folder as documents of one user."""
+
+    def __init__(self, folder, user_id, checkpoint_path=None, extract_workers=IMPORT_EXTRACT_WORKERS,
+                 analyze_workers=IMPORT_ANALYZE_WORKERS, queue_size=IMPORT_QUEUE_SIZE,
+                 batch_size=IMPORT_BATCH_SIZE, flush_seconds=IMPORT_FLUSH_SECONDS):
+        self.folder = folder
+        self.user_id = user_id
+        self.checkpoint = Checkpoint(checkpoint_path or f"import-{user_id}.checkpoint.jsonl")
+        self.extract_workers = extract_workers
+        self.analyze_workers = analyze_workers
+        self.batch_size = min(batch_size, 498)
+        self.flush_seconds = flush_seconds
+        self._paths = queue.Queue(maxsize=queue_size)
+        self._extracted = queue.Queue(maxsize=queue_size)
+        self._analyzed = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"total": 0, "resumed": 0, "extracted": 0, "analyzed": 0, "cached": 0,
+                      "written": 0, "existing": 0, "failed": 0}
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _fail(self, path, stage_name, error):
+        logger.error(f"Could not import {path} ({stage_name}): {error}")
+        self.checkpoint.record([{"path": path, "status": "failed", "stage": stage_name, "error": str(error)}])
+        self._count(failed=1)
+
+    def _feed(self, paths):
+        for path in paths:
+            if self._stopping.is_set():
+                break
+            self._paths.put(path)
+        for _ in range(self.extract_workers):
+            self._paths.put(_DONE)
+
+    def _start_stage(self, name, workers, inbox, outbox, consumers, handle):
+        """
+        Run handle on each item of inbox on `workers` threads, putting its
+        results on outbox, then tell the `consumers` of outbox that it ended.
+        """
+        def work():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    return
+                try:
+                    result = handle(item)
+                except Exception as e:
+                    self._fail(item if isinstance(item, str) else item["path"], name, e)
+                    continue
+                if result is not None:
+                    outbox.put(result)
+
+        threads = [threading.Thread(target=work, name=f'import-{name}-{index}', daemon=True)
+                   for index in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        def close():
+            for thread in threads:
+                thread.join()
+            for _ in range(consumers):
+                outbox.put(_DONE)
+
+        threading.Thread(target=close, name=f'import-{name}-close', daemon=True).start()
+
+    def _extract(self, path):
+        with stage("import", "extract", filename=path) as span:
+            file_path = os.path.join(self.folder, path)
+            digest = file_sha256(file_path)
+            content, span["cached"] = extract_file_text(file_path, os.path.basename(path), digest)
+            compacted, _ = compact_text(content)
+        self._count(extracted=1)
+        return {"path": path, "digest": digest, "content": content, "compacted": compacted}
+
+    def _analyze(self, item):
+        with stage("import", "analyze", filename=item["path"]) as span:
+            data, span["cached"], item["derived_from"] = analyze_text(item["digest"], item["compacted"], self.user_id)
+            if not data:
+                span["outcome"] = "error"
+                raise ValueError("Could not extract contract details.")
+        self._count(analyzed=1, cached=int(span["cached"]))
+        return {**item, "data": data}
+
+    def _write(self):
+        """Commit analyzed contracts in WriteBatches until the analysis stage ends."""
+        pending = []
+        first_pending_at = None
+        while True:
+            timeout = None if not pending else max(0.0, first_pending_at + self.flush_seconds - time.monotonic())
+            try:
+                item = self._analyzed.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                self._commit(pending)
+                return
+            if item is not None:
+                if not pending:
+                    first_pending_at = time.monotonic()
+                pending.append(item)
+            if len(pending) >= self.batch_size or (pending and item is None):
+                self._commit(pending)
+                pending = []
+
+    def _commit(self, items):
+        if not items:
+            return
+        collection = db.collection(f'{user_path(self.user_id)}/documents')
+        # Identical files in the folder are one contract
+        by_id = {}
+        duplicates = []
+        for item in items:
+            document_id = document_id_for(item["digest"])
+            if document_id in by_id:
+                duplicates.append({"path": item["path"], "status": "exists", "document_id": document_id})
+            else:
+                by_id[document_id] = item
+        try:
+            with stage("import", "persist", contracts=len(by_id)):
+                from google.cloud.firestore import SERVER_TIMESTAMP
+                references = {document_id: collection.document(document_id) for document_id in by_id}
+                # Contracts committed before an interruption, but not checkpointed, are not written twice
+                existing = {snapshot.id for snapshot in db.get_all(list(references.values())) if snapshot.exists}
+                new = [document_id for document_id in by_id if document_id not in existing]
+                if new:
+                    batch = db.batch()
+                    for document_id in new:
+                        item = by_id[document_id]
+                        # updated_at is the watermark the notification sweep uses to find new contracts
+                        batch.set(references[document_id], {
+                            **item["data"],
+                            "file_name": os.path.basename(item["path"]),
+                            **({"derived_from": item["derived_from"]} if item["derived_from"] else {}),
+                            "updated_at": SERVER_TIMESTAMP,
+                        })
+                    analytics.add_many_to_batch(batch, self.user_id, [by_id[document_id]["data"] for document_id in new])
+                    batch.commit()
+                    invalidate_user(self.user_id)
+        except Exception as e:
+            for item in items:
+                self._fail(item["path"], "persist", e)
+            return
+
+        for document_id in new:
+            item = by_id[document_id]
+            try:
+                search_index.index_document(self.user_id, document_id,
+                                            {**item["data"], "file_name": os.path.basename(item["path"])},
+                                            item["content"])
+                similarity_index.add_document(self.user_id, document_id, item["compacted"])
+            except Exception as e:
+                # The contract is saved; it only stays out of search results or near-duplicate matching
+                logger.error(f"Could not index {item['path']}: {e}")
+
+        entries = [
+            {"path": by_id[document_id]["path"], "status": "exists" if document_id in existing else "done",
+             "document_id": document_id}
+            for document_id in by_id
+        ]
+        self.checkpoint.record(entries + duplicates)
+        self._count(written=len(new), existing=len(items) - len(new))
+
+    def report(self, started):
+        """Return a one-line progress report."""
+        with self._lock:
+            stats = dict(self.stats)
+        elapsed = time.monotonic() - started
+        finished = stats["written"] + stats["existing"] + stats["failed"]
+        remaining = stats["total"] - stats["resumed"] - finished
+        rate = finished / elapsed if elapsed else 0.0
+        eta = f"{remaining / rate:.0f}s" if rate and remaining else "-"
+        return (
+            f"[{elapsed:7.1f}s] {finished + stats['resumed']}/{stats['total']} files: "
+            f"extracted {stats['extracted']}, analyzed {stats['analyzed']} ({stats['cached']} cached), "
+            f"written {stats['written']}, existing {stats['existing']}, failed {stats['failed']} | "
+            f"{rate:.1f} files/s, ETA {eta} | queued {self._paths.qsize()}/{self._extracted.qsize()}"
+            f"/{self._analyzed.qsize()}"
+        )
+
+    def run(self, report_every=5.0, out=sys.stdout):
+        """
+        Import every file of the folder not completed by an earlier run,
+        printing a progress report every report_every seconds.
+
+        Returns:
+            The import statistics
+        """
+        files = find_files(self.folder)
+        pending = [path for path in files if path not in self.checkpoint.completed]
+        self.stats.update(total=len(files), resumed=len(files) - len(pending))
+        started = time.monotonic()
+
+        self._start_stage("extract", self.extract_workers, self._paths, self._extracted,
+                          self.analyze_workers, self._extract)
+        self._start_stage("analyze", self.analyze_workers, self._extracted, self._analyzed, 1, self._analyze)
+        writer = threading.Thread(target=self._write, name='import-write', daemon=True)
+        writer.start()
+        feeder = threading.Thread(target=self._feed, args=(pending,), name='import-feed', daemon=True)
+        feeder.start()
+
+        while writer.is_alive():
+            try:
+                writer.join(timeout=report_every)
+            except KeyboardInterrupt:
+                if self._stopping.is_set():
+                    raise
+                # Files already in the pipeline are still analyzed and committed
+                print("Interrupted: finishing the files in progress, press Ctrl-C again to abort", file=out)
+                self._stopping.set()
+                continue
+            print(self.report(started), file=out, flush=True)
+        return dict(self.stats, seconds=round(time.monotonic() - started, 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a folder of contracts for one user.")
+    parser.add_argument("folder", help="Folder of PDF, DOCX and TXT contracts, searched recursively")
+    parser.add_argument("--user", required=True, help="Id of the user the contracts are imported for")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: import-<user>.checkpoint.jsonl)")
+    parser.add_argument("--extract-workers", type=int, default=IMPORT_EXTRACT_WORKERS)
+    parser.add_argument("--analyze-workers", type=int, default=IMPORT_ANALYZE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=IMPORT_QUEUE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"not a folder: {args.folder}")
+    importer = BulkImporter(args.folder, args.user, args.checkpoint, args.extract_workers,
+                            args.analyze_workers, args.queue_size, args.batch_size)
+    stats = importer.run(report_every=args.report_every)
+    print(f"Imported {stats['written']} contract(s) in {stats['seconds']}s: {stats['existing']} already stored, "
+          f"{stats['resumed']} done by an earlier run, {stats['failed']} failed "
+          f"(see {importer.checkpoint.path})")
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Number of uploads processed concurrently per worker process
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+# Finished jobs are kept around this long so the dashboard can poll their final state
+JOB_RETENTION_SECONDS = int(os.environ.get('UPLOAD_JOB_RETENTION', 3600))
+# SQLite database shared by all worker processes, so any of them can serve a job's status
+JOB_STORE_PATH = os.environ.get('UPLOAD_JOB_PATH', 'upload_jobs.db')
+
+
+class UploadJobQueue:
+    """
+    Queue of upload jobs backed by a bounded thread pool.
+
+    A job is processed by the worker process that accepted the upload, but its
+    state is kept in SQLite so the status endpoint can be served by any worker.
+    """
+
+    def __init__(self, handler, max_workers=UPLOAD_WORKERS, path=JOB_STORE_PATH):
+        """
+        Args:
+            handler: Callable taking a job id, run on a pool thread for every job
+            max_workers: Maximum number of jobs processed at the same time
+            path: Location of the SQLite job database
+        """
+        self._handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _conn(self):
+        """
+        SQLite connection of this process, opened on first use. A connection
+        must not be carried across fork, so a forked worker opens its own.
+        Callers hold self._lock.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS upload_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    value TEXT NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._connection = conn
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _load(self, job_id):
+        """Return the stored job, or None. Callers hold self._lock."""
+        row = self._conn.execute("SELECT value FROM upload_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, job):
+        """Write a job back. Callers hold self._lock."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO upload_jobs (job_id, status, updated_at, value) VALUES (?, ?, ?, ?)",
+            (job["job_id"], job["status"], job["updated_at"], json.dumps(job)),
+        )
+        self._conn.commit()
+
+    def _modify(self, job_id, change):
+        """
+        Apply change to the stored job and write it back. Only the worker
+        running a job modifies it, so the lock of this process is enough.
+        """
+        with self._lock:
+            job = self._load(job_id)
+            change(job)
+            job["updated_at"] = time.time()
+            self._store(job)
+
+    def submit(self, user_id, files):
+        """
+        Register a new job and hand it to the worker pool.
+
+        Args:
+            user_id: Owner of the uploaded files
+            files: List of (filename, file_path, sha256) tuples already saved to disk
+
+        Returns:
+            The id of the new job
+        """
+        self._prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "status": "queued",
+            "progress": 0,
+            "created_at": now,
+            "updated_at": now,
+            "files": [
+                {"filename": filename, "path": path, "sha256": digest, "status": "queued", "error": None}
+                for filename, path, digest in files
+            ],
+            "document_ids": [],
+            "error": None,
+        }
+        with self._lock:
+            self._store(job)
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Queued upload job {job_id} with {len(files)} file(s)")
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown."""
+        with self._lock:
+            job = self._load(job_id)
+        if job is None:
+            return None
+        job["files"] = [{k: v for k, v in f.items() if k not in ("path", "sha256")} for f in job["files"]]
+        return job
+
+    def update(self, job_id, **fields):
+        """Update top-level fields of a job."""
+        self._modify(job_id, lambda job: job.update(fields))
+
+    def update_file(self, job_id, index, **fields):
+        """Update the entry of a single file within a job."""
+        self._modify(job_id, lambda job: job["files"][index].update(fields))
+
+    def add_document(self, job_id, document_id):
+        """Record a Firestore document created by the job."""
+        self._modify(job_id, lambda job: job["document_ids"].append(document_id))
+
+    def files(self, job_id):
+        """Return the (filename, path, sha256) of each file of a job."""
+        with self._lock:
+            job = self._load(job_id)
+        return [(f["filename"], f["path"], f["sha256"]) for f in job["files"]]
+
+    def _run(self, job_id):
+        self.update(job_id, status="running")
+        try:
+            self._handler(job_id)
+            job = self.get(job_id)
+            if all(f["status"] == "failed" for f in job["files"]):
+                self.update(job_id, status="failed", progress=100,
+                            error=job["error"] or "No valid files to process.")
+            else:
+                self.update(job_id, status="completed", progress=100)
+        except Exception as e:
+            logger.error(f"Upload job {job_id} failed: {e}")
+            self.update(job_id, status="failed", error=str(e))
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period."""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM upload_jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (cutoff,)
+            )
+            self._conn.commit()
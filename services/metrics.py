@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Log a JSON record for every finished span, linking the stages of an upload by trace id
+TRACE_SPANS = os.environ.get('TRACE_SPANS', 'false').lower() in ('1', 'true', 'yes')
+# Bearer token required to read /metrics; open when unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Upper bounds in seconds, from cache hits to slow Gemini calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. failures or bytes processed."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. stage durations in seconds, over fixed buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Counts per bucket (the last one is +Inf), sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self, key, series):
+        counts, total = series
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "contract_stage_duration_seconds",
+    "Time spent in each stage of the upload and notification pipelines.",
+    ["pipeline", "stage", "outcome"],
+)
+STAGE_FAILURES = registry.counter(
+    "contract_stage_failures",
+    "Stages that raised an error or produced no result.",
+    ["pipeline", "stage"],
+)
+RETRIES = registry.counter(
+    "contract_retries",
+    "Requests retried after a transient failure.",
+    ["service"],
+)
+GEMINI_TOKENS = registry.counter(
+    "gemini_tokens",
+    "Tokens sent to and received from Gemini; estimated when the response carries no usage metadata.",
+    ["direction"],
+)
+BYTES = registry.counter(
+    "contract_bytes",
+    "Bytes of uploaded files, extracted text and sent emails.",
+    ["kind"],
+)
+CACHE_LOOKUPS = registry.counter(
+    "contract_cache_lookups",
+    "Content cache lookups made while processing uploads.",
+    ["kind", "result"],
+)
+
+# (trace id, span id) of the span running in this context
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+@contextmanager
+def stage(pipeline, name, **attributes):
+    """
+    Time a pipeline stage into contract_stage_duration_seconds and count it as
+    failed if it raises. Nested stages are linked as spans of the same trace;
+    set TRACE_SPANS to log them.
+
+    Yields:
+        Dict of span attributes; set "outcome" to "error" to record a failure
+        without raising
+    """
+    parent = _current_span.get()
+    trace_id = parent[0] if parent else uuid.uuid4().hex
+    span_id = uuid.uuid4().hex[:16]
+    token = _current_span.set((trace_id, span_id))
+    span = dict(attributes, outcome="ok")
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["outcome"] = "error"
+        span["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        STAGE_SECONDS.observe(duration, pipeline=pipeline, stage=name, outcome=span["outcome"])
+        if span["outcome"] != "ok":
+            STAGE_FAILURES.inc(pipeline=pipeline, stage=name)
+        if TRACE_SPANS:
+            logger.info(json.dumps({
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": parent[1] if parent else None,
+                "name": f"{pipeline}.{name}",
+                "start": started_at,
+                "duration_ms": round(duration * 1000, 3),
+                **span,
+            }, default=str))
+
+
+def current_trace_id():
+    """Trace id of the span running in this context, or None."""
+    span = _current_span.get()
+    return span[0] if span else None
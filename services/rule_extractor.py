@@ -0,0 +1,167 @@
+import os
+import re
+from datetime import datetime
+
+# Fields scored at or above this confidence are trusted without asking Gemini
+RULE_CONFIDENCE_THRESHOLD = float(os.environ.get('RULE_CONFIDENCE_THRESHOLD', 0.8))
+# Comma-separated dotted field paths (e.g. "parties.licensor") that let a contract skip Gemini
+# once all of them are confident; empty requires every field of the schema
+RULE_REQUIRED_FIELDS = [
+    tuple(path.strip().split('.')) for path in os.environ.get('RULE_REQUIRED_FIELDS', '').split(',') if path.strip()
+]
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "eighteen": 18,
+    "twenty-four": 24, "thirty-six": 36,
+}
+
+_MONTHS = r'(?:January|February|March|April|May|June|July|August|September|October|November|December)'
+_DATE = (
+    rf'(?:{_MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}'
+    rf'|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:day\s+of\s+)?{_MONTHS},?\s+\d{{4}}'
+    r'|\d{4}-\d{2}-\d{2}'
+    r'|\d{1,2}/\d{1,2}/\d{4})'
+)
+_DATE_FORMATS = ["%B %d %Y", "%d %B %Y", "%Y-%m-%d", "%m/%d/%Y"]
+
+_ROLE_LABEL = r'\(\s*(?:hereinafter\s+)?(?:(?:referred\s+to|defined)\s+as\s+)?(?:the\s+)?["“”]?{role}["“”]?\s*\)'
+# Words introducing a party in the recital: "between X (...) and Y (...)"
+_PARTY_INTRO = re.compile(r'(?:\bbetween\b|\band\b)\s*:?\s*', re.IGNORECASE)
+# The legal name ends where its description starts: ", a Delaware corporation", "(", ", having ..."
+_PARTY_NAME_END = re.compile(r'\s*,\s*(?:a|an|the)\s|\s*\(|\s*,\s*(?:having|with|located|whose|registered)\b', re.IGNORECASE)
+
+# A jurisdiction name: capitalised words, stopping at commas, lowercase words and "And"/"Or"
+_PLACE = r'(?!(?:And|Or)\b)[A-Z][A-Za-z]+(?:\s+(?!(?:And|Or)\b)[A-Z][A-Za-z]+)*'
+
+_PATTERNS = {
+    "effective_date": [
+        (re.compile(rf'({_DATE})\s*\(\s*(?:the\s+)?["“”]?effective\s+date', re.IGNORECASE), 0.9),
+        (re.compile(rf'effective\s+date[”"]?\s*(?:\)|:|is|shall\s+be|of)?\s*(?:as\s+of\s+)?({_DATE})', re.IGNORECASE), 0.9),
+        (re.compile(rf'effective\s+(?:as\s+of|on|from)\s+({_DATE})', re.IGNORECASE), 0.85),
+        (re.compile(rf'(?:dated|entered\s+into)\s+(?:as\s+of\s+|on\s+)?({_DATE})', re.IGNORECASE), 0.6),
+    ],
+    "term_duration": [
+        (re.compile(r'\bterm\s*[:\-]\s*(\d+|[a-z\-]+)\s*(?:\(\d+\)\s*)?(years?|months?|days?)', re.IGNORECASE), 0.9),
+        (re.compile(r'(?:term|period)\s+of\s+(\d+|[a-z\-]+)\s*(?:\(\d+\)\s*)?(years?|months?|days?)', re.IGNORECASE), 0.85),
+        (re.compile(r'for\s+(?:a\s+period\s+of\s+)?(\d+|[a-z\-]+)\s*(?:\(\d+\)\s*)?(years?|months?|days?)\s+(?:from|after|commencing)', re.IGNORECASE), 0.7),
+    ],
+    "term_until": [
+        (re.compile(rf'(?:term|license)[^.]{{0,80}}?(?:until|through|expires?\s+on)\s+({_DATE})', re.IGNORECASE), 0.8),
+    ],
+    "license_fee": [
+        (re.compile(r'licen[cs]e\s+fee[^.$€£]{0,80}?((?:USD|US\$|\$|€|£|EUR|INR|Rs\.?)\s?[\d,]+(?:\.\d{2})?)', re.IGNORECASE), 0.85),
+        (re.compile(r'(?:pay|fee\s+of)[^.$€£]{0,40}?((?:USD|US\$|\$|€|£|EUR|INR|Rs\.?)\s?[\d,]+(?:\.\d{2})?)', re.IGNORECASE), 0.6),
+    ],
+    "governing_law": [
+        (re.compile(rf'(?i:governed\s+by[^.]{{0,60}}?laws?\s+of\s+(?:the\s+)?)((?:State|Commonwealth|Province)\s+of\s+{_PLACE}|{_PLACE})'), 0.9),
+        (re.compile(rf'(?i:governing\s+law\s*[:.\-]\s*(?:the\s+)?(?:laws?\s+of\s+)?(?:the\s+)?)({_PLACE}(?:\s+of\s+{_PLACE})?)'), 0.8),
+    ],
+}
+
+
+def _parse_date(value):
+    value = re.sub(r'(\d)(?:st|nd|rd|th)', r'\1', value)
+    value = re.sub(r'\bday\s+of\s+', '', value, flags=re.IGNORECASE)
+    value = ' '.join(value.replace(',', ' ').split())
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _first_match(name, text):
+    for pattern, confidence in _PATTERNS[name]:
+        match = pattern.search(text)
+        if match:
+            return match, confidence
+    return None, 0.0
+
+
+def _find_party(role, text):
+    label = re.compile(_ROLE_LABEL.format(role=role), re.IGNORECASE)
+    for match in label.finditer(text):
+        # The party is introduced shortly before its defined role
+        window = text[max(0, match.start() - 400):match.start()]
+        intros = list(_PARTY_INTRO.finditer(window))
+        if not intros:
+            continue
+        candidate = window[intros[-1].end():]
+        name = _PARTY_NAME_END.split(candidate, maxsplit=1)[0]
+        name = ' '.join(name.split()).strip(' ,"“”')
+        if name and name[0].isupper() and len(name.split()) <= 10:
+            return name, 0.9
+    match = re.search(rf'^\s*{role}\s*:\s*(.+)$', text, re.IGNORECASE | re.MULTILINE)
+    if match:
+        return match.group(1).strip(' ,'), 0.85
+    return None, 0.0
+
+
+def extract_rule_fields(contract_text):
+    """
+    Extract templated fields with regular expressions.
+
+    Returns:
+        Dict mapping a field path tuple (e.g. ("parties", "licensor")) to
+        {"value": ..., "confidence": float between 0 and 1}
+    """
+    fields = {}
+
+    for role in ("licensor", "licensee"):
+        value, confidence = _find_party(role.capitalize(), contract_text)
+        if value:
+            fields[("parties", role)] = {"value": value, "confidence": confidence}
+
+    match, confidence = _first_match("effective_date", contract_text)
+    if match:
+        value = _parse_date(match.group(1))
+        if value:
+            fields[("licensing_terms", "effective_date")] = {"value": value, "confidence": confidence}
+
+    match, confidence = _first_match("term_duration", contract_text)
+    if match:
+        amount = match.group(1).lower()
+        amount = int(amount) if amount.isdigit() else _NUMBER_WORDS.get(amount)
+        if amount:
+            unit = match.group(2).lower().rstrip('s') + ('s' if amount != 1 else '')
+            fields[("licensing_terms", "term_duration")] = {"value": f"{amount} {unit}", "confidence": confidence}
+    else:
+        match, confidence = _first_match("term_until", contract_text)
+        value = _parse_date(match.group(1)) if match else None
+        if value:
+            fields[("licensing_terms", "term_duration")] = {"value": f"until {value}", "confidence": confidence}
+
+    match, confidence = _first_match("license_fee", contract_text)
+    if match:
+        fields[("financial_terms", "license_fee")] = {"value": match.group(1).strip(), "confidence": confidence}
+
+    match, confidence = _first_match("governing_law", contract_text)
+    if match:
+        fields[("contract_termination", "dispute_resolution", "governing_law")] = {
+            "value": match.group(1).strip(), "confidence": confidence
+        }
+
+    return fields
+
+
+def confident_fields(fields, threshold=RULE_CONFIDENCE_THRESHOLD):
+    """Keep only the fields scored at or above the threshold."""
+    return {path: field for path, field in fields.items() if field["confidence"] >= threshold}
+
+
+def covers_required(fields, required=RULE_REQUIRED_FIELDS):
+    """Whether the fields include every required field path. False when nothing is required."""
+    return bool(required) and all(tuple(path) in fields for path in required)
+
+
+def to_nested(fields):
+    """Turn {field path: {"value": ...}} into a nested LicenseAgreement-shaped dict."""
+    data = {}
+    for path, field in fields.items():
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = field["value"]
+    return data
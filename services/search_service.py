@@ -0,0 +1,342 @@
+import os
+import re
+import html
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', 'contract_search.db')
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+
+# Indexed columns of the full-text table and their bm25 weights; party names
+# and the other structured fields rank above a match in the contract text
+FIELDS = {
+    "licensor": ("parties", "licensor"),
+    "licensee": ("parties", "licensee"),
+    "scope_of_use": ("licensing_terms", "scope_of_use"),
+    "prohibited_uses": ("usage_restrictions", "prohibited_uses"),
+    "termination_grounds": ("contract_termination", "termination_grounds"),
+    "governing_law": ("contract_termination", "dispute_resolution", "governing_law"),
+    "file_name": ("file_name",),
+}
+_COLUMNS = list(FIELDS) + ["text"]
+_WEIGHTS = {"licensor": 10.0, "licensee": 10.0, "scope_of_use": 4.0, "prohibited_uses": 4.0,
+            "termination_grounds": 4.0, "governing_law": 4.0, "file_name": 2.0, "text": 1.0}
+# Indexed column holding a token of the entry's user, matched with every query
+# so FTS5 only ranks the caller's rows; last, so snippets never come from it
+_OWNER = "owner"
+
+# Stored with each entry so results render as dashboard cards without reading Firestore
+SUMMARY_PATHS = [
+    ("file_name",),
+    ("parties", "licensor"),
+    ("parties", "licensee"),
+    ("licensing_terms", "effective_date"),
+    ("licensing_terms", "term_duration"),
+    ("licensing_terms", "scope_of_use"),
+    ("contract_termination", "termination_grounds"),
+    ("contract_termination", "dispute_resolution", "governing_law"),
+]
+
+# Marks the matched terms in snippets; replaced after the snippet is HTML-escaped
+_MARK_START, _MARK_END = "\x02", "\x03"
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def _get(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _field_text(value):
+    if value is None or value == "N/A":
+        return ""
+    if isinstance(value, list):
+        return " ".join(str(item) for item in value if item and item != "N/A")
+    return str(value)
+
+
+def _summary(data):
+    summary = {}
+    for path in SUMMARY_PATHS:
+        value = _get(data, path)
+        if value is None:
+            continue
+        target = summary
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return summary
+
+
+def _owner_token(user_id):
+    return "u" + hashlib.blake2b(user_id.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def _match_expression(text, prefix=True):
+    """
+    Turn free text into an FTS5 expression matching every word, the last one
+    as a prefix so results update while the user types. Words are quoted, so
+    FTS5 operators in the input are searched as plain words.
+    """
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class SearchIndex:
+    """
+    Ranked full-text and field search over analyzed contracts, in SQLite FTS5.
+
+    Each contract is indexed with its extracted text and the structured
+    fields in FIELDS, which can also be searched on their own. Entries are
+    added as uploads are saved; results are scoped to one user and ranked
+    with bm25.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _conn(self):
+        """
+        SQLite connection of this process, opened on first use. A forked
+        worker opens its own. Callers hold self._lock.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS contracts (
+                    rowid INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    effective_date TEXT,
+                    summary TEXT NOT NULL,
+                    UNIQUE (user_id, document_id)
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_contracts_user_date ON contracts (user_id, effective_date)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(contracts_fts)")]
+            if columns and _OWNER not in columns:
+                # Indexes created before entries carried their owner token
+                conn.execute("ALTER TABLE contracts_fts RENAME TO contracts_fts_unscoped")
+            conn.execute(
+                f"""CREATE VIRTUAL TABLE IF NOT EXISTS contracts_fts USING fts5(
+                    {", ".join(_COLUMNS)}, {_OWNER},
+                    tokenize = 'porter unicode61 remove_diacritics 2'
+                )"""
+            )
+            if columns and _OWNER not in columns:
+                conn.create_function("owner_token", 1, _owner_token)
+                conn.execute(
+                    f"INSERT INTO contracts_fts (rowid, {', '.join(_COLUMNS)}, {_OWNER}) "
+                    f"SELECT f.rowid, {', '.join('f.' + column for column in _COLUMNS)}, owner_token(c.user_id) "
+                    f"FROM contracts_fts_unscoped f JOIN contracts c ON c.rowid = f.rowid"
+                )
+                conn.execute("DROP TABLE contracts_fts_unscoped")
+            conn.commit()
+            self._connection = conn
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def index_document(self, user_id, document_id, data, text=None):
+        """
+        Add or replace the entry of a contract; data is its analysis (with
+        "file_name"). The indexed text of an existing entry is kept when text
+        is None.
+        """
+        effective_date = _get(data, ("licensing_terms", "effective_date"))
+        if effective_date == "N/A":
+            effective_date = None
+        values = [_field_text(_get(data, path)) for path in FIELDS.values()]
+        with self._lock:
+            conn = self._conn
+            with conn:
+                row = conn.execute(
+                    "SELECT rowid FROM contracts WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+                ).fetchone()
+                if row is not None:
+                    if text is None:
+                        text = conn.execute("SELECT text FROM contracts_fts WHERE rowid = ?", (row[0],)).fetchone()[0]
+                    conn.execute("DELETE FROM contracts_fts WHERE rowid = ?", (row[0],))
+                    conn.execute(
+                        "UPDATE contracts SET effective_date = ?, summary = ? WHERE rowid = ?",
+                        (effective_date, json.dumps(_summary(data), default=str), row[0])
+                    )
+                    rowid = row[0]
+                else:
+                    rowid = conn.execute(
+                        "INSERT INTO contracts (user_id, document_id, effective_date, summary) VALUES (?, ?, ?, ?)",
+                        (user_id, document_id, effective_date, json.dumps(_summary(data), default=str))
+                    ).lastrowid
+                conn.execute(
+                    f"INSERT INTO contracts_fts (rowid, {', '.join(_COLUMNS)}, {_OWNER}) "
+                    f"VALUES (?, {', '.join('?' * (len(_COLUMNS) + 1))})",
+                    [rowid] + values + [text or "", _owner_token(user_id)]
+                )
+
+    def remove_document(self, user_id, document_id):
+        with self._lock:
+            conn = self._conn
+            with conn:
+                row = conn.execute(
+                    "SELECT rowid FROM contracts WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM contracts_fts WHERE rowid = ?", (row[0],))
+                    conn.execute("DELETE FROM contracts WHERE rowid = ?", (row[0],))
+
+    def search(self, user_id, query=None, fields=None, start_date=None, end_date=None,
+               limit=SEARCH_PAGE_SIZE, offset=0):
+        """
+        Search a user's contracts.
+
+        Args:
+            query: Free text matched against every column
+            fields: {field name in FIELDS: text} matched against that field only
+            start_date, end_date: Inclusive ISO range of the effective date
+            limit, offset: Page of results to return
+
+        Returns:
+            List of contract summaries with their "id", a bm25 "score" (higher
+            is better, None without a text query) and a "snippet" of the
+            matching text with <mark> around the matched terms
+        """
+        limit = max(1, min(limit, SEARCH_PAGE_SIZE_MAX))
+        expressions = []
+        if query:
+            expression = _match_expression(query)
+            if expression:
+                expressions.append(f"{{{' '.join(_COLUMNS)}}} : ({expression})")
+        for field, value in (fields or {}).items():
+            if field not in FIELDS:
+                raise ValueError(f"Unknown search field: {field}")
+            expression = _match_expression(value)
+            if expression:
+                expressions.append(f"{field} : ({expression})")
+
+        conditions = ["c.user_id = ?"]
+        parameters = [user_id]
+        if start_date:
+            conditions.append("c.effective_date >= ?")
+            parameters.append(start_date)
+        if end_date:
+            conditions.append("c.effective_date <= ?")
+            parameters.append(end_date)
+
+        if expressions:
+            expressions.insert(0, f'{_OWNER} : "{_owner_token(user_id)}"')
+            weights = ", ".join([str(_WEIGHTS[column]) for column in _COLUMNS] + ["0.0"])
+            sql = (
+                f"SELECT c.document_id, c.summary, bm25(contracts_fts, {weights}) AS rank, "
+                f"snippet(contracts_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) "
+                f"FROM contracts_fts JOIN contracts c ON c.rowid = contracts_fts.rowid "
+                f"WHERE contracts_fts MATCH ? AND {' AND '.join(conditions)} "
+                f"ORDER BY rank LIMIT ? OFFSET ?"
+            )
+            parameters = [" AND ".join(expressions)] + parameters
+        else:
+            sql = (
+                f"SELECT c.document_id, c.summary, NULL, NULL FROM contracts c "
+                f"WHERE {' AND '.join(conditions)} ORDER BY c.effective_date DESC LIMIT ? OFFSET ?"
+            )
+        with self._lock:
+            rows = self._conn.execute(sql, parameters + [limit, offset]).fetchall()
+
+        results = []
+        for document_id, summary, rank, snippet in rows:
+            result = {"id": document_id, **json.loads(summary)}
+            # bm25() is lower for better matches
+            result["score"] = round(-rank, 4) if rank is not None else None
+            if snippet:
+                result["snippet"] = (
+                    html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+                )
+            results.append(result)
+        return results
+
+    def iter_texts(self, page_size=500):
+        """Yield (user_id, document_id, text) for every entry, a page at a time."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT c.rowid, c.user_id, c.document_id, f.text FROM contracts c "
+                    "JOIN contracts_fts f ON f.rowid = c.rowid WHERE c.rowid > ? ORDER BY c.rowid LIMIT ?",
+                    (last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, user_id, document_id, text in rows:
+                yield user_id, document_id, text
+            last = rows[-1][0]
+
+    def stats(self):
+        with self._lock:
+            contracts, users = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM contracts"
+            ).fetchone()
+        return {"contracts": contracts, "users": users}
+
+    def optimize(self):
+        """Merge the index segments, e.g. after a large backfill."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT INTO contracts_fts (contracts_fts) VALUES ('optimize')")
+
+
+search_index = SearchIndex()
+
+
+def backfill(index=search_index):
+    """
+    Index the structured fields of every contract in Firestore. The text of
+    contracts uploaded before the index existed is not stored in Firestore,
+    so they are searchable by their fields only.
+
+    Returns:
+        Number of contracts indexed
+    """
+    from services.export_service import iter_documents
+    indexed = 0
+    for user_id, document_id, data in iter_documents():
+        index.index_document(user_id, document_id, data)
+        indexed += 1
+    index.optimize()
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the contract search index.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("backfill", help="Index every contract stored in Firestore")
+    subcommands.add_parser("optimize", help="Merge the index segments")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(f"Indexed {backfill()} contract(s) into {search_index.path}")
+    else:
+        search_index.optimize()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import os
+import re
+import json
+import heapq
+import sqlite3
+import hashlib
+import argparse
+import threading
+import logging
+from services.chunk_service import split_clauses
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH', 'contract_similarity.db')
+# Estimated Jaccard similarity of the shingles above which an upload is treated as a version of an earlier contract
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.75))
+
+# Words per shingle, and MinHash values kept per contract (bottom-k sketch)
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 128
+# Earlier contracts compared in full after the sketch lookup
+CANDIDATES = 5
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# SQLite integers are signed 64-bit
+_HASH_MASK = (1 << 63) - 1
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big') & _HASH_MASK
+
+
+def normalize_clause(clause):
+    return " ".join(_WORD.findall(clause.lower()))
+
+
+def sketch(text):
+    """
+    Return the bottom-k MinHash sketch of a text: the SKETCH_SIZE smallest
+    hashes of its word shingles, sorted.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[index:index + SHINGLE_WORDS]) for index in range(len(words) - SHINGLE_WORDS + 1)}
+    return heapq.nsmallest(SKETCH_SIZE, {_hash(shingle) for shingle in shingles})
+
+
+def estimate_similarity(first, second):
+    """Estimate the Jaccard similarity of two texts' shingles from their sketches."""
+    if not first or not second:
+        return 0.0
+    union = heapq.nsmallest(SKETCH_SIZE, set(first) | set(second))
+    both = set(first) & set(second)
+    return sum(1 for value in union if value in both) / len(union)
+
+
+def clause_hashes(clauses):
+    return [hashlib.blake2b(normalize_clause(clause).encode('utf-8'), digest_size=8).hexdigest()
+            for clause in clauses]
+
+
+class SimilarityIndex:
+    """
+    Near-duplicate lookup over the extracted text of each user's contracts,
+    in SQLite.
+
+    Every contract is stored with a MinHash sketch of its word shingles and
+    its clauses. The sketch values are indexed, so earlier contracts sharing
+    many of them with a new upload are found with one indexed query; the
+    clauses tell which ones the upload added, changed or removed.
+    """
+
+    def __init__(self, path=SIMILARITY_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _conn(self):
+        """
+        SQLite connection of this process, opened on first use. A forked
+        worker opens its own. Callers hold self._lock.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    rowid INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    sketch TEXT NOT NULL,
+                    clauses TEXT NOT NULL,
+                    UNIQUE (user_id, document_id)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sketch_values (
+                    user_id TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    document INTEGER NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sketch_values ON sketch_values (user_id, value)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sketch_values_document ON sketch_values (document)")
+            conn.commit()
+            self._connection = conn
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def add_document(self, user_id, document_id, text):
+        """Add or replace the entry of a contract from its (compacted) extracted text."""
+        values = sketch(text)
+        clauses = split_clauses(text)
+        with self._lock:
+            conn = self._conn
+            with conn:
+                self._remove(conn, user_id, document_id)
+                rowid = conn.execute(
+                    "INSERT INTO documents (user_id, document_id, sketch, clauses) VALUES (?, ?, ?, ?)",
+                    (user_id, document_id, json.dumps(values), json.dumps(clauses))
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO sketch_values (user_id, value, document) VALUES (?, ?, ?)",
+                    [(user_id, value, rowid) for value in values]
+                )
+
+    def remove_document(self, user_id, document_id):
+        with self._lock:
+            conn = self._conn
+            with conn:
+                self._remove(conn, user_id, document_id)
+
+    def _remove(self, conn, user_id, document_id):
+        row = conn.execute(
+            "SELECT rowid FROM documents WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+        ).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM sketch_values WHERE document = ?", (row[0],))
+            conn.execute("DELETE FROM documents WHERE rowid = ?", (row[0],))
+
+    def find_similar(self, user_id, text, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """
+        Find the user's earlier contract closest to a new text.
+
+        Returns:
+            None if no contract is at least `threshold` similar, otherwise a
+            dict with its "document_id", the estimated "similarity", the new
+            text's "clauses" and the earlier contract's "previous_clauses",
+            the "changed" clauses of the new text (those not in the earlier
+            contract) and the "removed" clauses of the earlier contract
+            (those not in the new text)
+        """
+        values = sketch(text)
+        if not values:
+            return None
+        placeholders = ", ".join("?" * len(values))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT d.document_id, d.sketch, d.clauses FROM documents d JOIN ("
+                f"  SELECT document, COUNT(*) AS shared FROM sketch_values"
+                f"  WHERE user_id = ? AND value IN ({placeholders}) GROUP BY document"
+                f"  ORDER BY shared DESC LIMIT ?"
+                f") s ON s.document = d.rowid",
+                [user_id, *values, CANDIDATES]
+            ).fetchall()
+
+        best = None
+        for document_id, stored_sketch, stored_clauses in rows:
+            similarity = estimate_similarity(values, json.loads(stored_sketch))
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (document_id, similarity, stored_clauses)
+        if best is None:
+            return None
+
+        document_id, similarity, stored_clauses = best
+        previous = json.loads(stored_clauses)
+        clauses = split_clauses(text)
+        previous_hashes, hashes = clause_hashes(previous), clause_hashes(clauses)
+        known, kept = set(previous_hashes), set(hashes)
+        changed = [clause for clause, digest in zip(clauses, hashes) if digest not in known]
+        removed = [clause for clause, digest in zip(previous, previous_hashes) if digest not in kept]
+        return {
+            "document_id": document_id,
+            "similarity": round(similarity, 4),
+            "clauses": clauses,
+            "previous_clauses": previous,
+            "changed": changed,
+            "removed": removed,
+        }
+
+    def stats(self):
+        with self._lock:
+            contracts, users = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM documents"
+            ).fetchone()
+        return {"contracts": contracts, "users": users}
+
+
+similarity_index = SimilarityIndex()
+
+
+def backfill(index=similarity_index):
+    """
+    Add every contract of the search index, which keeps the extracted text of
+    uploads, to the similarity index.
+
+    Returns:
+        Number of contracts indexed
+    """
+    from services.search_service import search_index
+    from services.compaction_service import compact_text
+    indexed = 0
+    for user_id, document_id, text in search_index.iter_texts():
+        if text:
+            index.add_document(user_id, document_id, compact_text(text)[0])
+            indexed += 1
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the near-duplicate contract index.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("backfill", help="Index every contract whose text is in the search index")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(f"Indexed {backfill()} contract(s) into {similarity_index.path}")
+
+
+if __name__ == '__main__':
+    main()
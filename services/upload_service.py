@@ -0,0 +1,216 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.extract_service import extract_data
+from services.gemini_service import gemini_call, gemini_call_amendment, ANALYSIS_VERSION
+from services.firebase_service import db
+from services.cache_service import content_cache, file_sha256
+from services.compaction_service import compact_text, COMPACTION_VERSION
+from services.job_service import UploadJobQueue
+from services.document_service import invalidate_user, get_document
+from services.search_service import search_index
+from services.similarity_service import similarity_index
+from services import analytics_service as analytics
+from services.metrics import stage, current_trace_id, BYTES, CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Files of one upload processed at the same time; Gemini requests are further
+# bounded and rate limited by the shared client
+UPLOAD_FILE_CONCURRENCY = int(os.environ.get('UPLOAD_FILE_CONCURRENCY', 10))
+
+# Cached analyses depend on both the prompt and the compaction of its input
+CACHE_ANALYSIS_VERSION = f"{ANALYSIS_VERSION}:{COMPACTION_VERSION}"
+
+# A near-duplicate with more than this share of its clauses changed is analyzed in full
+AMENDMENT_MAX_CHANGED = float(os.environ.get('AMENDMENT_MAX_CHANGED', 0.3))
+
+
+def extract_file_text(file_path, filename, digest):
+    """
+    Return the text of a file and whether it came from the content cache,
+    where it is looked up by the file's sha256 digest before the parser runs.
+    """
+    content = content_cache.get_text(digest)
+    cached = content is not None
+    CACHE_LOOKUPS.inc(kind="text", result="hit" if cached else "miss")
+    if content is None:
+        BYTES.inc(os.path.getsize(file_path), kind="upload")
+        with open(file_path, 'rb') as file:
+            content = extract_data(file, filename)
+        content_cache.put_text(digest, content)
+    BYTES.inc(len(content.encode('utf-8')), kind="extracted_text")
+    return content, cached
+
+
+def analyze_text(digest, compacted, user_id=None):
+    """
+    Return the analysis of a file's compacted text (None if it failed),
+    whether it came from the content cache, and the earlier contract of the
+    user it was derived from (None if it was analyzed on its own). Gemini is
+    only called when this exact file was not analyzed before, and only for
+    the changed sections of a new version of one of the user's contracts.
+    """
+    data = content_cache.get_analysis(digest, CACHE_ANALYSIS_VERSION)
+    cached = data is not None
+    CACHE_LOOKUPS.inc(kind="analysis", result="hit" if cached else "miss")
+    derived_from = None
+    if data is None:
+        if user_id:
+            data, derived_from = analyze_amendment(user_id, compacted)
+        if data is None:
+            data = gemini_call(compacted)
+            # A derived analysis depends on the user's earlier contract, so only
+            # analyses of the file on its own are shared through the cache
+            if data:
+                content_cache.put_analysis(digest, CACHE_ANALYSIS_VERSION, data)
+    return data, cached, derived_from
+
+
+def analyze_amendment(user_id, compacted):
+    """
+    Analyze a text that closely matches one of the user's contracts by
+    amending that contract's analysis with what the added, changed and
+    removed clauses mention.
+
+    Returns:
+        (data, derived_from), or (None, None) when no contract is close
+        enough or the re-extraction failed
+    """
+    with stage("upload", "amend") as span:
+        try:
+            match = similarity_index.find_similar(user_id, compacted)
+        except Exception as e:
+            logger.error(f"Near-duplicate lookup failed: {e}")
+            match = None
+        if match is None or (len(match["changed"]) + len(match["removed"]) >
+                             AMENDMENT_MAX_CHANGED * max(len(match["clauses"]), len(match["previous_clauses"]))):
+            span["matched"] = False
+            return None, None
+        span["matched"] = True
+        # Deleted since it was indexed
+        previous = get_document(user_id, match["document_id"])
+        if previous is None:
+            return None, None
+        data, sections = gemini_call_amendment(previous, match["clauses"], match["previous_clauses"],
+                                               match["changed"], match["removed"])
+        if data is None:
+            span["outcome"] = "error"
+            return None, None
+        logger.info(
+            f"Derived analysis from document {match['document_id']} ({match['similarity']:.0%} similar), "
+            f"amended {len(match['changed'])} changed and {len(match['removed'])} removed clause(s) "
+            f"for: {', '.join(sections) or 'nothing'}"
+        )
+        return data, {
+            "document_id": match["document_id"],
+            "similarity": match["similarity"],
+            "changed_clauses": len(match["changed"]),
+            "removed_clauses": len(match["removed"]),
+            "reanalyzed_sections": sections,
+        }
+
+
+def process_file(job_id, index, user_id, filename, file_path, digest=None):
+    """
+    Extract, analyze and save a single uploaded file as its own contract document.
+
+    Extracted text and analysis results are looked up in the content cache
+    first, so re-uploading the same file skips the parser and the LLM. The
+    digest is computed while the upload is saved; it is only recomputed here
+    when missing.
+
+    Each stage is timed into the upload metrics, as a span of one trace per file.
+
+    Returns:
+        The id of the new Firestore document, or None if analysis failed
+    """
+    with stage("upload", "file", job_id=job_id, filename=filename) as span:
+        upload_jobs.update_file(job_id, index, status="extracting", trace_id=current_trace_id())
+        with stage("upload", "extract") as extract_span:
+            digest = digest or file_sha256(file_path)
+            content, extract_span["cached"] = extract_file_text(file_path, filename, digest)
+
+            # Strip headers, footers, page numbers and repeated boilerplate before analysis
+            compacted, report = compact_text(content)
+        logger.info(
+            f"Compacted {filename}: {report['chars_before']} -> {report['chars_after']} chars, "
+            f"{report['tokens_before']} -> {report['tokens_after']} tokens"
+        )
+        upload_jobs.update_file(job_id, index, status="analyzing", compaction=report)
+        with stage("upload", "analyze") as analyze_span:
+            data, analyze_span["cached"], derived_from = analyze_text(digest, compacted, user_id)
+            if not data:
+                analyze_span["outcome"] = "error"
+
+        if not data:
+            span["outcome"] = "error"
+            upload_jobs.update_file(job_id, index, status="failed", error="Could not extract contract details.")
+            return None
+
+        upload_jobs.update_file(job_id, index, status="saving", derived_from=derived_from)
+        with stage("upload", "persist"):
+            # Save processed data to Firestore under user's documents subcollection
+            collection_path = f'users/{user_id}/documents'
+            from google.cloud.firestore import SERVER_TIMESTAMP
+            doc_ref = db.collection(collection_path).document()
+            batch = db.batch()
+            # updated_at is the watermark the notification sweep uses to find new contracts
+            batch.set(doc_ref, {
+                **data,
+                "file_name": filename,
+                **({"derived_from": derived_from} if derived_from else {}),
+                "updated_at": SERVER_TIMESTAMP
+            })
+            # The portfolio analytics are updated in the same commit as the document
+            analytics.add_to_batch(batch, user_id, data)
+            batch.commit()
+            invalidate_user(user_id)
+        try:
+            with stage("upload", "index"):
+                search_index.index_document(user_id, doc_ref.id, {**data, "file_name": filename}, content)
+                similarity_index.add_document(user_id, doc_ref.id, compacted)
+        except Exception as e:
+            # The contract is saved; it only stays out of search results or near-duplicate matching
+            logger.error(f"Could not index {filename}: {e}")
+        upload_jobs.update_file(job_id, index, status="done")
+        return doc_ref.id
+
+
+def process_upload(job_id):
+    """
+    Process every file of an upload job concurrently. Each file is analyzed on
+    its own and saved as a separate document. Progress is reported on the job
+    so the dashboard can poll it.
+    """
+    job = upload_jobs.get(job_id)
+    user_id = job["user_id"]
+    files = upload_jobs.files(job_id)
+
+    with ThreadPoolExecutor(max_workers=min(len(files), UPLOAD_FILE_CONCURRENCY)) as executor:
+        futures = {
+            executor.submit(process_file, job_id, index, user_id, filename, file_path, digest): (index, filename)
+            for index, (filename, file_path, digest) in enumerate(files)
+        }
+        for finished, future in enumerate(as_completed(futures), start=1):
+            index, filename = futures[future]
+            try:
+                document_id = future.result()
+                if document_id:
+                    upload_jobs.add_document(job_id, document_id)
+            except Exception as e:
+                logger.error(f"Error processing {filename}: {e}")
+                upload_jobs.update_file(job_id, index, status="failed", error=f"Error processing {filename}: {e}")
+            remove_upload(files[index][1])
+            upload_jobs.update(job_id, progress=int(100 * finished / len(files)))
+
+
+def remove_upload(file_path):
+    """Delete a processed upload; its text and analysis stay in the content cache."""
+    try:
+        os.remove(file_path)
+    except OSError as e:
+        logger.warning(f"Could not remove {file_path}: {e}")
+
+
+upload_jobs = UploadJobQueue(process_upload)
@@ -8,51 +8,71 @@
     const searchInput = document.getElementById("searchInput");
     const sortSelect = document.getElementById("sortSelect");
     const fieldSelect = document.getElementById("fieldSelect");
-
-    searchInput.addEventListener("input", filterAndSortCards);
+    const cardsContainer = document.getElementById("cards-container");
+    const loadMoreBtn = document.getElementById("load-more-btn");
+    const noDocuments = document.getElementById("no-documents");
+    const documentsUrl = cardsContainer.dataset.url;
+    const pageSize = cardsContainer.dataset.pageSize;
+    // Full details fetched for the modal, by document id
+    const detailsCache = new Map();
+    let nextCursor = null;
+    let currentDetails = null;
+
+    searchInput.addEventListener("input", scheduleSearch);
     sortSelect.addEventListener("change", filterAndSortCards);
-    fieldSelect.addEventListener("change", filterAndSortCards);
+    fieldSelect.addEventListener("change", scheduleSearch);
+
+    // Search runs on the server over every document, not only the loaded cards
+    const searchUrl = cardsContainer.dataset.searchUrl;
+    // Search parameter of each field option; "all" searches every field and the contract text
+    const searchFields = {
+        all: "q",
+        licensor: "licensor",
+        licensee: "licensee",
+        scope_of_use: "scope_of_use",
+        termination: "termination_grounds",
+        governing_law: "governing_law"
+    };
+    let searchTimer = null;
+    let searchRequest = 0;
+
+    function scheduleSearch() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(runSearch, 250);
+    }
+
+    function runSearch() {
+        const keyword = searchInput.value.trim();
+        const request = ++searchRequest;
+        cardsContainer.innerHTML = "";
+        if (!keyword) {
+            loadDocuments(null);
+            return;
+        }
+        loadMoreBtn.hidden = true;
+        const params = new URLSearchParams({ [searchFields[fieldSelect.value] || "q"]: keyword, limit: 100 });
+        fetch(`${searchUrl}?${params}`, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => {
+                if (!response.ok) throw new Error("Search failed");
+                return response.json();
+            })
+            .then(page => {
+                // A newer search started while this one was in flight
+                if (request !== searchRequest) return;
+                page.results.forEach(summary => cardsContainer.appendChild(createCard(summary)));
+                noDocuments.hidden = page.results.length > 0;
+                filterAndSortCards();
+            })
+            .catch(error => console.error("Error searching documents:", error));
+    }
 
     function filterAndSortCards() {
-        const keyword = searchInput.value.toLowerCase();
         const sortOption = sortSelect.value;
-        const selectedField = fieldSelect.value;
         const cards = Array.from(document.querySelectorAll(".card"));
+        // Results of a search are ranked by relevance on the server
+        if (searchInput.value.trim()) return;
 
-        cards.forEach(card => {
-            const data = JSON.parse(card.getAttribute("data-details"));
-            let contentToSearch = "";
-
-            if (selectedField === "all") {
-                contentToSearch = JSON.stringify(data).toLowerCase();
-            } else {
-                switch (selectedField) {
-                    case "licensor":
-                        contentToSearch = data.parties?.licensor?.toLowerCase() || "";
-                        break;
-                    case "licensee":
-                        contentToSearch = data.parties?.licensee?.toLowerCase() || "";
-                        break;
-                    case "scope_of_use":
-                        contentToSearch = (data.licensing_terms?.scope_of_use || []).join(" ").toLowerCase();
-                        break;
-                    case "termination":
-                        contentToSearch = (data.contract_termination?.termination_grounds || []).join(" ").toLowerCase();
-                        break;
-                    case "governing_law":
-                        contentToSearch = data.contract_termination?.dispute_resolution?.governing_law?.toLowerCase() || "";
-                        break;
-                    default:
-                        contentToSearch = "";
-                }
-            }
-
-            card.style.display = contentToSearch.includes(keyword) ? "block" : "none";
-        });
-
-        const visibleCards = cards.filter(card => card.style.display !== "none");
-
-        visibleCards.sort((a, b) => {
+        cards.sort((a, b) => {
             const dataA = JSON.parse(a.getAttribute("data-details"));
             const dataB = JSON.parse(b.getAttribute("data-details"));
 
@@ -70,10 +90,61 @@
             }
         });
 
-        const container = document.querySelector(".cards-container");
-        visibleCards.forEach(card => container.appendChild(card));
+        cards.forEach(card => cardsContainer.appendChild(card));
+    }
+
+    // Cards hold only the summary fields; full details are fetched when the modal opens
+    function createCard(summary) {
+        const card = document.createElement("div");
+        card.classList.add("card");
+        card.dataset.id = summary.id;
+        card.setAttribute("data-details", JSON.stringify(summary));
+
+        const title = document.createElement("h3");
+        title.innerText = "Parties";
+        card.appendChild(title);
+        [["Licensor", summary.parties?.licensor], ["Licensee", summary.parties?.licensee]].forEach(([label, value]) => {
+            const line = document.createElement("p");
+            const strong = document.createElement("strong");
+            strong.innerText = `${label}:`;
+            line.appendChild(strong);
+            line.appendChild(document.createTextNode(` ${value || "N/A"}`));
+            card.appendChild(line);
+        });
+
+        const button = document.createElement("button");
+        button.classList.add("view-details-btn");
+        button.innerText = "View Details";
+        card.appendChild(button);
+        return card;
+    }
+
+    function loadDocuments(cursor) {
+        const params = new URLSearchParams({ limit: pageSize });
+        if (cursor) params.set("cursor", cursor);
+        loadMoreBtn.disabled = true;
+
+        fetch(`${documentsUrl}?${params}`, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => {
+                if (!response.ok) throw new Error("Could not load documents");
+                return response.json();
+            })
+            .then(page => {
+                // Search results replaced the listing while this page was loading
+                if (searchInput.value.trim()) return;
+                page.documents.forEach(summary => cardsContainer.appendChild(createCard(summary)));
+                nextCursor = page.next_cursor;
+                loadMoreBtn.hidden = !nextCursor;
+                noDocuments.hidden = cardsContainer.children.length > 0;
+                filterAndSortCards();
+            })
+            .catch(error => console.error("Error loading documents:", error))
+            .finally(() => { loadMoreBtn.disabled = false; });
     }
 
+    loadMoreBtn.addEventListener("click", () => loadDocuments(nextCursor));
+    loadDocuments(null);
+
 
     // Prevent default drag behaviors on drop area and document
     ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
@@ -132,9 +203,8 @@
 
     // Export Modal Content as JSON
     exportJsonBtnModal.addEventListener('click', function () {
-        const cardElem = document.querySelector('.card[data-details]');
-        if (!cardElem) return;
-        const modalData = JSON.parse(cardElem.getAttribute('data-details'));
+        if (!currentDetails) return;
+        const modalData = currentDetails;
         const dataStr = JSON.stringify(modalData, null, 2);
         const blob = new Blob([dataStr], { type: "application/json" });
         const url = URL.createObjectURL(blob);
@@ -143,9 +213,8 @@
 
     // Export Modal Content as CSV
     exportCsvBtnModal.addEventListener('click', function () {
-        const cardElem = document.querySelector('.card[data-details]');
-        if (!cardElem) return;
-        const modalData = JSON.parse(cardElem.getAttribute('data-details'));
+        if (!currentDetails) return;
+        const modalData = currentDetails;
         let csvContent = "data:text/csv;charset=utf-8,";
         // Header row
         const header = ["Licensor", "Licensee", "Effective Date", "Term Duration", "Scope of Use", "License Fee", "Royalty Terms"];
@@ -175,9 +244,8 @@
             return;
         }
     
-        const cardElem = document.querySelector('.card[data-details]');
-        if (!cardElem) return;
-        const modalData = JSON.parse(cardElem.getAttribute('data-details'));
+        if (!currentDetails) return;
+        const modalData = currentDetails;
         const doc = new myJsPDF();
     
         let y = 10;
@@ -223,24 +291,36 @@
     
     
 
-    // Attach event listener for view-details buttons
-    const viewButtons = document.querySelectorAll('.view-details-btn');
-    console.log(`Found ${viewButtons.length} view-details buttons.`);
-    viewButtons.forEach(function (button) {
-        button.addEventListener('click', function () {
-            console.log("View details button clicked.");
-            const card = this.closest('.card');
-            try {
-                const detailsData = JSON.parse(card.getAttribute('data-details'));
+    // Cards are added dynamically, so view-details clicks are handled on the container
+    cardsContainer.addEventListener('click', function (event) {
+        const button = event.target.closest('.view-details-btn');
+        if (!button) return;
+        const documentId = button.closest('.card').dataset.id;
+        fetchDetails(documentId)
+            .then(detailsData => {
+                currentDetails = detailsData;
                 const modalBody = document.getElementById("modalBody");
                 modalBody.innerHTML = renderModalContent(detailsData);
                 document.getElementById("detailsModal").style.display = "block";
-            } catch (error) {
-                console.error("Error parsing card data:", error);
-            }
-        });
+            })
+            .catch(error => console.error("Error loading document details:", error));
     });
 
+    function fetchDetails(documentId) {
+        if (detailsCache.has(documentId)) {
+            return Promise.resolve(detailsCache.get(documentId));
+        }
+        return fetch(`${documentsUrl}/${encodeURIComponent(documentId)}`, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => {
+                if (!response.ok) throw new Error("Could not load document details");
+                return response.json();
+            })
+            .then(detailsData => {
+                detailsCache.set(documentId, detailsData);
+                return detailsData;
+            });
+    }
+
     // Modal close functionality
     const modal = document.getElementById("detailsModal");
     const closeBtn = document.querySelector(".close-btn");
@@ -251,6 +331,26 @@
         }
     });
 
+    // Delete the document shown in the modal
+    document.getElementById("modal-delete-btn").addEventListener('click', function () {
+        if (!currentDetails || !confirm("Delete this document? This cannot be undone.")) return;
+        const documentId = currentDetails.id;
+        fetch(`${documentsUrl}/${encodeURIComponent(documentId)}`, {
+            method: "DELETE",
+            headers: { "X-Requested-With": "XMLHttpRequest" }
+        })
+            .then(response => {
+                if (!response.ok) throw new Error("Could not delete document");
+                detailsCache.delete(documentId);
+                const card = cardsContainer.querySelector(`.card[data-id="${CSS.escape(documentId)}"]`);
+                if (card) card.remove();
+                noDocuments.hidden = cardsContainer.children.length > 0;
+                currentDetails = null;
+                modal.style.display = "none";
+            })
+            .catch(error => console.error("Error deleting document:", error));
+    });
+
     // Helper function to render modal content from data
     function renderModalContent(data) {
         let html = `<h2>Document Details</h2>`;
@@ -308,13 +408,14 @@
     }
     /*this is progress bar and uploading docx*/
     const uploadedFilesContainer = document.getElementById("uploaded-files-container");
+    const uploadForm = document.getElementById("drop-area");
 
     fileInput.addEventListener("change", function () {
+        uploadedFilesContainer.innerHTML = "";
         const files = fileInput.files;
         for (let file of files) {
             console.log(file);
             addFileCard(file);
-            simulateUploadProgress(file.name);
         }
     });
 
@@ -344,18 +445,83 @@
         uploadedFilesContainer.appendChild(fileCard);
     }
 
-    function simulateUploadProgress(fileName) {
-        const progressBar = [...document.querySelectorAll(".file-card p")].find(el => el.innerText === fileName).nextElementSibling;
-        const progressFill = progressBar.querySelector(".progress-fill");
-        let progress = 0;
+    // Progress of each file as reported by the upload job
+    const fileStatusProgress = {
+        queued: 10,
+        extracting: 30,
+        extracted: 50,
+        analyzing: 75,
+        saving: 90,
+        done: 100,
+        failed: 100
+    };
+
+    function setFileProgress(fileName, status, error) {
+        const label = [...document.querySelectorAll(".file-card p")].find(el => el.innerText === fileName);
+        if (!label) return;
+        const progressFill = label.nextElementSibling.querySelector(".progress-fill");
+        progressFill.style.width = (fileStatusProgress[status] || 0) + "%";
+        if (status === "failed") {
+            progressFill.style.backgroundColor = "#d9534f";
+            label.title = error || "Processing failed";
+        }
+    }
 
-        const interval = setInterval(() => {
-            progress += 10;
-            progressFill.style.width = progress + "%";
-            if (progress >= 100) {
-                clearInterval(interval);
-            }
-        }, 300);
+    // Submit the upload in the background and poll the job until it finishes
+    uploadForm.addEventListener("submit", function (e) {
+        e.preventDefault();
+        if (!fileInput.files.length) return;
+
+        const formData = new FormData();
+        for (let file of fileInput.files) {
+            formData.append("file", file);
+        }
+        uploadBtn.disabled = true;
+
+        fetch(uploadForm.action, {
+            method: "POST",
+            body: formData,
+            headers: { "X-Requested-With": "XMLHttpRequest" }
+        })
+            .then(response => response.json().then(body => ({ ok: response.ok, body })))
+            .then(({ ok, body }) => {
+                if (!ok) throw new Error(body.message || "Upload failed");
+                pollJobStatus(body.status_url);
+            })
+            .catch(error => {
+                console.error("Upload failed:", error);
+                alert(error.message);
+                uploadBtn.disabled = false;
+            });
+    });
+
+    function pollJobStatus(statusUrl) {
+        fetch(statusUrl, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => response.json()
+                .catch(() => ({}))
+                .then(body => ({ ok: response.ok, body })))
+            .then(({ ok, body }) => {
+                if (!ok) {
+                    // The job is unknown or the session expired, polling again will not help
+                    alert(body.message || "Could not get the upload status.");
+                    uploadBtn.disabled = false;
+                    return;
+                }
+                const job = body;
+                job.files.forEach(file => setFileProgress(file.filename, file.status, file.error));
+                if (job.status === "completed" || job.status === "failed") {
+                    if (job.status === "failed") {
+                        alert(job.error || "Processing failed");
+                    }
+                    window.location.reload();
+                    return;
+                }
+                setTimeout(() => pollJobStatus(statusUrl), 1000);
+            })
+            .catch(error => {
+                console.error("Error polling upload job:", error);
+                setTimeout(() => pollJobStatus(statusUrl), 3000);
+            });
     }
 
     function getFileIcon(filename) {
@@ -0,0 +1,30 @@
+import csv
+import io
+
+from services.export_service import export_csv
+
+
+def export_rows(data):
+    lines = "".join(export_csv([("user1", "doc1", data)]))
+    return list(csv.DictReader(io.StringIO(lines)))
+
+
+def test_csv_cells_starting_with_formula_characters_are_escaped():
+    [row] = export_rows({
+        "file_name": "=HYPERLINK(\"http://example.com\",\"open\")",
+        "parties": {"licensor": "+1 555 0100", "licensee": "@SUM(A1:A2)"},
+        "financial_terms": {"license_fee": "-$500", "royalty_terms": "\tNet 30"},
+        "usage_restrictions": {"prohibited_uses": ["=cmd|' /C calc'!A0", "Resale"]},
+    })
+    assert row["file_name"] == "'=HYPERLINK(\"http://example.com\",\"open\")"
+    assert row["parties.licensor"] == "'+1 555 0100"
+    assert row["parties.licensee"] == "'@SUM(A1:A2)"
+    assert row["financial_terms.license_fee"] == "'-$500"
+    assert row["financial_terms.royalty_terms"] == "'\tNet 30"
+    assert row["usage_restrictions.prohibited_uses"] == "'=cmd|' /C calc'!A0 | Resale"
+
+
+def test_csv_plain_cells_are_unchanged():
+    [row] = export_rows({"file_name": "license.pdf", "parties": {"licensor": "Acme Corp"}})
+    assert row["file_name"] == "license.pdf"
+    assert row["parties.licensor"] == "Acme Corp"
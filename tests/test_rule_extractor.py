@@ -0,0 +1,32 @@
+from services.rule_extractor import covers_required, extract_rule_fields
+
+GOVERNING_LAW = ("contract_termination", "dispute_resolution", "governing_law")
+
+
+def governing_law(text):
+    field = extract_rule_fields(text).get(GOVERNING_LAW)
+    return field["value"] if field else None
+
+
+def test_governing_law_stops_at_trailing_clause():
+    text = ("This Agreement shall be governed by the laws of California and any dispute "
+            "shall be resolved in San Francisco.")
+    assert governing_law(text) == "California"
+
+
+def test_governing_law_stops_at_comma():
+    text = ("This Agreement is governed by and construed in accordance with the laws of "
+            "the State of New York, without regard to its conflict of laws principles.")
+    assert governing_law(text) == "State of New York"
+
+
+def test_governing_law_prefix_is_case_insensitive():
+    assert governing_law("GOVERNED BY THE LAWS OF England and Wales.") == "England"
+    assert governing_law("Governing Law: the laws of the State of Delaware.") == "State of Delaware"
+
+
+def test_covers_required_needs_an_explicit_field_set():
+    fields = {("parties", "licensor"): {"value": "Acme Corp", "confidence": 0.9}}
+    assert not covers_required(fields, required=[])
+    assert covers_required(fields, required=[("parties", "licensor")])
+    assert not covers_required(fields, required=[("parties", "licensor"), ("parties", "licensee")])